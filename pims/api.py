@@ -5,7 +5,7 @@ from slicerator import pipeline
 from pims.base_frames import FramesSequence, FramesSequenceND
 from pims.frame import Frame
 from pims.display import (export, play, scrollable_stack, to_rgb, normalize,
-                          plot_to_frame, plots_to_frame)
+                          intensity_range, plot_to_frame, plots_to_frame)
 from itertools import chain
 
 import six
@@ -76,11 +76,12 @@ if Video is None:
 
 import pims.tiff_stack
 from pims.tiff_stack import (TiffStack_pil, TiffStack_libtiff,
-                                TiffStack_tifffile)
+                                TiffStack_tifffile, TiffStackND)
 # First, check if each individual class is available
 # and drop in placeholders as needed.
 if not pims.tiff_stack.tifffile_available():
     TiffStack_tiffile = not_available("tifffile")
+    TiffStackND = not_available("tifffile")
 if not pims.tiff_stack.libtiff_available():
     TiffStack_libtiff = not_available("libtiff")
 if not pims.tiff_stack.PIL_available():
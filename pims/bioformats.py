@@ -6,7 +6,14 @@ import numpy as np
 from pims.base_frames import FramesSequence, FramesSequenceND
 from pims.frame import Frame
 from warnings import warn
+from functools import partial
+import itertools
+import hashlib
+import shutil
+import tempfile
+import threading
 import os
+from six.moves import queue
 
 try:
     import jpype
@@ -75,6 +82,27 @@ def _find_jar(url=None):
     return os.path.join(loc, 'loci_tools.jar')
 
 
+def _memo_directory(cache_dir, filename):
+    """Returns the directory in which Bio-Formats stores the reader state of
+    `filename`. The directory depends on the size and modification time of
+    the file; directories of previous versions of the file are removed."""
+    path = os.path.abspath(filename)
+    stat = os.stat(path)
+    file_dir = os.path.join(cache_dir, '{0}_{1}'.format(
+        hashlib.md5(path.encode('utf-8')).hexdigest()[:16],
+        os.path.basename(path)))
+    version = '{0}_{1}'.format(stat.st_size, int(stat.st_mtime))
+    if os.path.isdir(file_dir):
+        for name in os.listdir(file_dir):
+            if name != version:
+                shutil.rmtree(os.path.join(file_dir, name),
+                              ignore_errors=True)
+    memo_dir = os.path.join(file_dir, version)
+    if not os.path.isdir(memo_dir):
+        os.makedirs(memo_dir)
+    return memo_dir
+
+
 def _maybe_tostring(field):
     if hasattr(field, 'toString'):
         return field.toString()
@@ -206,6 +234,23 @@ class BioformatsReader(FramesSequenceND):
     series: int, optional
         Active image series index, defaults to 0. Changeable via the `series`
         property.
+    resolution: int, optional
+        Active resolution level of a resolution pyramid. 0 is the full
+        resolution. Defaults to 0. Changeable via the `resolution` property.
+    region: tuple of int, optional
+        Rectangle (x, y, width, height) of the planes that is read, in pixels
+        of the active resolution level. Defaults to None, reading whole
+        planes. Changeable via the `region` property.
+    cache_dir : str, optional
+        When given, the initialized reader is stored in this directory
+        (using loci.formats.Memoizer), so that opening the same file again
+        does not require parsing it. The stored reader is discarded when the
+        size or modification time of the file changes. Default None.
+    reader_pool_size : int, optional
+        Maximum number of java readers that are opened on the file, so that
+        get_frame can be called from this many threads in parallel. Extra
+        readers are opened when needed, from the reader state stored in
+        `cache_dir` (or in a temporary directory). Default 1.
 
     Attributes
     ----------
@@ -217,6 +262,8 @@ class BioformatsReader(FramesSequenceND):
         Dictionary with all axis sizes
     size_series : int
         Number of series inside file
+    size_resolution : int
+        Number of resolution levels of the active series
     frame_shape : tuple of int
         Shape of frames that will be returned by get_frame
     iter_axes : iterable of strings
@@ -238,8 +285,19 @@ class BioformatsReader(FramesSequenceND):
         Frame.metadata field obtained by get_frame. This will only work if
         meta=True. Only MetadataRetrieve methods with signature (series, plane)
         will be accepted.
+    plane_metadata : dict of numpy arrays
+        The fields in `frame_metadata` for all planes of the active series,
+        indexed by plane. The values are read once per series.
     series : int
-        active series that is read by get_frame. Writeable.
+        active series that is read by get_frame. Writeable. Changing it
+        resets `resolution` and `region`.
+    resolution : int
+        active resolution level that is read by get_frame. Writeable. Changing
+        it resets `region`.
+    region : tuple of int or None
+        rectangle (x, y, width, height) of the planes that is read by
+        get_frame. The sizes of the 'x' and 'y' axes are the width and height
+        of the region. Writeable; None reads the whole planes.
     pixel_type : numpy.dtype
         numpy datatype of pixels
     java_log : string
@@ -254,7 +312,8 @@ class BioformatsReader(FramesSequenceND):
         The rgb values of all active channels set by the channels property. If
         not supported by the underlying reader, this returns None
     calibration : float
-        The pixel size in microns per pixel, in x/y direction
+        The pixel size in microns per pixel, in x/y direction, at the active
+        resolution level
     calibrationZ : float
         The pixel size in microns per pixel, in z direction
     reader_class_name : string
@@ -313,7 +372,8 @@ class BioformatsReader(FramesSequenceND):
         return self._pixel_type
 
     def __init__(self, filename, meta=True, java_memory='512m',
-                 read_mode='auto', series=0):
+                 read_mode='auto', series=0, cache_dir=None, resolution=0,
+                 region=None, reader_pool_size=1):
         global loci
         super(BioformatsReader, self).__init__()
 
@@ -342,12 +402,22 @@ class BioformatsReader(FramesSequenceND):
 
         # Initialize reader and metadata
         self.filename = str(filename)
-        self.rdr = loci.formats.ChannelSeparator(loci.formats.ChannelFiller())
+        self._tmp_cache_dir = None
+        if cache_dir is None and reader_pool_size > 1:
+            # pooled readers are restored from the state of the first one
+            cache_dir = self._tmp_cache_dir = tempfile.mkdtemp()
+        if cache_dir is None:
+            self._memo_dir = None
+        else:
+            self._memo_dir = _memo_directory(cache_dir, self.filename)
         if meta:
             self._metadata = loci.formats.MetadataTools.createOMEXMLMetadata()
-            self.rdr.setMetadataStore(self._metadata)
-        self.rdr.setId(self.filename)
+            self.rdr = self._create_reader(self._metadata)
+        else:
+            self.rdr = self._create_reader()
         if meta:
+            # a reader restored by the Memoizer has its own metadata store
+            self._metadata = self.rdr.getMetadataStore()
             self.metadata = MetadataRetrieve(self._metadata)
 
         # Checkout reader dtype and define read mode
@@ -369,17 +439,40 @@ class BioformatsReader(FramesSequenceND):
                  FormatTools.isFloatingPoint(loci_format),
                  isLittleEndian)
 
+        # Define the names of the standard per frame metadata.
+        self.frame_metadata = {}
+        if meta:
+            if hasattr(self.metadata, 'PlaneDeltaT'):
+                self.frame_metadata['t_s'] = 'PlaneDeltaT'
+            if hasattr(self.metadata, 'PlanePositionX'):
+                self.frame_metadata['x_um'] = 'PlanePositionX'
+            if hasattr(self.metadata, 'PlanePositionY'):
+                self.frame_metadata['y_um'] = 'PlanePositionY'
+            if hasattr(self.metadata, 'PlanePositionZ'):
+                self.frame_metadata['z_um'] = 'PlanePositionZ'
+
         # Set the correct series and initialize the sizes
         self.size_series = self.rdr.getSeriesCount()
         if series >= self.size_series or series < 0:
             self.rdr.close()
             raise IndexError('Series index out of bounds.')
         self._series = series
+        self._plane_metadata = dict()
+        # pool of [reader, series, resolution, buffer] lists
+        self._reader_pool = queue.Queue()
+        self._reader_pool.put([self.rdr, None, None, None])
+        self._reader_pool_size = reader_pool_size
+        self._reader_count = 1
+        self._reader_lock = threading.Lock()
+        self._resolution = 0
+        self._region = None
         self._change_series()
+        self.resolution = resolution
+        self.region = region
 
-        # Set read mode. When auto, tryout fast and check the image size.
+        # Set read mode. When auto, tryout fast on a single pixel.
         if read_mode == 'auto':
-            Jarr = self.rdr.openBytes(0)
+            Jarr = self.rdr.openBytes(0, 0, 0, 1, 1)
             if isinstance(Jarr[:], np.ndarray):
                 read_mode = 'jpype'
             else:
@@ -394,26 +487,22 @@ class BioformatsReader(FramesSequenceND):
                     read_mode = 'stringbuffer'
         self.read_mode = read_mode
 
-        # Define the names of the standard per frame metadata.
-        self.frame_metadata = {}
-        if meta:
-            if hasattr(self.metadata, 'PlaneDeltaT'):
-                self.frame_metadata['t_s'] = 'PlaneDeltaT'
-            if hasattr(self.metadata, 'PlanePositionX'):
-                self.frame_metadata['x_um'] = 'PlanePositionX'
-            if hasattr(self.metadata, 'PlanePositionY'):
-                self.frame_metadata['y_um'] = 'PlanePositionY'
-            if hasattr(self.metadata, 'PlanePositionZ'):
-                self.frame_metadata['z_um'] = 'PlanePositionZ'
 
     def _change_series(self):
         """Changes series and rereads axes, sizes and metadata.
         """
         series = self._series
         self._clear_axes()
+        self._get_frame_dict = dict()
         self.rdr.setSeries(series)
-        sizeX = self.rdr.getSizeX()
-        sizeY = self.rdr.getSizeY()
+        self.size_resolution = self.rdr.getResolutionCount()
+        full_sizeX = self.rdr.getSizeX()
+        self.rdr.setResolution(self._resolution)
+        if self._region is None:
+            sizeX = self.rdr.getSizeX()
+            sizeY = self.rdr.getSizeY()
+        else:
+            sizeX, sizeY = self._region[2:]
         sizeT = self.rdr.getSizeT()
         sizeZ = self.rdr.getSizeZ()
         self.isRGB = self.rdr.isRGB()
@@ -422,14 +511,15 @@ class BioformatsReader(FramesSequenceND):
             sizeC = self.rdr.getRGBChannelCount()
             if self.isInterleaved:
                 self._frame_shape_2D = (sizeY, sizeX, sizeC)
-                self._register_get_frame(self.get_frame_2D, 'yxc')
+                plane_axes = ['y', 'x', 'c']
             else:
                 self._frame_shape_2D = (sizeC, sizeY, sizeX)
-                self._register_get_frame(self.get_frame_2D, 'cyx')
+                plane_axes = ['c', 'y', 'x']
         else:
             sizeC = self.rdr.getSizeC()
             self._frame_shape_2D = (sizeY, sizeX)
-            self._register_get_frame(self.get_frame_2D, 'yx')
+            plane_axes = ['y', 'x']
+        self._register_get_frame(self.get_frame_2D, plane_axes)
 
         self._init_axis('x', sizeX)
         self._init_axis('y', sizeY)
@@ -440,6 +530,14 @@ class BioformatsReader(FramesSequenceND):
         if sizeZ > 1:
             self._init_axis('z', sizeZ)
 
+        # register readers that read stacks of planes at once
+        for bulk_axes in (['z'], ['c'], ['c', 'z']):
+            if any(ax not in self.axes or ax in plane_axes
+                   for ax in bulk_axes):
+                continue
+            self._register_get_frame(partial(self.get_frame_bulk, bulk_axes),
+                                     bulk_axes + plane_axes)
+
         # determine pixel type
         pixel_type = self.rdr.getPixelType()
         dtype = self._dtype_dict[pixel_type]
@@ -469,13 +567,76 @@ class BioformatsReader(FramesSequenceND):
                 self.calibration = self.metadata.PixelsPhysicalSizeY(series)
             except:
                 self.calibration = None
+        if self.calibration is not None and self._resolution != 0:
+            self.calibration *= full_sizeX / self.rdr.getSizeX()
         try:
             self.calibrationZ = self.metadata.PixelsPhysicalSizeZ(series)
         except AttributeError:
             self.calibrationZ = None
 
+        # fetch the per plane metadata of all planes at once
+        for method in self.frame_metadata.values():
+            self._plane_metadata_array(method)
+
     def close(self):
+        while True:
+            try:
+                rdr = self._reader_pool.get(block=False)[0]
+            except queue.Empty:
+                break
+            if rdr is not self.rdr:
+                rdr.close()
         self.rdr.close()
+        if self._tmp_cache_dir is not None:
+            shutil.rmtree(self._tmp_cache_dir, ignore_errors=True)
+            self._tmp_cache_dir = None
+
+    def _create_reader(self, metadata_store=None):
+        """Opens a java reader on the file, restoring its state from the
+        memo directory if there is one."""
+        rdr = loci.formats.ChannelSeparator(loci.formats.ChannelFiller())
+        if self._memo_dir is not None:
+            rdr = loci.formats.Memoizer(rdr, 0,
+                                        jpype.java.io.File(self._memo_dir))
+        # expose resolution pyramids as levels instead of as series
+        rdr.setFlattenedResolutions(False)
+        if metadata_store is not None:
+            rdr.setMetadataStore(metadata_store)
+        rdr.setId(self.filename)
+        return rdr
+
+    def _acquire_reader(self):
+        """Takes a reader from the pool, in the active series and resolution.
+        A new reader is opened when all readers are in use and the pool is not
+        full. The calling thread is attached to the JVM if necessary."""
+        if not jpype.isThreadAttachedToJVM():
+            jpype.attachThreadToJVM()
+        try:
+            entry = self._reader_pool.get(block=False)
+        except queue.Empty:
+            with self._reader_lock:
+                create = self._reader_count < self._reader_pool_size
+                if create:
+                    self._reader_count += 1
+            if not create:
+                entry = self._reader_pool.get()
+            else:
+                try:
+                    entry = [self._create_reader(), None, None, None]
+                except Exception:
+                    with self._reader_lock:
+                        self._reader_count -= 1
+                    raise
+        rdr = entry[0]
+        if rdr is not self.rdr and entry[1:3] != [self._series,
+                                                  self._resolution]:
+            rdr.setSeries(self._series)
+            rdr.setResolution(self._resolution)
+            entry[1:3] = [self._series, self._resolution]
+        return entry
+
+    def _release_reader(self, entry):
+        self._reader_pool.put(entry)
 
     @property
     def series(self):
@@ -488,31 +649,152 @@ class BioformatsReader(FramesSequenceND):
         else:
             if value != self._series:
                 self._series = value
+                self._resolution = 0
+                self._region = None
                 self._change_series()
 
-    def get_frame_2D(self, **coords):
-        """Actual reader, returns image as 2D numpy array and metadata as
-        dict.
-        """
-        _coords = {'t': 0, 'c': 0, 'z': 0}
-        _coords.update(coords)
-        if self.isRGB:
-            _coords['c'] = 0
-        j = self.rdr.getIndex(int(_coords['z']), int(_coords['c']),
-                              int(_coords['t']))
+    @property
+    def resolution(self):
+        return self._resolution
+
+    @resolution.setter
+    def resolution(self, value):
+        if value >= self.size_resolution or value < 0:
+            raise IndexError('Resolution level out of bounds.')
+        if value != self._resolution:
+            self._resolution = value
+            self._region = None
+            self._change_plane_shape()
+
+    @property
+    def region(self):
+        return self._region
+
+    @region.setter
+    def region(self, value):
+        if value is not None:
+            value = tuple(int(v) for v in value)
+            if len(value) != 4:
+                raise ValueError('The region should be given as '
+                                 '(x, y, width, height).')
+            x, y, w, h = value
+            if (x < 0 or y < 0 or w < 1 or h < 1 or
+                    x + w > self.rdr.getSizeX() or
+                    y + h > self.rdr.getSizeY()):
+                raise ValueError('The region is outside of the planes.')
+        if value != self._region:
+            self._region = value
+            self._change_plane_shape()
+
+    def _change_plane_shape(self):
+        """Rereads the sizes after a change of resolution or region, keeping
+        the axes settings."""
+        bundle_axes = self.bundle_axes
+        iter_axes = self.iter_axes
+        default_coords = dict(self.default_coords)
+        self._change_series()
+        self.bundle_axes = bundle_axes
+        self.iter_axes = iter_axes
+        self.default_coords.update(default_coords)
+
+    def _open_bytes(self, rdr, j, buf=None):
+        """Reads plane j (of the active region) with java reader `rdr`."""
+        args = (j,) if buf is None else (j, buf)
+        if self._region is not None:
+            args += self._region
+        return rdr.openBytes(*args)
+
+    def _read_plane(self, rdr, j):
+        """Reads plane j with java reader `rdr` as a numpy array of shape
+        _frame_shape_2D."""
         if self.read_mode == 'jpype':
-            im = np.frombuffer(self.rdr.openBytes(j)[:],
+            im = np.frombuffer(self._open_bytes(rdr, j)[:],
                                dtype=self._pixel_type)
         elif self.read_mode == 'stringbuffer':
-            im = self._jbytearr_stringbuffer(self.rdr.openBytes(j))
+            im = self._jbytearr_stringbuffer(self._open_bytes(rdr, j))
         elif self.read_mode == 'javacasting':
-            im = self._jbytearr_javacasting(self.rdr.openBytes(j))
+            im = self._jbytearr_javacasting(self._open_bytes(rdr, j))
 
         im.shape = self._frame_shape_2D
-        im = im.astype(self._pixel_type, copy=False)
+        return im.astype(self._pixel_type, copy=False)
+
+    def _read_planes(self, planes, out):
+        """Reads planes into `out`, an array of shape
+        (len(planes),) + _frame_shape_2D.
+
+        When possible, java copies each plane directly into the memory of
+        `out`, through a direct ByteBuffer that wraps it. In this way the
+        planes are not converted to python objects."""
+        entry = self._acquire_reader()
+        try:
+            rdr = entry[0]
+            direct = None
+            if self.read_mode == 'jpype':
+                try:
+                    direct = jpype.nio.convertToDirectBuffer(out)
+                except Exception:  # not supported by this JPype version
+                    direct = None
+            if direct is None:
+                for i, j in enumerate(planes):
+                    out[i] = self._read_plane(rdr, int(j))
+                return out
+
+            # each pooled reader has its own java buffer
+            n_bytes = int(np.prod(self._frame_shape_2D)) * out.dtype.itemsize
+            if entry[3] is None or len(entry[3]) != n_bytes:
+                entry[3] = jpype.JArray(jpype.JByte)(n_bytes)
+            for j in planes:
+                self._open_bytes(rdr, int(j), entry[3])
+                direct.put(entry[3])
+            return out
+        finally:
+            self._release_reader(entry)
+
+    def _plane_metadata_array(self, method):
+        """Returns the values of MetadataRetrieve method `method` for all
+        planes in the current series, as a numpy array indexed by plane.
+        The values are fetched once per series; missing values are NaN."""
+        try:
+            return self._plane_metadata[self._series, method]
+        except KeyError:
+            pass
+        n_planes = self.rdr.getImageCount()
+        if hasattr(self.metadata, 'PlaneCount'):
+            n_planes = min(n_planes, self.metadata.PlaneCount(self._series))
+        fn = getattr(self.metadata, method)
+        values = [np.nan] * self.rdr.getImageCount()
+        for j in range(n_planes):
+            try:
+                value = fn(self._series, j)
+            except Exception:  # the field is not set for this plane
+                continue
+            if value is not None:
+                values[j] = value
+        try:
+            values = np.array(values, dtype=np.float64)
+        except (TypeError, ValueError):
+            values = np.array(values, dtype=object)
+        self._plane_metadata[self._series, method] = values
+        return values
 
-        metadata = {'frame': j,
-                    'series': self._series}
+    @property
+    def plane_metadata(self):
+        """Dictionary of the fields in `frame_metadata`, each as a numpy array
+        with the values of all planes in the current series. The arrays are
+        indexed by the plane index, which is given by the 'frame' field in
+        the metadata of a Frame."""
+        return {key: self._plane_metadata_array(method)
+                for key, method in self.frame_metadata.items()}
+
+    def _frame_metadata(self, j, coords):
+        metadata = self._series_metadata(coords)
+        metadata['frame'] = j
+        for key, method in self.frame_metadata.items():
+            metadata[key] = self._plane_metadata_array(method).item(j)
+        return metadata
+
+    def _series_metadata(self, coords):
+        metadata = {'series': self._series}
         if self.colors is not None:
             metadata['colors'] = self.colors
         if self.calibration is not None:
@@ -520,10 +802,50 @@ class BioformatsReader(FramesSequenceND):
         if self.calibrationZ is not None:
             metadata['mppZ'] = self.calibrationZ
         metadata.update(coords)
-        for key, method in self.frame_metadata.items():
-            metadata[key] = getattr(self.metadata, method)(self._series, j)
+        return metadata
+
+    def _plane_index(self, coords):
+        _coords = {'t': 0, 'c': 0, 'z': 0}
+        _coords.update(coords)
+        if self.isRGB:
+            _coords['c'] = 0
+        return self.rdr.getIndex(int(_coords['z']), int(_coords['c']),
+                                 int(_coords['t']))
 
-        return Frame(im, metadata=metadata)
+    def get_frame_2D(self, **coords):
+        """Actual reader, returns image as 2D numpy array and metadata as
+        dict.
+        """
+        j = self._plane_index(coords)
+        entry = self._acquire_reader()
+        try:
+            im = self._read_plane(entry[0], j)
+        finally:
+            self._release_reader(entry)
+        return Frame(im, metadata=self._frame_metadata(j, coords))
+
+    def get_frame_bulk(self, axes, **coords):
+        """Reads all planes along `axes` (a list of 'c' and/or 'z') at
+        once. Returns the planes as a numpy array with axes `axes`, followed
+        by the axes of a plane. Per-plane metadata fields are arrays."""
+        iter_shape = tuple(self.sizes[ax] for ax in axes)
+        planes = np.empty(iter_shape, dtype=np.intp)
+        for indices in itertools.product(*[range(s) for s in iter_shape]):
+            coords.update(zip(axes, indices))
+            planes[indices] = self._plane_index(coords)
+        for ax in axes:
+            coords.pop(ax, None)
+
+        result = np.empty(iter_shape + self._frame_shape_2D,
+                          dtype=self._pixel_type)
+        self._read_planes(planes.ravel(),
+                          result.reshape((-1,) + self._frame_shape_2D))
+
+        metadata = self._series_metadata(coords)
+        metadata['frame'] = planes
+        for key, method in self.frame_metadata.items():
+            metadata[key] = self._plane_metadata_array(method)[planes]
+        return Frame(result, metadata=metadata)
 
     def get_metadata_raw(self, form='dict'):
         hashtable = self.rdr.getGlobalMetadata()
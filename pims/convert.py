@@ -0,0 +1,386 @@
+"""Converts readers into a directory that is fast to read in any order.
+
+Many formats are slow to access at random: frames of a video are decoded
+from the preceding keyframe, and compressed or zipped images are
+decompressed on every read. ``convert`` reads a reader once, in parallel,
+and writes its frames into a numpy file, which ``ConvertedFrames``
+memory-maps. The directory contains:
+
+frames.npy
+    All frames in one array, with the iteration axes of the reader first.
+metadata.json
+    The axes, shape and dtype of the frames, the metadata of the reader, and
+    a crc32 checksum of every chunk of frames. Chunks without a checksum have
+    not been written yet: an interrupted conversion continues from there.
+
+Convert from the command line with::
+
+    python -m pims.convert source destination [--workers 4]
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import io
+import json
+import zlib
+import threading
+from functools import partial
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+import six
+
+import pims
+from pims.base_frames import FramesSequenceND
+
+FRAMES_FILE = 'frames.npy'
+METADATA_FILE = 'metadata.json'
+FORMAT_VERSION = 1
+CHUNK_BYTES = 2**26  # default size of a chunk of frames
+
+
+def _jsonable(metadata):
+    """Returns the items of dict `metadata` that can be stored as JSON."""
+    result = dict()
+    for key, value in metadata.items():
+        try:
+            json.dumps(value)
+        except (TypeError, ValueError):
+            continue
+        result[six.text_type(key)] = value
+    return result
+
+
+def _open_source(source, reader=None, bundle_axes=None, iter_axes=None,
+                 kwargs=None):
+    """Opens filename `source` with `reader` (by default, pims.open), and
+    sets the axes of N-dimensional readers."""
+    if isinstance(source, six.string_types):
+        source = (pims.open if reader is None else reader)(source,
+                                                           **(kwargs or {}))
+    if bundle_axes is not None:
+        source.bundle_axes = bundle_axes
+    if iter_axes is not None:
+        source.iter_axes = iter_axes
+    return source
+
+
+def _layout(frames, chunk_size=None):
+    """Returns the metadata that describes the conversion of `frames`, with
+    no chunks written yet."""
+    first = np.asarray(frames[0])
+    if isinstance(frames, FramesSequenceND):
+        iter_axes = list(frames.iter_axes)
+        frame_axes = list(frames.bundle_axes)
+        iter_shape = [frames.sizes[ax] for ax in iter_axes]
+    else:
+        iter_axes = ['t']
+        if first.ndim == 2:
+            frame_axes = ['y', 'x']
+        elif first.ndim <= 4:
+            frame_axes = list('zyxc'[-first.ndim:])
+        else:
+            raise ValueError("Frames with {0} dimensions cannot be "
+                             "converted".format(first.ndim))
+        iter_shape = [len(frames)]
+    if chunk_size is None:
+        chunk_size = max(CHUNK_BYTES // max(first.nbytes, 1), 1)
+    n_frames = int(np.prod(iter_shape))
+    n_chunks = -(-n_frames // chunk_size)
+    return dict(version=FORMAT_VERSION,
+                reader=type(frames).__name__,
+                axes=iter_axes + frame_axes,
+                frame_axes=frame_axes,
+                shape=iter_shape + list(first.shape),
+                dtype=first.dtype.str,
+                chunk_size=int(chunk_size),
+                checksums=[None] * n_chunks,
+                metadata=_jsonable(getattr(frames, 'metadata', None) or {}))
+
+
+def read_metadata(path):
+    """Returns the metadata of the conversion in directory `path`, or None
+    if there is none."""
+    try:
+        with io.open(os.path.join(path, METADATA_FILE), 'r',
+                     encoding='utf-8') as f:
+            return json.load(f)
+    except (IOError, OSError):
+        return None
+
+
+def _write_metadata(path, metadata):
+    """Replaces the metadata file at once, so that it is never partially
+    written."""
+    filename = os.path.join(path, METADATA_FILE)
+    with io.open(filename + '.tmp', 'w', encoding='utf-8') as f:
+        f.write(six.text_type(json.dumps(metadata, indent=1)))
+    getattr(os, 'replace', os.rename)(filename + '.tmp', filename)
+
+
+def _crc32(arr):
+    return zlib.crc32(np.ascontiguousarray(arr)) & 0xffffffff
+
+
+def _write_chunk(frames, out, chunk_size, lock, i):
+    """Reads chunk `i` of `frames` into memory-mapped `out` (of shape
+    (n_frames,) + frame_shape), flushes it, and returns (i, checksum).
+    `lock` guards the reading."""
+    start = i * chunk_size
+    stop = min(start + chunk_size, len(out))
+    for j in range(start, stop):
+        with lock:
+            out[j] = frames[j]
+    out.flush()
+    return i, _crc32(out[start:stop])
+
+
+def _frames_view(data, metadata):
+    """Returns the (n_frames,) + frame_shape view of the numpy file."""
+    n_frame_axes = len(metadata['frame_axes'])
+    return data.reshape((-1,) + data.shape[data.ndim - n_frame_axes:])
+
+
+# the source and output opened by a worker process, by output filename
+_worker_files = dict()
+
+
+def _convert_chunk(source_spec, filename, metadata, i):
+    """Process pool task: writes chunk `i` of the source described by
+    `source_spec` into the numpy file `filename`."""
+    if filename not in _worker_files:
+        frames = _open_source(*source_spec)
+        out = _frames_view(np.load(filename, mmap_mode='r+'), metadata)
+        _worker_files[filename] = (frames, out)
+    frames, out = _worker_files[filename]
+    return _write_chunk(frames, out, metadata['chunk_size'],
+                        threading.Lock(), i)
+
+
+def convert(source, path, workers=1, chunk_size=None, resume=True,
+            reader=None, bundle_axes=None, iter_axes=None, **kwargs):
+    """Converts a reader into a directory of memory-mappable frames.
+
+    Parameters
+    ----------
+    source : string or reader
+        A filename (opened with `reader`), or an opened reader. Of
+        N-dimensional readers, every frame with the current `bundle_axes` is
+        stored, in the order of the `iter_axes`.
+    path : string
+        The output directory. It is created if needed.
+    workers : integer, optional
+        The number of chunks that are converted at once. Defaults to 1. When
+        `source` is a filename, every worker is a process that opens its own
+        reader and writes into the memory-mapped output. Readers that are
+        given are shared by threads, which read one frame at a time: then
+        only the writing and checksums run in parallel, not the decoding.
+    chunk_size : integer, optional
+        The number of frames per chunk, the unit of work, checksums and
+        resuming. By default, chunks are about 64 MB.
+    resume : boolean, optional
+        Continue a previous, interrupted conversion into `path`, if any.
+        Defaults to True. When False, `path` is overwritten. A conversion of
+        another source (by filename), reader class or layout is not
+        continued.
+    reader : callable, optional
+        Opens `source` if it is a filename. Defaults to ``pims.open``. It
+        needs to be picklable (a reader class, for instance) when there are
+        several workers.
+    bundle_axes, iter_axes : string or list, optional
+        The axes that are set on N-dimensional readers.
+    kwargs :
+        Passed on to `reader`.
+
+    Returns
+    -------
+    ConvertedFrames
+
+    Examples
+    --------
+    >>> frames = convert('video.mp4', 'video_frames', workers=4)
+    >>> frames[1000]  # read from a memory map
+    """
+    frames = _open_source(source, reader, bundle_axes, iter_axes, kwargs)
+    filename = os.path.join(path, FRAMES_FILE)
+    try:
+        metadata = _layout(frames, chunk_size)
+        if not isinstance(source, six.string_types):
+            source = getattr(frames, 'filename', None)
+        if isinstance(source, six.string_types):
+            metadata['source'] = os.path.abspath(source)
+
+        previous = read_metadata(path) if resume else None
+        if previous is not None and not os.path.isfile(filename):
+            previous = None  # nothing to continue: start over
+        if previous is not None:
+            keys = ('version', 'source', 'reader', 'axes', 'shape', 'dtype',
+                    'chunk_size')
+            if any(previous.get(key) != metadata.get(key) for key in keys):
+                raise ValueError("{0} contains a different conversion; pass "
+                                 "resume=False to overwrite it".format(path))
+            metadata['checksums'] = previous['checksums']
+            out = np.load(filename, mmap_mode='r+')
+        else:
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            out = np.lib.format.open_memmap(
+                filename, mode='w+', dtype=np.dtype(metadata['dtype']),
+                shape=tuple(metadata['shape']))
+            _write_metadata(path, metadata)
+
+        out = _frames_view(out, metadata)
+        pending = [i for i, checksum in enumerate(metadata['checksums'])
+                   if checksum is None]
+        if workers > 1 and isinstance(source, six.string_types):
+            source_spec = (source, reader, bundle_axes, iter_axes, kwargs)
+            pool = Pool(workers)
+            task = partial(_convert_chunk, source_spec, filename,
+                           dict(metadata, checksums=None))
+        else:
+            pool = ThreadPool(workers)
+            task = partial(_write_chunk, frames, out, metadata['chunk_size'],
+                           threading.Lock())
+        try:
+            # record each chunk once it is on disk: a checkpoint
+            for i, checksum in pool.imap_unordered(task, pending):
+                metadata['checksums'][i] = checksum
+                _write_metadata(path, metadata)
+        finally:
+            pool.terminate()
+        del out
+    finally:
+        if isinstance(source, six.string_types):
+            frames.close()
+    return ConvertedFrames(path)
+
+
+def verify_conversion(path):
+    """Returns the numbers of the chunks in directory `path` of which the
+    checksum does not match, or that have not been written."""
+    metadata = read_metadata(path)
+    if metadata is None:
+        raise IOError("{0} does not contain a conversion".format(path))
+    data = _frames_view(np.load(os.path.join(path, FRAMES_FILE),
+                                mmap_mode='r'), metadata)
+    chunk_size = metadata['chunk_size']
+    result = []
+    for i, checksum in enumerate(metadata['checksums']):
+        chunk = data[i * chunk_size:(i + 1) * chunk_size]
+        if checksum is None or _crc32(chunk) != checksum:
+            result.append(i)
+    return result
+
+
+class ConvertedFrames(FramesSequenceND):
+    """Reads the frames written by `convert` from a memory map.
+
+    The axes and iteration order are those of the converted reader. Readers
+    without axes give 't', and 'y', 'x' (and 'c') for the frames. Frames are
+    copied from the read-only memory map, so that they can be edited.
+
+    Parameters
+    ----------
+    path : string
+        The directory written by `convert`
+    verify : boolean, optional
+        Compare the checksums of all chunks first. Default False.
+
+    Attributes
+    ----------
+    metadata : dict
+        The metadata of the converted reader that could be stored
+    source : string or None
+        The filename that was converted
+    """
+    @classmethod
+    def class_exts(cls):
+        # a directory, which pims.open gives to ImageSequence
+        return set()
+
+    def __init__(self, path, verify=False):
+        super(ConvertedFrames, self).__init__()
+        info = read_metadata(path)
+        if info is None:
+            raise IOError("{0} does not contain a conversion".format(path))
+        if None in info['checksums']:
+            raise IOError("The conversion into {0} is incomplete; convert "
+                          "again to resume it".format(path))
+        if verify:
+            bad_chunks = verify_conversion(path)
+            if bad_chunks:
+                raise IOError("The checksums of chunks {0} in {1} do not "
+                              "match".format(bad_chunks, path))
+        self._path = path
+        self._data = np.load(os.path.join(path, FRAMES_FILE), mmap_mode='r')
+        self._axes = info['axes']
+        self.metadata = info['metadata']
+        self.source = info.get('source')
+
+        for name, size in zip(self._axes, self._data.shape):
+            self._init_axis(name, size)
+        frame_axes = info['frame_axes']
+        self._register_get_frame(partial(self._read, frame_axes), frame_axes)
+        self.bundle_axes = frame_axes
+        self.iter_axes = [ax for ax in self._axes if ax not in frame_axes]
+
+    def _read(self, axes, **ind):
+        """Read the data along `axes` at coordinates `ind`, in the order
+        of `axes`."""
+        key = tuple([slice(None) if ax in axes else ind[ax]
+                     for ax in self._axes])
+        result = self._data[key]
+        result_axes = [ax for ax in self._axes if ax in axes]
+        # a copy, so that frames can be edited like those of other readers
+        return np.array(result.transpose([result_axes.index(ax)
+                                          for ax in axes]))
+
+    @property
+    def pixel_type(self):
+        return self._data.dtype
+
+    def close(self):
+        self._data = None
+
+    def __repr__(self):
+        s = "<ConvertedFrames>\nSource: {0}\n".format(self._path)
+        for ax in self._axes:
+            s += "Axis '{0}' size: {1}\n".format(ax, self.sizes[ax])
+        s += "Pixel Datatype: {0}".format(self.pixel_type)
+        return s
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    parser = argparse.ArgumentParser(
+        prog='python -m pims.convert',
+        description='Converts a file that pims can read into a directory of '
+                    'memory-mappable frames.')
+    parser.add_argument('source', help='file to convert')
+    parser.add_argument('destination', help='output directory')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of processes that read the file')
+    parser.add_argument('--chunk-size', type=int, default=None,
+                        help='number of frames per chunk')
+    parser.add_argument('--restart', action='store_true',
+                        help='overwrite an interrupted conversion')
+    parser.add_argument('--bundle-axes', default=None,
+                        help='axes of the frames, such as zyx')
+    parser.add_argument('--iter-axes', default=None,
+                        help='axes to iterate over, such as tc')
+    parser.add_argument('--verify', action='store_true',
+                        help='compare the checksums after converting')
+    args = parser.parse_args()
+    converted = convert(args.source, args.destination, workers=args.workers,
+                        chunk_size=args.chunk_size, resume=not args.restart,
+                        bundle_axes=args.bundle_axes,
+                        iter_axes=args.iter_axes)
+    print(converted)
+    if args.verify:
+        bad_chunks = verify_conversion(args.destination)
+        if bad_chunks:
+            print('Checksums do not match in chunks {0}'.format(bad_chunks))
+            sys.exit(1)
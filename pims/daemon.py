@@ -0,0 +1,547 @@
+"""Serves readers from a long-running local process.
+
+Starting the java virtual machine for the BioformatsReader takes seconds,
+which dominates the runtime of short-lived processes. The daemon in this
+module is a process that keeps readers (and the JVM) alive. Clients talk to
+it over a UNIX socket in a directory that only the current user can access,
+and authenticate with a key from a file in that directory. The pixel data is
+passed through a file in shared memory, so that it is not pickled.
+
+Start a daemon with::
+
+    python -m pims.daemon [address]
+
+or let ``DaemonReader`` start one when there is none.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import sys
+import mmap
+import stat
+import errno
+import time
+import pickle
+import socket
+import tempfile
+import threading
+import subprocess
+import importlib
+from collections import OrderedDict
+from functools import partial
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+
+import numpy as np
+import six
+
+import pims
+from pims.base_frames import FramesSequenceND
+from pims.frame import Frame
+
+
+def available():
+    return hasattr(socket, 'AF_UNIX')
+
+
+def _private_directory():
+    """Returns a directory that only the current user can access: 'pims' in
+    $XDG_RUNTIME_DIR if it is set, else 'pims-<uid>' in the temporary
+    directory. The directory is created if needed."""
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir and os.path.isdir(runtime_dir):
+        path = os.path.join(runtime_dir, 'pims')
+    else:
+        path = os.path.join(tempfile.gettempdir(),
+                            'pims-{0}'.format(os.getuid()))
+    try:
+        os.mkdir(path, 0o700)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    # in a shared temporary directory, another user may have created it
+    st = os.lstat(path)
+    if (not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or
+            st.st_mode & 0o077):
+        raise IOError('{0} is not a private directory of this user.'.format(
+                      path))
+    return path
+
+
+def default_address():
+    """Returns the path of the UNIX socket of the daemon of this user."""
+    return os.path.join(_private_directory(), 'daemon.sock')
+
+
+def _authkey():
+    """Returns the key with which clients authenticate to the daemon. It is
+    read from a file that only the current user can read, and generated
+    when the file does not exist."""
+    directory = _private_directory()
+    path = os.path.join(directory, 'daemon.key')
+    if not os.path.exists(path):
+        # publish the key atomically, so that it is never read half-written
+        fd, tmp_path = tempfile.mkstemp(dir=directory)  # mode 0600
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(os.urandom(32))
+            os.link(tmp_path, path)
+        except OSError as e:
+            if e.errno != errno.EEXIST:  # created concurrently
+                raise
+        finally:
+            os.remove(tmp_path)
+    with open(path, 'rb') as f:
+        st = os.fstat(f.fileno())
+        if st.st_uid != os.getuid() or st.st_mode & 0o077:
+            raise IOError('{0} can be read by other users.'.format(path))
+        return f.read()
+
+
+def _shared_memory_directory():
+    if os.path.isdir('/dev/shm'):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+
+def _picklable(metadata):
+    """Returns the items of dict `metadata` that can be pickled."""
+    result = dict()
+    for key, value in metadata.items():
+        try:
+            pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            continue
+        result[key] = value
+    return result
+
+
+def _reader_class(name):
+    """Returns the reader class with `name`: a name in the pims namespace
+    (such as 'Bioformats') or a dotted path (such as
+    'pims.bioformats.BioformatsReader')."""
+    if '.' in name:
+        module, name = name.rsplit('.', 1)
+        klass = getattr(importlib.import_module(module), name, None)
+    else:
+        klass = getattr(pims, name, None)
+    if not (isinstance(klass, type) and issubclass(klass, FramesSequenceND)):
+        raise ValueError('{0} is not an N-dimensional pims reader.'.format(
+                         name))
+    return klass
+
+
+class SharedBuffer(object):
+    """A file in shared memory, which the daemon uses to pass frames to a
+    client. The daemon creates the file (path None) and enlarges it when
+    needed; the client opens it by path.
+
+    Parameters
+    ----------
+    path : str, optional
+        Path of an existing buffer. By default, a new file is created.
+    """
+    def __init__(self, path=None):
+        self._owner = path is None
+        if self._owner:
+            fd, path = tempfile.mkstemp(prefix='pims-',
+                                        dir=_shared_memory_directory())
+        else:
+            fd = os.open(path, os.O_RDWR)
+        self.path = path
+        self._fd = fd
+        self._mmap = None
+        self._size = 0
+
+    def _map(self, n_bytes):
+        if self._owner and n_bytes > os.fstat(self._fd).st_size:
+            os.ftruncate(self._fd, n_bytes)
+        if self._mmap is None or n_bytes > self._size:
+            if self._mmap is not None:
+                self._mmap.close()
+            self._size = os.fstat(self._fd).st_size
+            access = mmap.ACCESS_WRITE if self._owner else mmap.ACCESS_READ
+            self._mmap = mmap.mmap(self._fd, self._size, access=access)
+        return self._mmap
+
+    def write(self, arr):
+        """Copies array `arr` into the buffer."""
+        arr = np.asarray(arr)
+        buf = self._map(max(arr.nbytes, 1))
+        view = np.frombuffer(buf, dtype=arr.dtype, count=arr.size)
+        view.shape = arr.shape
+        view[...] = arr
+
+    def read(self, shape, dtype):
+        """Returns a read-only view of the array in the buffer."""
+        dtype = np.dtype(dtype)
+        count = int(np.prod(shape))
+        buf = self._map(max(count * dtype.itemsize, 1))
+        return np.frombuffer(buf, dtype=dtype, count=count).reshape(shape)
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+            if self._owner:
+                os.remove(self.path)
+
+
+class ReaderDaemon(object):
+    """Serves readers to `DaemonReader` clients over a UNIX socket.
+
+    Every client connection uses one reader. Readers that were opened with
+    the same class, file and arguments are shared between connections. They
+    are kept open after their clients disconnect, up to `max_readers`.
+
+    Parameters
+    ----------
+    address : str, optional
+        Path of the UNIX socket. Defaults to `default_address()`, in a
+        directory that only the current user can access. Clients
+        authenticate with a key that only the current user can read.
+    max_readers : int, optional
+        Maximum number of unused readers that are kept open. Default 16.
+    idle_timeout : float, optional
+        The daemon exits when no client has been connected for this number of
+        seconds. Default None: the daemon runs until it is killed.
+    """
+    def __init__(self, address=None, max_readers=16, idle_timeout=None):
+        if address is None:
+            address = default_address()
+        self.address = address
+        self._authkey = _authkey()
+        self.max_readers = max_readers
+        self.idle_timeout = idle_timeout
+        # key -> [reader, lock, number of clients]
+        self._readers = OrderedDict()
+        self._lock = threading.Lock()
+        self._n_clients = 0
+        self._last_active = time.time()
+        self._buffers = set()
+
+    def serve_forever(self):
+        if os.path.exists(self.address):
+            try:  # a socket of a daemon that was killed is left behind
+                Client(self.address, family='AF_UNIX',
+                       authkey=self._authkey).close()
+            except AuthenticationError:  # a daemon with another key
+                pass
+            except socket.error:
+                os.remove(self.address)
+            if os.path.exists(self.address):
+                raise IOError('A daemon is already serving at {0}'.format(
+                              self.address))
+        # the socket is only accessible by the current user from the start
+        umask = os.umask(0o177)
+        try:
+            listener = Listener(self.address, family='AF_UNIX',
+                                authkey=self._authkey)
+        finally:
+            os.umask(umask)
+        if self.idle_timeout is not None:
+            watchdog = threading.Thread(target=self._exit_when_idle)
+            watchdog.daemon = True
+            watchdog.start()
+        try:
+            while True:
+                try:
+                    conn = listener.accept()
+                except (AuthenticationError, EOFError, socket.error):
+                    continue  # a client that failed to authenticate
+                with self._lock:
+                    self._n_clients += 1
+                thread = threading.Thread(target=self._serve_client,
+                                          args=(conn,))
+                thread.daemon = True
+                thread.start()
+        finally:
+            listener.close()
+            with self._lock:
+                for buffer in self._buffers:
+                    buffer.close()
+
+    def _exit_when_idle(self):
+        while True:
+            time.sleep(min(self.idle_timeout, 1.))
+            with self._lock:
+                idle = (self._n_clients == 0 and
+                        time.time() - self._last_active > self.idle_timeout)
+            if idle:
+                try:
+                    os.remove(self.address)
+                finally:
+                    os._exit(0)
+
+    def _open(self, reader, filename, kwargs):
+        key = (reader, os.path.abspath(filename),
+               repr(sorted(kwargs.items())))
+        with self._lock:
+            entry = self._readers.pop(key, None)
+            if entry is not None:
+                entry[2] += 1
+                self._readers[key] = entry
+                return key, entry
+        frames = _reader_class(reader)(filename, **kwargs)
+        with self._lock:
+            entry = self._readers.setdefault(key, [frames, threading.Lock(), 0])
+            entry[2] += 1
+        if entry[0] is not frames:  # opened concurrently by another client
+            frames.close()
+        return key, entry
+
+    def _release(self, key):
+        with self._lock:
+            self._readers[key][2] -= 1
+            unused = [k for k in self._readers if self._readers[k][2] == 0]
+            evict = unused[:max(len(unused) - self.max_readers, 0)]
+            evicted = [self._readers.pop(k)[0] for k in evict]
+        for frames in evicted:
+            frames.close()
+
+    def _serve_client(self, conn):
+        key = entry = buffer = None
+        try:
+            while True:
+                try:
+                    request = conn.recv()
+                except EOFError:
+                    break
+                command = request[0]
+                try:
+                    if command == 'open':
+                        if key is not None:
+                            raise ValueError('A reader is already open.')
+                        key, entry = self._open(*request[1:])
+                        buffer = SharedBuffer()
+                        with self._lock:
+                            self._buffers.add(buffer)
+                        result = self._describe(entry, buffer)
+                    elif command == 'get_frame':
+                        if entry is None:
+                            raise ValueError('No reader is open.')
+                        result = self._get_frame(entry, buffer, *request[1:])
+                    elif command == 'close':
+                        conn.send(('ok', None))
+                        break
+                    else:
+                        raise ValueError('Unknown command {0}'.format(command))
+                except Exception as e:
+                    conn.send(('error', type(e).__name__, str(e)))
+                else:
+                    conn.send(('ok', result))
+        finally:
+            conn.close()
+            if buffer is not None:
+                with self._lock:
+                    self._buffers.discard(buffer)
+                buffer.close()
+            if key is not None:
+                self._release(key)
+            with self._lock:
+                self._n_clients -= 1
+                self._last_active = time.time()
+
+    def _describe(self, entry, buffer):
+        frames = entry[0]
+        with entry[1]:
+            attrs = dict()
+            for name in getattr(frames, 'propagate_attrs', []):
+                value = getattr(frames, name, None)
+                if not callable(value):
+                    attrs[name] = value
+            return dict(sizes=[(name, frames.sizes[name])
+                               for name in frames.axes],
+                        bundle_axes=frames.bundle_axes,
+                        iter_axes=frames.iter_axes,
+                        default_coords=dict(frames.default_coords),
+                        pixel_type=np.dtype(frames.pixel_type).str,
+                        attrs=_picklable(attrs),
+                        buffer=buffer.path)
+
+    def _get_frame(self, entry, buffer, bundle_axes, coords):
+        frames = entry[0]
+        with entry[1]:
+            if (frames._get_frame_wrapped is None or
+                    frames.bundle_axes != bundle_axes):
+                frames.bundle_axes = bundle_axes
+            frame = frames._get_frame_wrapped(**coords)
+        metadata = _picklable(getattr(frame, 'metadata', dict()))
+        frame = np.asarray(frame)
+        buffer.write(frame)
+        return frame.shape, frame.dtype.str, metadata
+
+
+def _start_daemon(address, timeout=30., idle_timeout=600.):
+    """Starts a daemon process and waits until it accepts connections."""
+    # make sure that the daemon imports this pims
+    env = dict(os.environ)
+    pims_path = os.path.dirname(os.path.dirname(os.path.abspath(
+        pims.__file__)))
+    env['PYTHONPATH'] = os.pathsep.join([pims_path] +
+        [p for p in env.get('PYTHONPATH', '').split(os.pathsep) if p])
+    # detach the daemon from the session of the client
+    if six.PY3:
+        detach = dict(start_new_session=True)
+    else:
+        detach = dict(preexec_fn=os.setsid)
+    with open(os.devnull, 'r+b') as devnull:
+        subprocess.Popen([sys.executable, '-m', 'pims.daemon', address,
+                          '--idle-timeout', str(idle_timeout)],
+                         stdin=devnull, stdout=devnull, stderr=devnull,
+                         close_fds=True, env=env, **detach)
+    start = time.time()
+    while True:
+        try:
+            return Client(address, family='AF_UNIX', authkey=_authkey())
+        except socket.error:
+            if time.time() - start > timeout:
+                raise IOError('The pims daemon did not start.')
+            time.sleep(0.05)
+
+
+class DaemonReader(FramesSequenceND):
+    """Reads a file with a reader that lives in a daemon process.
+
+    The daemon keeps the reader open after this object is closed, so that
+    other processes can open the same file without initializing the reader
+    again. For the BioformatsReader, the daemon also saves the startup time
+    of the java virtual machine.
+
+    Parameters
+    ----------
+    filename : str
+    reader : str, optional
+        Name of the reader class in the pims namespace (such as 'Bioformats'
+        or 'TiffStackND') or its dotted path. Default 'Bioformats'.
+    address : str, optional
+        UNIX socket of the daemon. Defaults to `default_address()`.
+    start : bool, optional
+        Start a daemon if none is running. The started daemon exits after it
+        has been idle for 10 minutes. Default True.
+    **kwargs
+        Passed to the reader class. The reader cannot be changed after
+        opening; pass options such as `series` here.
+
+    Attributes
+    ----------
+    attrs : dict
+        The attributes in `propagate_attrs` of the remote reader that could be
+        transferred.
+
+    Examples
+    --------
+    >>> frames = DaemonReader('path/to/file.nd2', series=1)
+    >>> frames.bundle_axes = 'zyx'
+    >>> frames[0]
+    """
+    @classmethod
+    def class_exts(cls):
+        return set()  # only used explicitly
+
+    @property
+    def pixel_type(self):
+        return self._pixel_type
+
+    def __init__(self, filename, reader='Bioformats', address=None,
+                 start=True, **kwargs):
+        super(DaemonReader, self).__init__()
+        if address is None:
+            address = default_address()
+        self.filename = filename
+        self.address = address
+        try:
+            self._conn = Client(address, family='AF_UNIX',
+                                authkey=_authkey())
+        except socket.error:
+            if not start:
+                raise
+            self._conn = _start_daemon(address)
+        self._buffer = None
+
+        try:
+            info = self._request('open', reader, os.path.abspath(filename),
+                                 kwargs)
+        except Exception:
+            self._conn.close()
+            self._conn = None
+            raise
+        self._buffer = SharedBuffer(info['buffer'])
+        self._pixel_type = np.dtype(info['pixel_type'])
+        for name, size in info['sizes']:
+            self._init_axis(name, size)
+        self.attrs = {name: value for name, value in info['attrs'].items()
+                      if not hasattr(DaemonReader, name)}
+        self.bundle_axes = info['bundle_axes']
+        self.iter_axes = info['iter_axes']
+        self.default_coords.update(info['default_coords'])
+
+    def _request(self, *request):
+        self._conn.send(request)
+        response = self._conn.recv()
+        if response[0] == 'ok':
+            return response[1]
+        # reraise builtin exceptions as such, others as RuntimeError
+        exc_type = getattr(six.moves.builtins, response[1], None)
+        if not (isinstance(exc_type, type) and
+                issubclass(exc_type, Exception)):
+            exc_type = RuntimeError
+        raise exc_type(response[2])
+
+    def _get_frame_remote(self, bundle_axes, **coords):
+        coords = {k: int(v) for k, v in coords.items()}
+        shape, dtype, metadata = self._request('get_frame', bundle_axes,
+                                               coords)
+        # copy, because the daemon reuses the buffer
+        return Frame(self._buffer.read(shape, dtype).copy(),
+                     metadata=metadata)
+
+    @FramesSequenceND.bundle_axes.setter
+    def bundle_axes(self, value):
+        value = list(value)
+        self._register_get_frame(partial(self._get_frame_remote, value),
+                                 value)
+        FramesSequenceND.bundle_axes.fset(self, value)
+
+    def close(self):
+        if self._conn is None:
+            return
+        try:
+            self._request('close')
+        except (EOFError, IOError):
+            pass
+        self._conn.close()
+        self._conn = None
+        if self._buffer is not None:
+            self._buffer.close()
+
+    def __repr__(self):
+        s = "<DaemonReader>\nSource: {0}\n".format(self.filename)
+        s += "Axes: {0}\n".format(self.ndim)
+        for dim in self._sizes:
+            s += "Axis '{0}' size: {1}\n".format(dim, self._sizes[dim])
+        s += """Pixel Datatype: {dtype}""".format(dtype=self.pixel_type)
+        return s
+
+
+if __name__ == '__main__':
+    import argparse
+    import signal
+    parser = argparse.ArgumentParser(
+        prog='python -m pims.daemon',
+        description='Serves pims readers over a UNIX socket.')
+    parser.add_argument('address', nargs='?', default=None,
+                        help='path of the socket')
+    parser.add_argument('--max-readers', type=int, default=16,
+                        help='number of unused readers that are kept open')
+    parser.add_argument('--idle-timeout', type=float, default=None,
+                        help='exit after this many seconds without clients')
+    args = parser.parse_args()
+    # clean up the socket and the shared memory on termination
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    ReaderDaemon(args.address, args.max_readers,
+                 args.idle_timeout).serve_forever()
@@ -6,6 +6,12 @@ import uuid
 import itertools
 import numpy as np
 import tempfile
+import threading
+import weakref
+from collections import deque, OrderedDict
+from functools import partial
+from multiprocessing import cpu_count
+from multiprocessing.pool import Pool, ThreadPool
 from io import BytesIO
 from base64 import b64encode
 from contextlib import contextmanager
@@ -37,7 +43,8 @@ except ImportError:
 def export_pyav(sequence, filename, rate=30, bitrate=None,
                 width=None, height=None, format=None, codec='mpeg4',
                 pixel_format='yuv420p', autoscale=None, quality=None,
-                options=None, rate_range=(16, 32)):
+                options=None, rate_range=(16, 32), workers=1, codec_threads=0,
+                display_range=None):
     """Export a sequence of images as a standard video file using PyAv.
 
     N.B. If the quality and detail are insufficient, increase the
@@ -71,7 +78,8 @@ def export_pyav(sequence, filename, rate=30, bitrate=None,
         Another possibility is 'bgr24' in combination with the 'rawvideo' codec.
     autoscale : boolean
         Linearly rescale the brightness to use the full gamut of black to
-        white values. False by default for uint8 readers, True otherwise.
+        white values, using the range of the first frame for the whole
+        sequence. False by default for uint8 readers, True otherwise.
     quality: number or string, optional
         For 'mpeg4' codec: sets qmin and qmax
         For 'libx264' codec: sets crf. 0 = lossless, 23 = default.
@@ -85,14 +93,28 @@ def export_pyav(sequence, filename, rate=30, bitrate=None,
         is too low, frames will be multiplied an integer number of times. When
         the desired frame rate is too high, frames will be skipped at constant
         intervals.
-
+    workers : integer, optional
+        Number of threads that read and convert frames ahead of the encoder.
+        Use more than 1 only if the sequence can be read from several threads
+        at once. Default 1.
+    codec_threads : integer, optional
+        Number of threads used by the encoder, if it supports threading.
+        Default 0: chosen by FFmpeg.
+    display_range : tuple of two numbers or 'sequence', optional
+        The intensities that are mapped to black and white in all frames.
+        'sequence' uses the minimum and maximum of 100 frames, evenly spaced
+        in the sequence (see `intensity_range`). Overrides autoscale.
+
+    Notes
+    -----
+    Greyscale images are passed to the encoder without conversion to RGB.
     """
     if av is None:
         raise("This feature requires PyAV with FFmpeg or libav installed.")
 
     export_rate = _normalize_framerate(rate, *rate_range)
-    sequence = CachedFrameGenerator(sequence, rate, autoscale)
-
+    if display_range == 'sequence':
+        display_range = intensity_range(sequence, max_frames=100)
 
     # pyav is picky with unicode strings
     codec = str(codec)
@@ -125,12 +147,17 @@ def export_pyav(sequence, filename, rate=30, bitrate=None,
     export_rate_frac = Fraction(export_rate).limit_denominator(65535)
     stream = output.add_stream(codec, rate=export_rate_frac)
     stream.pix_fmt = str(pixel_format)
-
-    for frame_no in itertools.count():
-        try:
-            img = sequence(frame_no / export_rate)
-        except IndexError:
-            break
+    try:
+        stream.thread_type = str('AUTO')
+        stream.thread_count = codec_threads
+    except AttributeError:  # not supported by this PyAV version
+        pass
+
+    converter = _Uint8Converter(autoscale, display_range)
+    convert = lambda image: _to_uint8_gray_or_rgb(image, converter)
+    frames = _convert_ahead(sequence, convert, rate, export_rate, workers)
+    gray_format = True
+    for frame_no, img in enumerate(frames):
         if frame_no == 0:
             # Inspect first frame to set up stream.
             if width is None:
@@ -149,7 +176,16 @@ def export_pyav(sequence, filename, rate=30, bitrate=None,
                                                       export_rate)
                 stream.bit_rate = int(bitrate)
 
-        frame = av.VideoFrame.from_ndarray(img, format=str('rgb24'))
+        frame = None
+        if img.ndim == 2 and gray_format:
+            try:
+                frame = av.VideoFrame.from_ndarray(img, format=str('gray'))
+            except ValueError:  # not supported by this PyAV version
+                gray_format = False
+        if frame is None:
+            if img.ndim == 2:
+                img = np.repeat(img[:, :, np.newaxis], 3, axis=2)
+            frame = av.VideoFrame.from_ndarray(img, format=str('rgb24'))
         packet = stream.encode(frame)
         if packet is not None:
             output.mux(packet)
@@ -160,10 +196,54 @@ def export_pyav(sequence, filename, rate=30, bitrate=None,
         if packet is None:
             break
         output.mux(packet)
+        if isinstance(packet, list):  # all packets are flushed at once
+            break
 
     output.close()
 
 
+def _convert_ahead(sequence, convert, rate, export_rate, workers=1):
+    """Yields the converted frames of `sequence` at `export_rate`, repeating
+    or skipping frames of the sequence at `rate`. A pool of `workers` threads
+    reads and converts up to 2 * `workers` frames ahead."""
+    try:
+        n_frames = len(sequence)
+    except TypeError:
+        n_frames = None  # read until IndexError
+
+    def source_indices():
+        for frame_no in itertools.count():
+            i = int(frame_no / export_rate * rate)
+            if n_frames is not None and i >= n_frames:
+                return
+            yield i
+
+    indices = source_indices()
+    pending = deque()  # (index, AsyncResult)
+    pool = ThreadPool(workers)
+    try:
+        while True:
+            while len(pending) < 2 * workers:
+                i = next(indices, None)
+                if i is None:
+                    break
+                if pending and pending[-1][0] == i:
+                    result = pending[-1][1]  # a repeated frame
+                else:
+                    result = pool.apply_async(
+                        lambda i=i: convert(sequence[i]))
+                pending.append((i, result))
+            if not pending:
+                return
+            try:
+                img = pending.popleft()[1].get()
+            except IndexError:
+                return
+            yield img
+    finally:
+        pool.terminate()
+
+
 def play(sequence, rate=30, bitrate=None,
          width=None, height=None, autoscale=True):
     """In an IPython notebook, display a sequence of images as
@@ -206,19 +286,22 @@ def play(sequence, rate=30, bitrate=None,
 
 
 class CachedFrameGenerator(object):
-    def __init__(self, sequence, rate, autoscale=None, to_bgr=False):
+    def __init__(self, sequence, rate, autoscale=None, to_bgr=False,
+                 display_range=None):
         self.sequence = sequence
         self._cached_frame_no = None
         self._cache = None
         self.autoscale = autoscale
         self.rate = rate
         self.to_bgr = to_bgr
+        self._converter = _Uint8Converter(autoscale, display_range)
 
     def __call__(self, t):
         frame_no = int(t * self.rate)
         if self._cached_frame_no != frame_no:
             self._cached_frame_no = frame_no
-            self._cache = _to_rgb_uint8(self.sequence[frame_no], self.autoscale)
+            self._cache = _to_rgb_uint8(self.sequence[frame_no],
+                                        converter=self._converter)
         if self.to_bgr:
             return self._cache[:, :, ::-1]
         else:
@@ -228,7 +311,7 @@ class CachedFrameGenerator(object):
 def export_moviepy(sequence, filename, rate=30, bitrate=None, width=None,
                    height=None, codec='mpeg4', pixel_format='yuv420p',
                    autoscale=None, quality=None, verbose=True,
-                   options=None, rate_range=(16, 32)):
+                   options=None, rate_range=(16, 32), display_range=None):
     """Export a sequence of images as a standard video file using MoviePy.
 
     Parameters
@@ -262,7 +345,8 @@ def export_moviepy(sequence, filename, rate=30, bitrate=None, width=None,
         For 'wmv2' codec: sets fraction of lossless bitrate, 0.01 = default
     autoscale : boolean, optional
         Linearly rescale the brightness to use the full gamut of black to
-        white values. False by default for uint8 readers, True otherwise.
+        white values, using the range of the first frame for the whole
+        sequence. False by default for uint8 readers, True otherwise.
     verbose : boolean, optional
         Determines whether MoviePy will print progress. True by default.
     options : dictionary, optional
@@ -274,6 +358,10 @@ def export_moviepy(sequence, filename, rate=30, bitrate=None, width=None,
         is too low, frames will be multiplied an integer number of times. When
         the desired frame rate is too high, frames will be skipped at constant
         intervals.
+    display_range : tuple of two numbers or 'sequence', optional
+        The intensities that are mapped to black and white in all frames.
+        'sequence' uses the minimum and maximum of 100 frames, evenly spaced
+        in the sequence (see `intensity_range`). Overrides autoscale.
 
     See Also
     --------
@@ -291,9 +379,12 @@ def export_moviepy(sequence, filename, rate=30, bitrate=None, width=None,
     if rate <= 0:
         raise ValueError
     export_rate = _normalize_framerate(rate, *rate_range)
+    if display_range == 'sequence':
+        display_range = intensity_range(sequence, max_frames=100)
 
     clip = VideoClip(CachedFrameGenerator(sequence, rate, autoscale,
-                                          to_bgr=(pixel_format == 'bgr24')))
+                                          to_bgr=(pixel_format == 'bgr24'),
+                                          display_range=display_range))
     clip.duration = len(sequence) / rate
     if not (height is None and width is None):
         clip = clip.resize(height=height, width=width)
@@ -394,16 +485,139 @@ $('#image-stack-{{stack_id}}').bind('mousewheel DOMMouseScroll', function(e) {
     js = SCROLL_STACK_JS.render(length=len(sequence), stack_id=stack_id)
     output = '<script>{0}</script>'.format(js)
     output += WRAPPER.render(width=width, stack_id=stack_id)
-    if normed:
-        sequence = normalize(np.asarray(sequence))
-    for i, s in enumerate(sequence):
-        output += TAG.render(
-            data=b64encode(_as_png(s, width, normed=False)).decode('utf-8'),
-            stack_id=stack_id, i=i)
+    thumbnails = _thumbnails(sequence, width)
+    # scale all frames uniformly
+    display_range = intensity_range(thumbnails) if normed else None
+    encode = partial(_as_png, width=width, normed=False,
+                     display_range=display_range)
+    pool = ThreadPool(max(min(len(thumbnails), cpu_count()), 1))
+    try:
+        pngs = pool.map(encode, thumbnails)
+    finally:
+        pool.terminate()
+    for i, png in enumerate(pngs):
+        output += TAG.render(data=b64encode(png).decode('utf-8'),
+                             stack_id=stack_id, i=i)
     output += "</div>"
     return output
 
 
+class _ThumbnailCache(object):
+    """Least recently used cache of the thumbnails of readers, bounded by
+    their total number of bytes. The thumbnails of a reader are dropped when
+    the reader is garbage collected."""
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # (id of reader, key) -> thumbnail
+        self._refs = dict()  # id of reader -> weak reference to it
+        self._collected = []  # weak references of collected readers
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    def _reader_id(self, reader):
+        """Returns the id of `reader`, under which its thumbnails are stored.
+        Raises TypeError if the reader cannot be weakly referenced."""
+        ident = id(reader)
+        ref = self._refs.get(ident)
+        if ref is None or ref() is not reader:
+            # the callback may run at any time, so it only takes a note
+            ref = weakref.ref(reader, self._collected.append)
+            self._refs[ident] = ref
+            self._drop(ident)  # of a collected reader with the same id
+        return ident
+
+    def _drop(self, ident):
+        for key in [key for key in self._entries if key[0] == ident]:
+            self._nbytes -= self._entries.pop(key).nbytes
+
+    def _purge(self):
+        while self._collected:
+            ref = self._collected.pop()
+            for ident, other in list(self._refs.items()):
+                if other is ref:
+                    del self._refs[ident]
+                    self._drop(ident)
+
+    def get(self, reader, key):
+        with self._lock:
+            self._purge()
+            key = (self._reader_id(reader),) + key
+            thumbnail = self._entries.pop(key, None)
+            if thumbnail is not None:
+                self._entries[key] = thumbnail
+            return thumbnail
+
+    def put(self, reader, key, thumbnail):
+        if thumbnail.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            self._purge()
+            key = (self._reader_id(reader),) + key
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._nbytes -= old.nbytes
+            self._entries[key] = thumbnail
+            self._nbytes += thumbnail.nbytes
+            while self._nbytes > self.max_bytes:
+                self._nbytes -= self._entries.popitem(last=False)[1].nbytes
+
+
+_thumbnail_cache = _ThumbnailCache(2**28)
+
+
+def _thumbnails(sequence, width):
+    """Returns the frames of `sequence`, downsampled for display at `width`.
+    Thumbnails of readers are cached per reader, frame, width and the state
+    of the reader (such as its axes and series), as long as they are smaller
+    than the frame."""
+    from pims.base_frames import FramesSequence
+    cache = None
+    if isinstance(sequence, FramesSequence):
+        cache = _thumbnail_cache
+        # N-dimensional readers give other frames when their axes change
+        state = tuple(tuple(getattr(sequence, name, ())) for name in
+                      ('bundle_axes', 'iter_axes'))
+        state += (tuple(sorted(getattr(sequence, 'default_coords',
+                                       dict()).items())),)
+        # and multi-series readers when their series or region changes
+        state += tuple(repr(getattr(sequence, name, None)) for name in
+                       ('series', 'resolution', 'region'))
+    result = []
+    for i in range(len(sequence)):
+        thumbnail = None
+        if cache is not None:
+            try:
+                thumbnail = cache.get(sequence, (i, width, state))
+            except TypeError:  # the reader cannot be weakly referenced
+                cache = None
+        if thumbnail is None:
+            frame = np.asarray(sequence[i])
+            thumbnail = _downsample(frame, width)
+            # frames that are not downsampled are not worth keeping
+            if cache is not None and thumbnail is not frame:
+                cache.put(sequence, (i, width, state), thumbnail)
+        result.append(thumbnail)
+    return result
+
+
+def _downsample(arr, width):
+    """Reduces the first two axes (y, x) of `arr` by averaging blocks of
+    pixels, by the largest integer factor that keeps it at least `width`
+    pixels wide. The dtype is kept."""
+    factor = arr.shape[1] // width
+    if factor < 2:
+        return arr
+    h = arr.shape[0] // factor
+    w = arr.shape[1] // factor
+    blocks = arr[:h * factor, :w * factor].reshape((h, factor, w, factor) +
+                                                   arr.shape[2:])
+    dtype = np.float64 if arr.dtype == np.float64 else np.float32
+    # summing the rows first keeps the inner loop contiguous
+    result = blocks.sum(axis=1, dtype=dtype).sum(axis=2)
+    result /= factor * factor
+    return result.astype(arr.dtype)
+
+
 def scrollable_stack(sequence, width=512, normed=True):
     """Display a sequence or 3D stack of frames as an interactive image
     that responds to scrolling.
@@ -424,7 +638,7 @@ def scrollable_stack(sequence, width=512, normed=True):
     return HTML(_scrollable_stack(sequence, width=width, normed=normed))
 
 
-def _as_png(arr, width, normed=True):
+def _as_png(arr, width, normed=True, display_range=None):
     "Create a PNG image buffer from an array."
     try:
         from PIL import Image
@@ -432,49 +646,296 @@ def _as_png(arr, width, normed=True):
         raise ImportError("This feature requires PIL/Pillow.")
     w = width  # for brevity
     h = arr.shape[0] * w // arr.shape[1]
-    if normed:
-        arr = normalize(arr)
-    img = Image.fromarray((arr * 255).astype('uint8')).resize((w, h))
+    # reduce the size before conversion; PIL only resizes the remainder
+    arr = _downsample(np.asarray(arr), w)
+    if display_range is not None:
+        arr = _Uint8Converter(display_range=display_range)(arr)
+    elif normed:
+        arr = _to_uint8(arr, autoscale=True)
+    elif arr.dtype != np.uint8:
+        arr = (arr * 255).astype('uint8')
+    img = Image.fromarray(arr).resize((w, h))
     img_buffer = BytesIO()
     img.save(img_buffer, format='png')
     return img_buffer.getvalue()
 
 
-def normalize(arr):
+def normalize(arr, display_range=None):
     """This normalizes an array to values between 0 and 1.
 
     Parameters
     ----------
     arr : ndarray
+    display_range : tuple of two numbers, optional
+        The values that are mapped to 0 and 1. Values outside of this range
+        are clipped. By default, the minimum and maximum of `arr`. See
+        `intensity_range` to obtain a range that is valid for a whole
+        sequence.
 
     Returns
     -------
     ndarray of float
         normalized array
     """
-    ptp = arr.max() - arr.min()
+    if display_range is None:
+        low, high = arr.min(), arr.max()
+    else:
+        low, high = float(display_range[0]), float(display_range[1])
+    if _lut_supported(arr):
+        return _apply_lut(arr, _scaling_lut(arr.dtype, low, high,
+                                            uint8=False))
+    ptp = high - low
     # Handle edge case of a flat image.
     if ptp == 0:
         ptp = 1
-    scaled_arr = (arr - arr.min()) / ptp
+    scaled_arr = (arr - low) / ptp
+    if display_range is not None:
+        scaled_arr = scaled_arr.clip(0, 1)
     return scaled_arr
 
 
-def _to_rgb_uint8(image, autoscale):
-    if autoscale is None:
-        autoscale = image.dtype != np.uint8
+def intensity_range(sequence, percentiles=(0, 100), max_frames=None):
+    """Returns intensity percentiles of all frames in a sequence, reading one
+    frame at a time, so that the sequence does not need to fit in memory.
+
+    Parameters
+    ----------
+    sequence : FramesSequence or iterable of arrays
+    percentiles : tuple of numbers, optional
+        Percentiles to compute, between 0 and 100. Default (0, 100): the
+        minimum and maximum.
+    max_frames : integer, optional
+        When given, only this number of frames is read, evenly spaced in the
+        sequence. The sequence should then support len() and indexing.
 
-    if autoscale:
-        image = (normalize(image) * 255).astype(np.uint8)
-    elif image.dtype != np.uint8:
-        if np.issubdtype(image.dtype, np.integer):
+    Returns
+    -------
+    tuple of numbers
+        the intensities at `percentiles`, to be used as `display_range` in
+        `normalize`, `to_rgb` and the export functions.
+
+    Notes
+    -----
+    Integer images of at most 16 bits are counted in a histogram, which gives
+    exact percentiles. For other images, the minimum and maximum are exact and
+    other percentiles are estimated from every n-th pixel of each frame
+    (about 65536 pixels per frame).
+    """
+    if max_frames is not None and len(sequence) > max_frames:
+        indices = np.unique(np.linspace(0, len(sequence) - 1,
+                                        max_frames).round().astype(int))
+        frames = (sequence[int(i)] for i in indices)
+    else:
+        frames = iter(sequence)
+
+    # histograms of integer images per dtype, indexed as unsigned
+    histograms = dict()
+    low, high, samples = np.inf, -np.inf, []
+    for frame in frames:
+        frame = np.asarray(frame)
+        if frame.dtype.kind in 'ui' and frame.dtype.itemsize <= 2:
+            dtype = frame.dtype
+            unsigned = 'u{0}'.format(dtype.itemsize)
+            frame_counts = np.bincount(
+                np.ascontiguousarray(frame).view(unsigned).ravel(),
+                minlength=2 ** (8 * dtype.itemsize))
+            if dtype in histograms:
+                histograms[dtype] += frame_counts
+            else:
+                histograms[dtype] = frame_counts
+        else:
+            low = min(low, np.nanmin(frame))
+            high = max(high, np.nanmax(frame))
+            flat = frame.ravel()
+            samples.append(flat[::max(1, flat.size // 2**16)])
+    if not histograms and not samples:
+        raise ValueError('The sequence contains no frames.')
+
+    if histograms:
+        # sort the histograms by value, which differs from the unsigned order
+        # for signed integers
+        values = []
+        for dtype, dtype_counts in histograms.items():
+            unsigned = 'u{0}'.format(dtype.itemsize)
+            values.append(np.arange(len(dtype_counts)).astype(unsigned)
+                          .view(dtype).astype(np.int64))
+        values = np.concatenate(values)
+        counts = np.concatenate(list(histograms.values()))
+        order = np.argsort(values, kind='mergesort')
+        values, counts = values[order], counts[order]
+        cumulative = np.cumsum(counts)
+        if samples:  # a sequence of mixed types
+            samples.append(np.repeat(values, counts))
+            present = values[counts > 0]
+            low, high = min(low, present[0]), max(high, present[-1])
+        else:
+            n = cumulative[-1]
+            result = []
+            for p in percentiles:
+                rank = p / 100 * (n - 1)
+                below = values[np.searchsorted(cumulative, np.floor(rank),
+                                               side='right')]
+                above = values[np.searchsorted(cumulative, np.ceil(rank),
+                                               side='right')]
+                result.append(below + (float(above) - below) *
+                              (rank - np.floor(rank)))
+            return tuple(float(v) for v in result)
+
+    samples = np.concatenate(samples)
+    samples = samples[~np.isnan(samples)]  # np.nanpercentile needs numpy 1.9
+    result = []
+    for p in percentiles:
+        if p <= 0:
+            result.append(low)
+        elif p >= 100:
+            result.append(high)
+        else:
+            result.append(np.percentile(samples, p))
+    return tuple(float(v) for v in result)
+
+
+_lut_cache = OrderedDict()  # least recently used first
+_lut_cache_lock = threading.Lock()
+
+
+def _lut_supported(arr):
+    """Integer arrays of at most 16 bits that are at least as large as their
+    lookup table are converted with a lookup table."""
+    return (arr.dtype.kind in 'ui' and arr.dtype.itemsize <= 2 and
+            arr.size >= 2 ** (8 * arr.dtype.itemsize))
+
+
+def _scaling_lut(dtype, low, high, uint8=True):
+    """Returns a lookup table that maps all values of integer `dtype` (of at
+    most 16 bits) linearly from [low, high] to [0, 1] (float), or to [0, 255]
+    (uint8, clipped) when `uint8` is True. Index it with the values viewed as
+    unsigned integers (see `_apply_lut`)."""
+    dtype = np.dtype(dtype)
+    key = (dtype.str, float(low), float(high), uint8)
+    with _lut_cache_lock:
+        lut = _lut_cache.pop(key, None)
+        if lut is not None:
+            _lut_cache[key] = lut
+            return lut
+    unsigned = np.dtype('u{0}'.format(dtype.itemsize))
+    values = np.arange(2 ** (8 * dtype.itemsize)).astype(unsigned).view(dtype)
+    ptp = float(high) - float(low)
+    # Handle edge case of a flat image.
+    if ptp == 0:
+        ptp = 1
+    lut = (values - float(low)) / ptp
+    if uint8:
+        lut = (lut * 255).clip(0, 255).astype(np.uint8)
+    else:
+        lut = lut.clip(0, 1)
+    with _lut_cache_lock:
+        _lut_cache[key] = lut
+        while len(_lut_cache) > 64:
+            _lut_cache.popitem(last=False)
+    return lut
+
+
+def _apply_lut(arr, lut, chunk_size=2**16):
+    """Returns the lookup table values of integer array `arr`. The array is
+    looked up in chunks, so that the index arrays numpy makes stay small."""
+    arr = np.ascontiguousarray(arr)
+    arr = arr.view('u{0}'.format(arr.dtype.itemsize))
+    out = np.empty(arr.shape, dtype=lut.dtype)
+    flat_arr = arr.reshape(-1)
+    flat_out = out.reshape(-1)
+    for start in range(0, flat_arr.size, chunk_size):
+        stop = start + chunk_size
+        np.take(lut, flat_arr[start:stop], out=flat_out[start:stop])
+    return out
+
+
+class _Uint8Converter(object):
+    """Converts the images of a sequence to uint8.
+
+    With a display_range (low, high), all images are scaled from low to high.
+    With autoscale, images are scaled from the minimum to the maximum of the
+    first image, and brighter or darker values in later images are clipped.
+    Without autoscale, integer images are scaled by the maximum value of
+    their dtype, or by 4095 for 12-bit data stored as uint16. Both are
+    decided from the first image of each dtype and kept for the whole
+    sequence. Integer images of at most 16 bits are converted by a lookup
+    table.
+    """
+    def __init__(self, autoscale=None, display_range=None):
+        self.autoscale = autoscale
+        self.display_range = display_range
+        self._max_values = dict()
+        self._ranges = dict()
+        self._lock = threading.Lock()
+
+    def __call__(self, image):
+        image = np.asarray(image)
+        autoscale = self.autoscale
+        if autoscale is None:
+            autoscale = image.dtype != np.uint8
+
+        if self.display_range is not None:
+            if _lut_supported(image):
+                lut = _scaling_lut(image.dtype, *self.display_range)
+                return _apply_lut(image, lut)
+            return (normalize(image, self.display_range) *
+                    255).astype(np.uint8)
+        elif autoscale:
+            low, high = self._range(image)
+            if _lut_supported(image):
+                return _apply_lut(image, _scaling_lut(image.dtype, low, high))
+            return (normalize(image, (low, high)) * 255).astype(np.uint8)
+        elif image.dtype == np.uint8:
+            return image
+        elif np.issubdtype(image.dtype, np.integer):
+            max_value = self._max_value(image)
+            if _lut_supported(image):
+                return _apply_lut(image, _scaling_lut(image.dtype, 0,
+                                                      max_value))
+            return (image / max_value * 255).astype(np.uint8)
+        else:
+            return (image * 255).astype(np.uint8)
+
+    def _max_value(self, image):
+        with self._lock:
+            try:
+                return self._max_values[image.dtype]
+            except KeyError:
+                pass
             max_value = np.iinfo(image.dtype).max
             # sometimes 12-bit images are stored as unsigned 16-bit
             if max_value == 2**16 - 1 and image.max() < 2**12:
                 max_value = 2**12 - 1
-            image = (image / max_value * 255).astype(np.uint8)
-        else:
-            image = (image * 255).astype(np.uint8)
+            self._max_values[image.dtype] = max_value
+            return max_value
+
+    def _range(self, image):
+        with self._lock:
+            try:
+                return self._ranges[image.dtype]
+            except KeyError:
+                pass
+            result = float(np.nanmin(image)), float(np.nanmax(image))
+            self._ranges[image.dtype] = result
+            return result
+
+
+def _to_uint8(image, autoscale):
+    return _Uint8Converter(autoscale)(image)
+
+
+def _to_uint8_gray_or_rgb(image, converter):
+    """Converts to uint8, keeping greyscale images 2D."""
+    image = np.asarray(image)
+    if image.ndim == 2:
+        return converter(image)
+    return _to_rgb_uint8(image, converter=converter)
+
+
+def _to_rgb_uint8(image, autoscale=None, converter=None):
+    if converter is None:
+        converter = _Uint8Converter(autoscale)
+    image = converter(image)
 
     ndim = image.ndim
     shape = image.shape
@@ -519,7 +980,7 @@ def _normalize_framerate(rate, min_rate=16, max_rate=32):
     return rate
 
 
-def _monochannel_to_rgb(image, rgb):
+def _monochannel_to_rgb(image, rgb, display_range=None):
     """This converts a greyscale image to an RGB image, using given rgb value.
 
     Parameters
@@ -528,19 +989,22 @@ def _monochannel_to_rgb(image, rgb):
         image; there should be no channel axis
     rgb : tuple of uint8
         output color in (r, g, b) format
+    display_range : tuple of two numbers, optional
+        intensities that are mapped to black and to `rgb`. By default, the
+        minimum and maximum of the image.
 
     Returns
     -------
-    ndarray of float
+    ndarray of float32
         rgb image, with extra inner dimension of length 3
 
     """
-    image_rgb = normalize(image).reshape(*(image.shape + (1,)))
-    image_rgb = image_rgb * np.asarray(rgb).reshape(*((1,)*image.ndim + (3,)))
-    return image_rgb
+    result = np.empty(image.shape + (3,), dtype=np.float32)
+    return _composite([image], [rgb], [display_range], result)
 
 
-def to_rgb(image, colors=None, normed=True):
+def to_rgb(image, colors=None, normed=True, display_range=None,
+           channel_axis=0):
     """This converts a greyscale or multichannel image to an RGB image, with
     given channel colors.
 
@@ -549,6 +1013,8 @@ def to_rgb(image, colors=None, normed=True):
     image : ndarray
         Multichannel image (channel dimension is first dimension). When first
         dimension is longer than 4, the file is interpreted as a greyscale.
+        Other dimensions are kept: a stack of multichannel images gives a
+        stack of RGB images.
     colors : list of matplotlib.colors
         List of either single letters, or rgb(a) as lists of floats. The sum
         of these lists should equal (1.0, 1.0, 1.0), when clipping needs to
@@ -556,21 +1022,32 @@ def to_rgb(image, colors=None, normed=True):
     normed : bool, optional
         Multichannel images will be downsampled to 8-bit RGB, if normed is
         True. Greyscale images will always give 8-bit RGB.
+    display_range : tuple of two numbers, or list of tuples, optional
+        The intensities that are mapped to black and to the full color, for
+        all channels or for each channel. By default, every channel is scaled
+        to its own minimum and maximum. See `intensity_range` to obtain a
+        range that is valid for a whole sequence. When given, the result is
+        not rescaled when normed is True.
+    channel_axis : integer, optional
+        The dimension that holds the channels, if any. Defaults to 0. Use 1
+        for a (t, c, y, x) stack.
 
     Returns
     -------
     ndarray
         RGB image, with inner dimension of length 3. The RGB image is clipped
         so that values lay between 0 and 255. When normed = True (default),
-        datatype is np.uint8, else it is float.
+        datatype is np.uint8, else it is np.float32.
     """
-    # identify whether the image has a (leading) channel axis
+    # identify whether the image has a channel axis
     if colors is None:
-        has_channel_axis = image.ndim > 2 and image.shape[0] < 5
+        has_channel_axis = (image.ndim > 2 and
+                            image.shape[channel_axis] < 5)
     else:
-        has_channel_axis = len(colors) == image.shape[0]
+        has_channel_axis = len(colors) == image.shape[channel_axis]
     # identify number of channels and resulting shape
     if has_channel_axis:
+        image = np.rollaxis(image, channel_axis, 0)
         channels = image.shape[0]
         shape_rgb = image.shape[1:] + (3,)
     else:
@@ -597,19 +1074,97 @@ def to_rgb(image, colors=None, normed=True):
         rgbs = (ColorConverter().to_rgba_array(colors)*255).astype('uint8')
         rgbs = rgbs[:channels, :3]
 
-    if has_channel_axis:
-        result = np.zeros(shape_rgb)
-        for i in range(channels):
-            result += _monochannel_to_rgb(image[i], rgbs[i])
+    if display_range is None or np.ndim(display_range) == 1:
+        display_ranges = [display_range] * channels
     else:
-        result = _monochannel_to_rgb(image, rgbs[0])
-
-    result = result.clip(0, 255)
+        display_ranges = display_range
 
-    if normed:
-        result = (normalize(result) * 255).astype('uint8')
-
-    return result
+    if has_channel_axis:
+        images = [image[i] for i in range(channels)]
+    else:
+        images = [image]
+    result = np.empty(shape_rgb, dtype=np.uint8 if normed else np.float32)
+    return _composite(images, rgbs, display_ranges[:channels], result,
+                      rescale=normed and display_range is None)
+
+
+def _composite(images, rgbs, display_ranges, out, rescale=False,
+               chunk_size=2**18):
+    """Writes the sum of `images` (scaled to [0, 1] by their display range)
+    times their `rgbs` into `out`, clipped to [0, 255]. With `rescale`, the
+    sum is stretched to [0, 255] first.
+
+    The sum is computed as a matrix product with the (channels, 3) color
+    matrix, in float32 and in blocks of about `chunk_size` pixels, so that
+    temporaries do not scale with the size of the images."""
+    if rescale:
+        # a first pass to find the range of the sum
+        low, high = np.inf, -np.inf
+        for index, block in _composite_blocks(images, rgbs, display_ranges,
+                                              chunk_size):
+            low = min(low, block.min())
+            high = max(high, block.max())
+        # Handle edge case of a flat image.
+        scale = 255 / (high - low) if high > low else 1
+    for index, block in _composite_blocks(images, rgbs, display_ranges,
+                                          chunk_size):
+        if rescale:
+            block -= low
+            block *= scale
+        out[index] = block
+    return out
+
+
+def _composite_blocks(images, rgbs, display_ranges, chunk_size):
+    """Yields (index, block) pairs of the clipped float32 composite of
+    `images`; see `_composite`."""
+    matrix = np.asarray(rgbs, dtype=np.float32).reshape(len(images), 3)
+    scalings = []
+    for image, display_range in zip(images, display_ranges):
+        if display_range is None:
+            low, high = float(image.min()), float(image.max())
+        else:
+            low, high = float(display_range[0]), float(display_range[1])
+        if _lut_supported(image):
+            lut = _scaling_lut(image.dtype, low, high, uint8=False)
+            scalings.append(lut.astype(np.float32))
+        else:
+            # Handle edge case of a flat image.
+            scalings.append((low, 1 / (high - low) if high > low else 1))
+
+    for index in _blocks(images[0].shape, chunk_size):
+        blocks = [image[index] for image in images]
+        normed = np.empty(blocks[0].shape + (len(images),), np.float32)
+        for i, (block, scaling) in enumerate(zip(blocks, scalings)):
+            if isinstance(scaling, tuple):
+                low, factor = scaling
+                normed[..., i] = block
+                normed[..., i] -= low
+                normed[..., i] *= factor
+            else:
+                unsigned = 'u{0}'.format(block.dtype.itemsize)
+                normed[..., i] = np.take(scaling, block.view(unsigned))
+        np.clip(normed, 0, 1, out=normed)
+        result = np.dot(normed, matrix)
+        np.clip(result, 0, 255, out=result)
+        yield index, result
+
+
+def _blocks(shape, size):
+    """Yields tuples of slices that split an array of `shape` into blocks of
+    at most `size` elements, as long as the last axis is not longer."""
+    if len(shape) == 0:
+        yield ()
+        return
+    inner = int(np.prod(shape[1:]))
+    if inner <= size or len(shape) == 1:
+        step = max(size // max(inner, 1), 1)
+        for start in range(0, shape[0], step):
+            yield (slice(start, start + step),)
+    else:
+        for i in range(shape[0]):
+            for index in _blocks(shape[1:], size):
+                yield (slice(i, i + 1),) + index
 
 
 @contextmanager
@@ -704,13 +1259,15 @@ def plot_to_frame(fig, width=512, close_fig=False, fig_size_inches=None,
 
 
 def plots_to_frame(figures, width=512, close_fig=False, fig_size_inches=None,
-                   bbox_inches=None):
+                   bbox_inches=None, processes=1):
     """ Renders an iterable of matplotlib figures or axes objects into a
     pims Frame object, that will be displayed as scrollable stack in IPython.
 
     Parameters
     ----------
-    figures : iterable of matplotlib Figure or Axes objects
+    figures : iterable of matplotlib Figure or Axes objects, or of callables
+        Callables are called without arguments and should return a Figure or
+        Axes object. Figures created by a callable are closed after rendering.
     width : integer
         The width of the resulting frame, in pixels
     close_fig : boolean
@@ -719,6 +1276,12 @@ def plots_to_frame(figures, width=512, close_fig=False, fig_size_inches=None,
         The figure (height, width) in inches. If None, the size is not changed.
     bbox_inches : {'tight', None}
         When 'tight', tight layout is used.
+    processes : integer
+        Number of processes that render the figures concurrently. Defaults to
+        1: render in this process. Otherwise, the figures (or callables) are
+        pickled and sent to a pool of processes, at most 2 * `processes` at a
+        time; they need to be picklable (callables should be defined at module
+        level, or be a ``functools.partial`` of such a function).
 
     Returns
     -------
@@ -733,18 +1296,75 @@ def plots_to_frame(figures, width=512, close_fig=False, fig_size_inches=None,
                          'an iterable of figures to plots_to_frame.')
 
     width = int(width)
-    h = None
-
-    frames = []
-    for n, fig in enumerate(figures):
-        im = plot_to_frame(fig, width, close_fig, fig_size_inches, bbox_inches)
-        if h is None:
-            h = im.shape[0]
-        else:
-            # make the image the same size as the first image
-            if im.shape[0] != h:
-                im = np.pad(im[:h], ((0, max(0, h - im.shape[0])), (0, 0),
-                                     (0, 0)), mode=str('constant'))
-        frames.append(im)
-
-    return Frame(np.array(frames))
+    try:
+        n_figures = len(figures)
+    except TypeError:
+        n_figures = None  # grow the output while rendering
+
+    render = partial(_render_plot, width=width,
+                     fig_size_inches=fig_size_inches, bbox_inches=bbox_inches)
+    if processes > 1:
+        images = _render_ahead(figures, render, processes, close_fig)
+    else:
+        images = (render(fig, close_fig=close_fig) for fig in figures)
+
+    result = None
+    for n, im in enumerate(images):
+        if result is None:
+            # all images get the size of the first image
+            result = np.empty((n_figures or 16,) + im.shape, dtype=im.dtype)
+        elif n == len(result):
+            grown = np.empty((2 * n,) + result.shape[1:], dtype=result.dtype)
+            grown[:n] = result
+            result = grown
+        h = min(im.shape[0], result.shape[1])
+        result[n, :h] = im[:h]
+        result[n, h:] = 0
+
+    if result is None:
+        return Frame(np.array([]))
+    return Frame(result[:n + 1])
+
+
+def _render_plot(fig, width, close_fig, fig_size_inches, bbox_inches):
+    """Renders a figure, or the figure returned by a callable, into an array
+    with plot_to_frame."""
+    if callable(fig):
+        fig = fig()
+        close_fig = True
+    return np.asarray(plot_to_frame(fig, width, close_fig, fig_size_inches,
+                                    bbox_inches))
+
+
+def _init_render_process():
+    # render off-screen, whatever the backend of the parent process
+    plt.switch_backend('Agg')
+
+
+def _render_ahead(figures, render, processes, close_fig=False):
+    """Yields the rendered `figures` in order. A pool of `processes`
+    processes renders up to 2 * `processes` figures ahead. The figures are
+    rendered (and closed) as copies; the figures in this process are closed
+    after rendering if `close_fig` is True."""
+    figures = iter(figures)
+    pending = deque()  # (figure, AsyncResult)
+    pool = Pool(processes, initializer=_init_render_process)
+    try:
+        while True:
+            while len(pending) < 2 * processes:
+                fig = next(figures, None)
+                if fig is None:
+                    break
+                pending.append((fig, pool.apply_async(
+                    render, (fig,), dict(close_fig=True))))
+            if not pending:
+                return
+            fig, result = pending.popleft()
+            image = result.get()
+            if close_fig and not callable(fig):
+                # only now, the figure has certainly been sent to the pool
+                plt.close(fig.figure if isinstance(fig, mpl.axes.Axes)
+                          else fig)
+            yield image
+    finally:
+        pool.terminate()
@@ -48,6 +48,11 @@ import re
 import subprocess as sp
 import sys
 import os
+import itertools
+import numbers
+import threading
+import hashlib
+import zlib
 
 import numpy as np
 
@@ -60,6 +65,11 @@ try:
 except ImportError:
     DEVNULL = open(os.devnull, 'wb')
 
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
 
 def try_ffmpeg(FFMPEG_BINARY):
     try:
@@ -86,7 +96,62 @@ def available():
     return FFMPEG_BINARY is not None
 
 _pix_fmt_dict = {'rgb24': 3,
-                 'rgba': 4}
+                 'rgba': 4,
+                 'gray': 1}
+
+# ffmpeg pixel formats that contain no color information
+_grey_pix_fmts = ('gray', 'gray10le', 'gray12le', 'gray16le', 'gray16be',
+                  'ya8', 'monow', 'monob')
+
+_cache_extensions = ('.pims_buffer', '.pims_meta', '.pims_index')
+
+
+def _source_signature(filename):
+    """Returns the (size, modification time) of a file, which is stored
+    along with the decoded buffer to check whether the buffer is up to date."""
+    stat = os.stat(filename)
+    return stat.st_size, int(stat.st_mtime)
+
+
+def _cache_codec(cache_format):
+    """Returns the (compress, decompress) functions of a cache format."""
+    if cache_format == 'raw':
+        return None, None
+    elif cache_format == 'zlib':
+        return (lambda data: zlib.compress(data, 1)), zlib.decompress
+    elif cache_format == 'lz4':
+        if lz4_frame is None:
+            raise ImportError("The 'lz4' cache format requires lz4.")
+        return lz4_frame.compress, lz4_frame.decompress
+    else:
+        raise ValueError("invalid cache format")
+
+
+def _limit_cache_size(cache_dir, limit, keep):
+    """Removes the least recently used buffers in `cache_dir` until the total
+    size is below `limit` bytes. The buffer with path prefix `keep` is never
+    removed."""
+    keep = os.path.abspath(keep)
+    entries = {}
+    for name in os.listdir(cache_dir):
+        prefix, ext = os.path.splitext(os.path.abspath(os.path.join(cache_dir,
+                                                                    name)))
+        if ext not in _cache_extensions:
+            continue
+        stat = os.stat(prefix + ext)
+        size, last_used = entries.get(prefix, (0, 0))
+        entries[prefix] = (size + stat.st_size,
+                           max(last_used, stat.st_atime, stat.st_mtime))
+    total = sum(size for size, _ in entries.values())
+    for prefix in sorted(entries, key=lambda k: entries[k][1]):
+        if total <= limit:
+            break
+        if prefix == keep:
+            continue
+        for ext in _cache_extensions:
+            if os.path.isfile(prefix + ext):
+                os.remove(prefix + ext)
+        total -= entries[prefix][0]
 
 
 class FFmpegVideoReader(FramesSequence):
@@ -94,19 +159,33 @@ class FFmpegVideoReader(FramesSequence):
     iterable object that returns images as numpy arrays.
 
     This reader, based on ffmpeg, should be able to read most video
-    files
+    files. The video is decoded once into a buffer file, by default next to
+    the video. Decoding happens in the background: frames can be accessed as
+    soon as they are decoded.
 
     Parameters
     ----------
     filename : string
-    process_func : function, optional
-        callable with signalture `proc_img = process_func(img)`,
-        which will be applied to the data from each frame
-    dtype : numpy datatype, optional
-        Image arrays will be converted to this datatype.
-    as_grey : boolean, optional
-        Convert color images to greyscale. False by default.
-        May not be used in conjection with process_func.
+    pix_fmt : {'rgb24', 'rgba', 'gray'}, optional
+        The pixel format of the decoded frames, 'rgb24' by default. When the
+        video is greyscale, 'rgb24' frames are stored as a single channel and
+        expanded to three equal channels when they are read.
+    use_cache : boolean, optional
+        Reuse the buffer from a previous opening of the same video, if the
+        video did not change since. True by default.
+    cache_format : {'raw', 'zlib', 'lz4'}, optional
+        How the decoded frames are stored. 'raw' (default) frames are
+        returned as read-only views into a memory map of the buffer. 'zlib'
+        and 'lz4' compress every frame separately (lossless), which makes the
+        buffer much smaller at the cost of decompression on each frame access.
+        'lz4' is faster, but requires the lz4 package.
+    cache_dir : string, optional
+        Directory to store the buffers in. By default, the buffer is stored
+        next to the video.
+    cache_size_limit : integer, optional
+        Maximum total size of all buffers in `cache_dir`, in bytes. When it is
+        exceeded, the least recently used buffers of other videos are removed.
+        Requires `cache_dir`: buffers next to videos are never removed.
 
     Examples
     --------
@@ -127,108 +206,310 @@ class FFmpegVideoReader(FramesSequence):
     >>> frame_count = len(video) # Number of frames in video
     >>> frame_shape = video.frame_shape # Pixel dimensions of video
 
-    """
-    def __init__(self, filename, pix_fmt="rgb24", use_cache=True):
+    >>> video = FFmpegVideoReader('video.avi', cache_format='zlib',
+    ...                           cache_dir='/scratch/pims',
+    ...                           cache_size_limit=100 * 2**30)
 
+    Notes
+    -----
+    The length of the video is only known when decoding has finished. Calling
+    `len` (and slicing) blocks until then, while iteration and accessing
+    single frames only waits for the requested frames.
+    """
+    def __init__(self, filename, pix_fmt="rgb24", use_cache=True,
+                 cache_format='raw', cache_dir=None, cache_size_limit=None):
         self.filename = filename
         self.pix_fmt = pix_fmt
-        self._initialize(use_cache)
         try:
             self.depth = _pix_fmt_dict[pix_fmt]
         except KeyError:
             raise ValueError("invalid pixel format")
-        w, h = self._size
-        self._stride = self.depth*w*h
+        self.cache_format = cache_format
+        self._compress, self._decompress = _cache_codec(cache_format)
+        if cache_size_limit is not None and cache_dir is None:
+            raise ValueError("cache_size_limit requires a cache_dir")
+        self._cache_dir = cache_dir
+        self._cache_size_limit = cache_size_limit
+
+        self._proc = None
+        self._decoder = None
+        self._mmap = None
+        self._offsets = [0]
+        self._error = None
+        self._closing = False
+        self._complete = False
+        self._condition = threading.Condition()
+        self._initialize(use_cache)
 
     def _initialize(self, use_cache):
-        """ Opens the file, creates the pipe. """
-
-        buffer_filename = '{0}.pims_buffer'.format(self.filename)
-        meta_filename = '{0}.pims_meta'.format(self.filename)
-
-        cmd = [FFMPEG_BINARY, '-i', self.filename,
-                '-f', 'image2pipe',
-                "-pix_fmt", self.pix_fmt,
-                '-vcodec', 'rawvideo', '-']
-        proc = sp.Popen(cmd, stdin=sp.PIPE,
-                             stdout=sp.PIPE,
-                             stderr=sp.PIPE)
-
-        print("Decoding video file...")
+        """ Opens the buffer, or starts decoding into it. """
+        if not os.path.isfile(self.filename):
+            raise IOError("%s not found ! Wrong path ?" % self.filename)
 
-        if (os.path.isfile(buffer_filename) and os.path.isfile(meta_filename)
-            and use_cache):
+        if self._cache_dir is None:
+            prefix = self.filename
+        else:
+            if not os.path.isdir(self._cache_dir):
+                os.makedirs(self._cache_dir)
+            path = os.path.abspath(self.filename)
+            prefix = os.path.join(self._cache_dir, '{0}_{1}'.format(
+                hashlib.md5(path.encode('utf-8')).hexdigest()[:16],
+                os.path.basename(path)))
+        self._cache_prefix = prefix
+        self._buffer_filename = '{0}.pims_buffer'.format(prefix)
+        self._meta_filename = '{0}.pims_meta'.format(prefix)
+        self._index_filename = '{0}.pims_index'.format(prefix)
+        self._signature = _source_signature(self.filename)
+
+        if use_cache and self._read_meta():
             print("Reusing buffer from previous opening of this video.")
-            self.data_buffer = open(buffer_filename, 'rb')
-            self.metafile = open(meta_filename, 'r')
-            self._len = int(self.metafile.readline())
-            w = int(self.metafile.readline())
-            h = int(self.metafile.readline())
-            self._size = [w, h]
+            os.utime(self._buffer_filename, None)  # mark as recently used
+            self._decoding = False
+            self._complete = True
+            self._n_available = self._len
             return
 
-        self.data_buffer = open(buffer_filename, 'wb')
-        self.metafile = open(meta_filename, 'w')
-        print ("Decoding video file. This is slow, but only the first time.")
+        self._probe()
+        self._len = None
+        self._n_available = 0
+        self._offsets = [0]
+        self._decoding = True
+        # remove the metafile: it marks the buffer as complete
+        for filename in (self._meta_filename, self._index_filename):
+            if os.path.isfile(filename):
+                os.remove(filename)
+
+        cmd = [FFMPEG_BINARY, '-i', self.filename,
+               '-f', 'image2pipe',
+               "-pix_fmt", self._stored_pix_fmt,
+               '-vcodec', 'rawvideo', '-']
+        self._proc = sp.Popen(cmd, stdin=DEVNULL, stdout=sp.PIPE,
+                              stderr=sp.PIPE)
+        print("Decoding video file in the background. This is slow, but only "
+              "the first time.")
         sys.stdout.flush()
-        CHUNKSIZE = 2**14  # utterly arbitrary
-        while True:
-            try:
-                chunk = proc.stdout.read(CHUNKSIZE)
-                if len(chunk) == 0:
-                    break
-                self.data_buffer.write(chunk)
-            except EOFError:
-                break
-        self.data_buffer.close()
-        self.data_buffer = open(buffer_filename, 'rb')
-
-        self._process_ffmpeg_stderr(proc.stderr.read())
-
-        proc.terminate()
-        for std in proc.stdin, proc.stdout, proc.stderr:
-            std.close()
+        self._decoder = threading.Thread(target=self._decode)
+        self._decoder.daemon = True
+        self._decoder.start()
+
+    def _read_meta(self):
+        """Reads the metafile. Returns True if the buffer is complete and was
+        decoded from the current version of the video."""
+        try:
+            with open(self._meta_filename, 'r') as metafile:
+                lines = metafile.read().splitlines()
+            length, w, h = [int(x) for x in lines[:3]]
+            pix_fmt = lines[3]
+            signature = int(lines[4]), int(lines[5])
+            cache_format = lines[6]
+            self._stored_pix_fmt = lines[7]
+            buffer_size = os.path.getsize(self._buffer_filename)
+            if cache_format != 'raw':
+                self._offsets = np.fromfile(self._index_filename, dtype='<i8')
+        except (IOError, OSError, IndexError, ValueError):
+            return False
+        self._size = [w, h]
+        self._len = length
+        if cache_format == 'raw':
+            expected_size = length * self._stored_stride
+        else:
+            expected_size = self._offsets[-1]
+        return (pix_fmt == self.pix_fmt and signature == self._signature and
+                cache_format == self.cache_format and
+                len(self._offsets) in (1, length + 1) and
+                buffer_size == expected_size)
+
+    def _write_meta(self):
+        if self.cache_format != 'raw':
+            np.asarray(self._offsets, dtype='<i8').tofile(self._index_filename)
+        with open(self._meta_filename, 'w') as metafile:
+            for value in [self._len, self._size[0], self._size[1],
+                          self.pix_fmt, self._signature[0],
+                          self._signature[1], self.cache_format,
+                          self._stored_pix_fmt]:
+                metafile.write('{0}\n'.format(value))
+
+    def _probe(self):
+        """Reads the frame size from the ffmpeg output, before decoding."""
+        proc = sp.Popen([FFMPEG_BINARY, '-i', self.filename],
+                        stdin=DEVNULL, stdout=DEVNULL, stderr=sp.PIPE)
+        _, stderr = proc.communicate()
+        self._process_ffmpeg_stderr(stderr)
+
+    def _decode(self):
+        """Appends decoded frames to the buffer file and publishes the number
+        of available frames. Runs in a background thread."""
+        # ffmpeg blocks when its stderr pipe is full: empty it continuously
+        stderr = []
+        stderr_reader = threading.Thread(
+            target=lambda: stderr.append(self._proc.stderr.read()))
+        stderr_reader.daemon = True
+        stderr_reader.start()
+        stride = self._stored_stride
+        try:
+            with open(self._buffer_filename, 'wb') as data_buffer:
+                while True:
+                    chunk = self._proc.stdout.read(stride)
+                    if len(chunk) < stride:
+                        break
+                    if self._compress is not None:
+                        chunk = self._compress(chunk)
+                    data_buffer.write(chunk)
+                    data_buffer.flush()
+                    with self._condition:
+                        self._offsets.append(self._offsets[-1] + len(chunk))
+                        self._n_available += 1
+                        self._condition.notify_all()
+            self._proc.wait()
+            stderr_reader.join()
+            if self._closing:
+                return  # the partial buffer is removed by close()
+            if self._n_available == 0:
+                self._process_ffmpeg_stderr(b''.join(stderr))
+                raise IOError("No frames could be decoded from "
+                              "{0}".format(self.filename))
+            if self._proc.returncode != 0:
+                # do not mark the partial buffer as complete
+                message = b''.join(stderr).decode('utf-8', 'replace')
+                raise IOError("ffmpeg failed after decoding {0} frames of "
+                              "{1}:\n{2}".format(self._n_available,
+                                                 self.filename,
+                                                 message.strip()[-1000:]))
+            with self._condition:
+                self._len = self._n_available
+            self._write_meta()
+            self._complete = True
+            if self._cache_size_limit is not None:
+                _limit_cache_size(self._cache_dir, self._cache_size_limit,
+                                  self._cache_prefix)
+        except Exception as e:
+            self._error = e
+        finally:
+            for std in self._proc.stdout, self._proc.stderr:
+                std.close()
+            with self._condition:
+                if self._len is None:
+                    self._len = self._n_available
+                self._decoding = False
+                self._condition.notify_all()
+
+    def _wait_for_frame(self, j):
+        """Blocks until frame j is decoded, or decoding has finished."""
+        with self._condition:
+            while self._decoding and self._n_available <= j:
+                self._condition.wait()
+            if self._error is not None:
+                raise self._error
+            return self._n_available
 
     def _process_ffmpeg_stderr(self, stderr, verbose=False):
         if verbose:
             print(stderr)
 
-        lines = stderr.splitlines()
+        lines = stderr.decode('utf-8', 'replace').splitlines()
         if "No such file or directory" in lines[-1]:
             raise IOError("%s not found ! Wrong path ?" % self.filename)
 
         # get the output lines that describe the video
-        line = [l for l in lines if ' Video: ' in l][0]
+        try:
+            line = [l for l in lines if ' Video: ' in l][0]
+        except IndexError:
+            raise IOError("No video stream found in %s" % self.filename)
         # logic to parse all of the MD goes here
 
         # get the size, of the form 460x320 (w x h)
         match = re.search(" [0-9]*x[0-9]*(,| )", line)
-        self._size = map(int, line[match.start():match.end()-1].split('x'))
-        # this needs to be more robust
-        self._len = int(lines[-2].split()[1])
-        self.metafile.write('{0}\n'.format(self._len))
-        self.metafile.write('{0}\n'.format(self._size[0]))
-        self.metafile.write('{0}\n'.format(self._size[1]))
-        self.metafile.close()
+        self._size = list(map(int, line[match.start():match.end()-1].split('x')))
+
+        # store greyscale video as a single channel
+        source_pix_fmts = re.findall(r', ([0-9a-z]+)[,( ]', line)
+        if (self.pix_fmt == 'rgb24' and len(source_pix_fmts) > 0 and
+                source_pix_fmts[0] in _grey_pix_fmts):
+            self._stored_pix_fmt = 'gray'
+        else:
+            self._stored_pix_fmt = self.pix_fmt
+
+    @property
+    def _stored_shape(self):
+        w, h = self._size
+        depth = _pix_fmt_dict[self._stored_pix_fmt]
+        if depth == 1:
+            return (h, w)
+        return (h, w, depth)
+
+    @property
+    def _stored_stride(self):
+        return int(np.prod(self._stored_shape))
+
+    @property
+    def frames_available(self):
+        """The number of frames that are decoded and ready to be read."""
+        return self._n_available
 
     def __len__(self):
+        self._wait_for_frame(sys.maxsize)
         return self._len
 
+    def __getitem__(self, key):
+        # positive integer indexing does not need to wait for the length
+        if isinstance(key, numbers.Integral) and key >= 0:
+            return self.get_frame(key)
+        return super(FFmpegVideoReader, self).__getitem__(key)
+
+    def __iter__(self):
+        for j in itertools.count():
+            if self._wait_for_frame(j) <= j:
+                return
+            yield self.get_frame(j)
+
     @property
     def frame_shape(self):
-        return self._size
+        w, h = self._size
+        if self.depth == 1:
+            return (h, w)
+        return (h, w, self.depth)
 
     def get_frame(self, j):
-        self.data_buffer.seek(self._stride*j)
-        s = self.data_buffer.read(self._stride)
-        w, h = self._size
-        result = np.fromstring(s,
-            dtype='uint8').reshape((h, w, self.depth))
+        n_available = self._wait_for_frame(j)
+        if j >= n_available:
+            raise IndexError("out of bounds; length is {0}".format(n_available))
+        if self._decompress is None:
+            if self._mmap is None or j >= len(self._mmap):
+                # (re)map the buffer file: it is growing while decoding
+                self._mmap = np.memmap(self._buffer_filename, dtype=np.uint8,
+                                       mode='r', shape=(n_available,) +
+                                       self._stored_shape)
+            result = self._mmap[j]
+        else:
+            start, stop = self._offsets[j], self._offsets[j + 1]
+            if self._mmap is None or stop > len(self._mmap):
+                self._mmap = np.memmap(self._buffer_filename, dtype=np.uint8,
+                                       mode='r',
+                                       shape=(self._offsets[n_available],))
+            result = np.frombuffer(self._decompress(self._mmap[start:stop]),
+                                   dtype=np.uint8)
+            result = result.reshape(self._stored_shape)
+        if result.shape != self.frame_shape:
+            result = np.repeat(result[..., np.newaxis], self.depth, axis=-1)
         return Frame(result, frame_no=j)
 
+    def close(self):
+        self._closing = True
+        if self._proc is not None and self._proc.poll() is None:
+            self._proc.terminate()
+        if self._decoder is not None:
+            self._decoder.join()
+        self._mmap = None
+        if not self._complete:
+            # an interrupted or failed decoding leaves an unusable buffer
+            for filename in (self._buffer_filename, self._index_filename):
+                if os.path.isfile(filename):
+                    os.remove(filename)
+        super(FFmpegVideoReader, self).close()
+
     @property
     def pixel_type(self):
-        raise np.uint8
+        return np.uint8
 
     @classmethod
     def class_exts(cls):
@@ -236,11 +517,15 @@ class FFmpegVideoReader(FramesSequence):
 
     def __repr__(self):
         # May be overwritten by subclasses
+        if self._decoding:
+            count = '{0}+'.format(self._n_available)
+        else:
+            count = self._len
         return """<Frames>
 Source: {filename}
 Length: {count} frames
 Frame Shape: {frame_shape!r}
 Pixel Format: {pix_fmt}""".format(frame_shape=self.frame_shape,
-                                  count=len(self),
+                                  count=count,
                                   filename=self.filename,
                                   pix_fmt=self.pix_fmt)
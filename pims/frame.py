@@ -4,7 +4,7 @@ from __future__ import (absolute_import, division, print_function,
 from base64 import b64encode
 import six
 
-from numpy import ndarray, asarray
+from numpy import ndarray, asarray, linspace
 from pims.display import _scrollable_stack, _as_png, to_rgb
 
 
@@ -124,6 +124,11 @@ class Frame(ndarray):
             raise ValueError("No rich representation is available for "
                              "frames of shape {0}".format(shape))
 
+        # Limit the number of slices of a stack
+        if stack and shape[0] > MAX_STACK_DEPTH:
+            image = image[linspace(0, shape[0] - 1,
+                                      MAX_STACK_DEPTH).astype(int)]
+
         # Calculate display width
         if stack: # z, y, x[, c]
             frame_shape = shape[1:3]
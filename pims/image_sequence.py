@@ -2,17 +2,23 @@ from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
 import six
-from six.moves import map
+from six.moves import range
 import os
 import glob
 import fnmatch
 from warnings import warn
 import re
+import json
+import struct
+import threading
 import zipfile
+from collections import OrderedDict
 from io import BytesIO
 from functools import partial
+from multiprocessing.pool import ThreadPool
 
 import numpy as np
+from slicerator import key_to_indices
 
 import pims
 from pims.base_frames import FramesSequence, FramesSequenceND
@@ -32,6 +38,125 @@ except ImportError:
         except:
             imread = None
 
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+
+# PIL modes of which skimage.io.imread returns the same (extra) shape and dtype
+_pil_modes = {'L': ((), np.uint8), 'RGB': ((3,), np.uint8),
+              'RGBA': ((4,), np.uint8), 'I;16': ((), np.uint16),
+              'I;16B': ((), np.uint16), 'F': ((), np.float32)}
+
+
+def _split_path_spec(path_spec):
+    """Split a path_spec into a directory and a filename pattern. The
+    pattern is None if path_spec is a directory. Returns None if the files
+    may be in more than one directory."""
+    if os.path.isdir(path_spec):
+        return path_spec, None
+    directory, pattern = os.path.split(path_spec)
+    if glob.has_magic(directory):
+        return None
+    return directory, pattern
+
+
+def _list_files(directory, pattern=None):
+    """List the paths in a directory that match a glob pattern, without
+    sorting. Like glob.glob, hidden files only match patterns that start
+    with a dot."""
+    if pattern is not None and not glob.has_magic(pattern):
+        path = os.path.join(directory, pattern)
+        return [path] if os.path.lexists(path) else []
+    if scandir is not None:
+        names = (entry.name for entry in scandir(directory or os.curdir))
+    else:
+        names = os.listdir(directory or os.curdir)
+    if pattern is not None:
+        match = re.compile(fnmatch.translate(os.path.normcase(pattern))).match
+        include_hidden = pattern.startswith('.')
+        names = (name for name in names
+                 if match(os.path.normcase(name)) and
+                 (include_hidden or not name.startswith('.')))
+    return [os.path.join(directory, name) for name in names]
+
+
+def _find_files(path_spec, exclude=None):
+    """Find the files matching a path_spec: a directory or a glob pattern.
+    The result is not sorted. A file named `exclude` is left out when
+    listing a complete directory."""
+    split = _split_path_spec(path_spec)
+    if split is None:
+        return glob.glob(path_spec)
+    directory, pattern = split
+    if pattern is not None:
+        return _list_files(directory, pattern)
+    warn("Loading ALL files in this directory. To ignore extraneous "
+         "files, use a pattern like 'path/to/images/*.png'",
+         UserWarning)
+    filepaths = [os.path.abspath(path) for path in _list_files(directory)]
+    if exclude is not None:
+        exclude = os.path.abspath(exclude)
+        filepaths = [path for path in filepaths if path != exclude]
+    return filepaths
+
+
+def _npy_view(buf, start, stop):
+    """Return the .npy array stored in buf[start:stop] as a view, or None if
+    the array cannot be viewed directly."""
+    header = BytesIO(bytes(buf[start:min(stop, start + 65536)]))
+    try:
+        version = np.lib.format.read_magic(header)
+        if version == (1, 0):
+            shape, fortran_order, dtype = \
+                np.lib.format.read_array_header_1_0(header)
+        else:
+            shape, fortran_order, dtype = \
+                np.lib.format.read_array_header_2_0(header)
+    except ValueError:
+        return None
+    offset = start + header.tell()
+    if (dtype.hasobject or
+            offset + int(np.prod(shape)) * dtype.itemsize > stop):
+        return None
+    order = 'F' if fortran_order else 'C'
+    return np.ndarray(shape, dtype=dtype, buffer=buf, offset=offset,
+                      order=order)
+
+
+def _read_manifest(filename, path_spec, directory, plugin):
+    """Return the manifest stored in `filename` if it was made for the same
+    files and the directory did not change since, else None."""
+    try:
+        with open(filename, 'r') as f:
+            manifest = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    if (manifest.get('path_spec') != os.path.abspath(path_spec) or
+            manifest.get('plugin') != plugin or
+            manifest.get('mtime') != os.stat(directory or os.curdir).st_mtime):
+        return None
+    return manifest
+
+
+def _write_manifest(filename, path_spec, directory, plugin, filepaths,
+                    shape, dtype):
+    with open(filename, 'w') as f:
+        # the directory mtime changes when the manifest is created in it
+        mtime = os.stat(directory or os.curdir).st_mtime
+        json.dump(dict(path_spec=os.path.abspath(path_spec), plugin=plugin,
+                       mtime=mtime, filepaths=list(filepaths),
+                       shape=list(shape), dtype=np.dtype(dtype).str), f)
+
 
 class ImageSequence(FramesSequence):
     """Read a directory of sequentially numbered image files into an
@@ -56,6 +181,16 @@ class ImageSequence(FramesSequence):
         Passed on to skimage.io.imread if scikit-image is available.
         If scikit-image is not available, this will be ignored and a warning
         will be issued. Not available in combination with zipfiles.
+    workers : int, optional
+        Number of threads that read images. When given, the next images are
+        read in the background while the sequence is accessed sequentially
+        or through a batch such as ``seq[[1, 5, 7]]`` or ``seq[::10]``.
+        Default None (images are read on request only).
+    manifest : string, optional
+        Filename of a manifest in which the list of files and the shape and
+        dtype of the images are stored. It is reused as long as the
+        modification time of the directory does not change. Only used when
+        all files are in a single directory. Default None.
 
     Examples
     --------
@@ -76,7 +211,7 @@ class ImageSequence(FramesSequence):
     >>> frame_count = len(video) # Number of frames in video
     >>> frame_shape = video.frame_shape # Pixel dimensions of video
     """
-    def __init__(self, path_spec, plugin=None):
+    def __init__(self, path_spec, plugin=None, workers=None, manifest=None):
         try:
             import skimage
         except ImportError:
@@ -91,31 +226,184 @@ class ImageSequence(FramesSequence):
 
         self._is_zipfile = False
         self._zipfile = None
+        self._pool = None
+        self._manifest = manifest
+        self._manifest_directory = None
+        self._first_frame_shape = None
         self._get_files(path_spec)
 
-        tmp = self.imread(self._filepaths[0], **self.kwargs)
-        self._first_frame_shape = tmp.shape
-        self._dtype = tmp.dtype
+        if self._first_frame_shape is None:
+            header = self._read_header(self._filepaths[0])
+            if header is None:
+                tmp = self.imread(self._filepaths[0], **self.kwargs)
+                header = tmp.shape, tmp.dtype
+            self._first_frame_shape, self._dtype = header
+            if self._manifest_directory is not None:
+                _write_manifest(manifest, path_spec, self._manifest_directory,
+                                self.kwargs.get('plugin'), self._filepaths,
+                                self._first_frame_shape, self._dtype)
+
+        if workers:
+            self._pool = ThreadPool(workers)
+            self._prefetch_depth = 2 * workers
+            self._prefetched = dict()
+            self._prefetch_lock = threading.Lock()
+            self._plan = range(0)
+            self._plan_pos = 0
+            self._last_read = -1
 
     def close(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
         if self._is_zipfile:
             self._zipfile.close()
+            with self._zip_lock:
+                for handle in self._zip_handles:
+                    handle.close()
+                self._zip_handles = []
+            self._zip_buffer = None
         super(ImageSequence, self).close()
 
+    def __getitem__(self, key):
+        if self._pool is not None:
+            indices, length = key_to_indices(key, len(self))
+            if length is not None:
+                self._read_ahead(indices)
+        return super(ImageSequence, self).__getitem__(key)
+
+    def _read_ahead(self, indices):
+        """Plan the files to read in the background for a batch of frames,
+        such as seq[[1, 5, 7]] or seq[::10]."""
+        if not isinstance(indices, range):
+            indices = list(indices)
+        with self._prefetch_lock:
+            self._plan = indices
+            self._plan_pos = 0
+            self._prefetch()
+
+    def _prefetch(self):
+        """Keep the next files of the plan submitted to the workers. The lock
+        has to be held."""
+        stop = min(self._plan_pos + self._prefetch_depth, len(self._plan))
+        # by index, as xrange cannot be sliced on Python 2
+        ahead = [self._plan[k] for k in range(self._plan_pos, stop)]
+        for k in list(self._prefetched):
+            if k not in ahead:
+                del self._prefetched[k]
+        for k in ahead:
+            if k not in self._prefetched:
+                self._prefetched[k] = self._pool.apply_async(
+                    self.imread, (self._filepaths[k],), self.kwargs)
+
+    def _read_file(self, i):
+        """Read the i-th file. When reading with workers, the next files of a
+        batch, or of a sequential access, are read in the background."""
+        if self._pool is None:
+            return self.imread(self._filepaths[i], **self.kwargs)
+        with self._prefetch_lock:
+            result = self._prefetched.pop(i, None)
+            if (self._plan_pos < len(self._plan) and
+                    self._plan[self._plan_pos] == i):
+                self._plan_pos += 1
+            elif i == self._last_read + 1:
+                self._plan = range(i + 1, len(self._filepaths))
+                self._plan_pos = 0
+            else:
+                self._plan = range(0)
+                self._plan_pos = 0
+            self._last_read = i
+            self._prefetch()
+        if result is None:
+            return self.imread(self._filepaths[i], **self.kwargs)
+        return result.get()
+
     def __del__(self):
         self.close()
 
     def imread(self, filename, **kwargs):
+        if self._is_zipfile and filename.lower().endswith('.npy'):
+            return self._read_zip_member_npy(filename)
         if imread is None:
             raise ImportError("One of the following packages are required for "
                               "using the ImageSequence reader: "
                               "scipy, matplotlib or scikit-image.")
         if self._is_zipfile:
-            file_handle = BytesIO(self._zipfile.read(filename))
+            file_handle = BytesIO(self._read_zip_member(filename))
             return imread(file_handle, **kwargs)
         else:
             return imread(filename, **kwargs)
 
+    def _zip_member_location(self, filename):
+        """Return the (start, stop) offsets of a member that is stored
+        without compression in the zipfile, or None."""
+        try:
+            return self._zip_locations[filename]
+        except KeyError:
+            pass
+        info = self._zipfile.getinfo(filename)
+        location = None
+        if (info.compress_type == zipfile.ZIP_STORED and
+                not info.flag_bits & 0x1):  # not encrypted
+            start = info.header_offset
+            header = bytes(self._zip_buffer[start:start + 30])
+            if header[:4] == b'PK\x03\x04':
+                name_length, extra_length = struct.unpack('<HH', header[26:])
+                start += 30 + name_length + extra_length
+                location = (start, start + info.file_size)
+        self._zip_locations[filename] = location
+        return location
+
+    def _thread_zipfile(self):
+        """Return a ZipFile handle for use in the current thread."""
+        handle = getattr(self._zip_local, 'zipfile', None)
+        if handle is None:
+            handle = zipfile.ZipFile(self.pathname, 'r')
+            self._zip_local.zipfile = handle
+            with self._zip_lock:
+                self._zip_handles.append(handle)
+        return handle
+
+    def _read_zip_member(self, filename):
+        """Return the contents of a member of the zipfile. Members that are
+        stored without compression are served from a memory map."""
+        location = self._zip_member_location(filename)
+        if location is None:
+            return self._thread_zipfile().read(filename)
+        start, stop = location
+        return self._zip_buffer[start:stop]
+
+    def _read_zip_member_npy(self, filename):
+        location = self._zip_member_location(filename)
+        if location is not None:
+            result = _npy_view(self._zip_buffer, *location)
+            if result is not None:
+                # a copy, so that editing the frame does not change later
+                # reads, like the decoded members
+                return np.array(result)
+        return np.load(BytesIO(self._read_zip_member(filename)))
+
+    def _read_header(self, filename):
+        """Read the shape and dtype of an image from its header, without
+        decoding it. Returns None when the result of imread is unknown."""
+        if (Image is None or imread is None or self._is_zipfile or
+                not imread.__module__.startswith('skimage') or
+                self.kwargs.get('plugin') not in (None, 'pil', 'imageio') or
+                six.get_unbound_function(type(self).imread) is not
+                six.get_unbound_function(ImageSequence.imread)):
+            return None
+        try:
+            im = Image.open(filename)
+        except IOError:
+            return None
+        try:
+            if getattr(im, 'n_frames', 1) != 1 or im.mode not in _pil_modes:
+                return None
+            extra_shape, dtype = _pil_modes[im.mode]
+            return (im.size[1], im.size[0]) + extra_shape, np.dtype(dtype)
+        finally:
+            im.close()
+
     def _get_files(self, path_spec):
         # deal with if input is _not_ a string
         if not isinstance(path_spec, six.string_types):
@@ -128,6 +416,11 @@ class ImageSequence(FramesSequence):
             self._is_zipfile = True
             self.pathname = os.path.abspath(path_spec)
             self._zipfile = zipfile.ZipFile(path_spec, 'r')
+            self._zip_buffer = np.memmap(path_spec, dtype=np.uint8, mode='r')
+            self._zip_locations = dict()
+            self._zip_local = threading.local()
+            self._zip_lock = threading.Lock()
+            self._zip_handles = []
             filepaths = [fn for fn in self._zipfile.namelist()
                          if fnmatch.fnmatch(fn, '*.*')]
             self._filepaths = sorted(filepaths, key=natural_keys)
@@ -138,17 +431,18 @@ class ImageSequence(FramesSequence):
             return
 
         self.pathname = os.path.abspath(path_spec)  # used by __repr__
-        if os.path.isdir(path_spec):
-            warn("Loading ALL files in this directory. To ignore extraneous "
-                 "files, use a pattern like 'path/to/images/*.png'",
-                 UserWarning)
-            directory = path_spec
-            filenames = os.listdir(directory)
-            make_full_path = lambda filename: (
-                os.path.abspath(os.path.join(directory, filename)))
-            filepaths = list(map(make_full_path, filenames))
-        else:
-            filepaths = glob.glob(path_spec)
+        split = _split_path_spec(path_spec)
+        if split is not None and self._manifest is not None:
+            manifest = _read_manifest(self._manifest, path_spec, split[0],
+                                      self.kwargs.get('plugin'))
+            if manifest is not None:
+                self._filepaths = manifest['filepaths']
+                self._count = len(self._filepaths)
+                self._first_frame_shape = tuple(manifest['shape'])
+                self._dtype = np.dtype(manifest['dtype'])
+                return
+            self._manifest_directory = split[0]
+        filepaths = _find_files(path_spec, exclude=self._manifest)
         self._filepaths = sorted(filepaths, key=natural_keys)
         self._count = len(self._filepaths)
 
@@ -159,7 +453,7 @@ class ImageSequence(FramesSequence):
     def get_frame(self, j):
         if j > self._count:
             raise ValueError("File does not contain this many frames")
-        res = self.imread(self._filepaths[j], **self.kwargs)
+        res = self._read_file(j)
         return Frame(res, frame_no=j)
 
     def __len__(self):
@@ -206,9 +500,17 @@ def filename_to_indices(filename, identifiers='tzc'):
         axis indices. Elements default to 0 when index was not found.
 
     """
+    return _filename_to_indices(filename, identifiers,
+                                _indices_regex(identifiers))
+
+
+def _indices_regex(identifiers):
     escaped = [re.escape(a) for a in identifiers]
-    axes = re.findall('(' + '|'.join(escaped) + r')(\d+)',
-                            filename)
+    return re.compile('(' + '|'.join(escaped) + r')(\d+)')
+
+
+def _filename_to_indices(filename, identifiers, regex):
+    axes = regex.findall(filename)
     if len(axes) > len(identifiers):
         axes = axes[-3:]
     order = [a[0] for a in axes]
@@ -235,11 +537,17 @@ class ReaderSequence(FramesSequenceND):
         identifier such as: 'file_t001c05z32'.
     axis_name : string, optional
         The name of the added axis. Default 't'.
+    reader_pool_size : int, optional
+        Maximum number of files that are kept open. The least recently used
+        reader is closed when another file is opened. Default 4.
     """
-    def __init__(self, path_spec, reader_cls=None, axis_name='t', **kwargs):
+    def __init__(self, path_spec, reader_cls=None, axis_name='t',
+                 reader_pool_size=4, **kwargs):
         FramesSequenceND.__init__(self)
 
         self.kwargs = kwargs
+        self._reader_pool = OrderedDict()
+        self._reader_pool_size = max(reader_pool_size, 1)
         if reader_cls is None:
             self.reader_cls = pims.open
         else:
@@ -277,22 +585,44 @@ class ReaderSequence(FramesSequenceND):
         self._bundle_axes = value
         self._get_frame_wrapped = self._get_seq_frame
 
-    def _get_seq_frame(self, **coords):
-        i = coords.pop(self._imseq_axis)
-        with self.reader_cls(self._filepaths[i], **self.kwargs) as reader:
+    def _get_reader(self, i):
+        """Return an open reader of the i-th file, with bundle_axes set.
+        Readers are kept open in a pool of limited size."""
+        try:
+            reader = self._reader_pool.pop(i)
+        except KeyError:
+            reader = self.reader_cls(self._filepaths[i], **self.kwargs)
             # check whether the reader has the expected shape
             for ax in self.sizes:
                 if ax == self._imseq_axis:
                     continue
                 if ax not in reader.sizes:
+                    reader.close()
                     raise RuntimeError('{} does not have '
                                        'axis {}'.format(self._filepaths[i], ax))
                 if reader.sizes[ax] != self.sizes[ax]:
+                    reader.close()
                     raise RuntimeError('In {}, the size of axis {} was unexpect'
                                        'ed'.format(self._filepaths[i], ax))
+            while len(self._reader_pool) >= self._reader_pool_size:
+                _, lru_reader = self._reader_pool.popitem(last=False)
+                lru_reader.close()
+        self._reader_pool[i] = reader  # most recently used is last
+        # only set bundle_axes when it changed, as this plans the reading
+        if (reader._get_frame_wrapped is None or
+                reader.bundle_axes != self.bundle_axes):
             reader.bundle_axes = self.bundle_axes
-            result = reader._get_frame_wrapped(**coords)
-        return result
+        return reader
+
+    def _get_seq_frame(self, **coords):
+        i = coords.pop(self._imseq_axis)
+        return self._get_reader(i)._get_frame_wrapped(**coords)
+
+    def close(self):
+        while self._reader_pool:
+            _, reader = self._reader_pool.popitem()
+            reader.close()
+        super(ReaderSequence, self).close()
 
     @property
     def pixel_type(self):
@@ -332,17 +662,7 @@ class ReaderSequence(FramesSequenceND):
             return
 
         self.pathname = os.path.abspath(path_spec)  # used by __repr__
-        if os.path.isdir(path_spec):
-            warn("Loading ALL files in this directory. To ignore extraneous "
-                 "files, use a pattern like 'path/to/images/*.png'",
-                 UserWarning)
-            directory = path_spec
-            filenames = os.listdir(directory)
-            make_full_path = lambda filename: (
-                os.path.abspath(os.path.join(directory, filename)))
-            filepaths = list(map(make_full_path, filenames))
-        else:
-            filepaths = glob.glob(path_spec)
+        filepaths = _find_files(path_spec)
         self._filepaths = sorted(filepaths, key=natural_keys)
         self._count = len(self._filepaths)
 
@@ -379,6 +699,13 @@ class ImageSequenceND(FramesSequenceND, ImageSequence):
     axes_identifiers : iterable of strings, optional
         N strings preceding axes indices. Default 'tzc'. x and y are not
         allowed. c is not allowed when images are RGB.
+    workers : int, optional
+        Number of threads that read images. When given, the next images are
+        read in the background while the files are accessed in order.
+        Default None (images are read on request only).
+    manifest : string, optional
+        Filename of a manifest in which the list of files and the shape and
+        dtype of the images are stored. See ImageSequence.
 
     Attributes
     ----------
@@ -407,36 +734,32 @@ class ImageSequenceND(FramesSequenceND, ImageSequence):
         Applicable to RGB images. Signifies the position of the rgb axis in
         the input image. True when color data is stored in the last dimension.
     """
-    def __init__(self, path_spec, plugin=None, axes_identifiers='tzc'):
+    def __init__(self, path_spec, plugin=None, axes_identifiers='tzc',
+                 workers=None, manifest=None):
         FramesSequenceND.__init__(self)
         if 'x' in axes_identifiers:
             raise ValueError("Axis 'x' is reserved")
         if 'y' in axes_identifiers:
             raise ValueError("Axis 'y' is reserved")
         self.axes_identifiers = axes_identifiers
-        ImageSequence.__init__(self, path_spec, plugin)
+        ImageSequence.__init__(self, path_spec, plugin, workers, manifest)
         shape = self._first_frame_shape
         if len(shape) == 2:
-            self._init_axis('y', shape[0])
-            self._init_axis('x', shape[1])
-            self._register_get_frame(self.get_frame_2D, 'yx')
+            self._image_axes = ['y', 'x']
             self.is_rgb = False
         elif len(shape) == 3 and shape[2] in [3, 4]:
-            self._init_axis('y', shape[0])
-            self._init_axis('x', shape[1])
-            self._init_axis('c', shape[2])
-            self._register_get_frame(self.get_frame_2D, 'yxc')
+            self._image_axes = ['y', 'x', 'c']
             self.is_rgb = True
             self.is_interleaved = True
         elif len(shape) == 3:
-            self._init_axis('c', shape[0])
-            self._init_axis('y', shape[1])
-            self._init_axis('x', shape[2])
-            self._register_get_frame(self.get_frame_2D, 'cyx')
+            self._image_axes = ['c', 'y', 'x']
             self.is_rgb = True
             self.is_interleaved = False
         else:
             raise IOError("Could not interpret image shape.")
+        for name, size in zip(self._image_axes, shape):
+            self._init_axis(name, size)
+        self._register_get_frame(self.get_frame_2D, self._image_axes)
 
         if self.is_rgb and 'c' in self.axes_identifiers:
             raise ValueError("Axis identifier 'c' is reserved when "
@@ -449,28 +772,90 @@ class ImageSequenceND(FramesSequenceND, ImageSequence):
 
     def _get_files(self, path_spec):
         super(ImageSequenceND, self)._get_files(path_spec)
-        self._toc = np.array([filename_to_indices(f, self.axes_identifiers)
-                              for f in self._filepaths])
+        regex = _indices_regex(self.axes_identifiers)
+        toc = np.array([_filename_to_indices(f, self.axes_identifiers, regex)
+                        for f in self._filepaths], dtype=np.intp)
+        toc = toc.reshape((len(self._filepaths), len(self.axes_identifiers)))
+        self._toc_axes = []
+        columns = []
         for n, name in enumerate(self.axes_identifiers):
-            if np.all(self._toc[:, n] == 0):
-                self._toc = np.delete(self._toc, n, axis=1)
-            else:
-                self._toc[:, n] = self._toc[:, n] - min(self._toc[:, n])
-                self._init_axis(name, max(self._toc[:, n]) + 1)
+            if np.all(toc[:, n] == 0):
+                continue
+            column = toc[:, n] - toc[:, n].min()
+            self._init_axis(name, column.max() + 1)
+            self._toc_axes.append(name)
+            columns.append(column)
+        self._toc = np.array(columns, dtype=np.intp).T
+        self._toc = self._toc.reshape((len(self._filepaths),
+                                       len(self._toc_axes)))
         self._filepaths = np.array(self._filepaths)
 
+        # dense lookup of the file index at each coordinate, -1 if missing
+        shape = tuple(self._sizes[name] for name in self._toc_axes)
+        self._lookup = np.full(shape, -1, dtype=np.intp)
+        self._lookup[tuple(self._toc.T)] = np.arange(len(self._filepaths))
+        n_missing = np.sum(self._lookup < 0)
+        if n_missing > 0:
+            warn("No files were found for {0} of the {1} combinations of "
+                 "the indices {2}.".format(n_missing, self._lookup.size,
+                                           ''.join(self._toc_axes)))
+
+    def _file_index(self, **ind):
+        i = self._lookup[tuple(ind[name] for name in self._toc_axes)]
+        if i < 0:
+            raise IndexError("No file was found for coordinates {0}".format(
+                {name: int(ind[name]) for name in self._toc_axes}))
+        return i
+
     def get_frame(self, i):
         frame = super(ImageSequenceND, self).get_frame(i)
         return Frame(frame, frame_no=i)
 
     def get_frame_2D(self, **ind):
-        if self.is_rgb:
-            c = ind['c']
-            row = [ind[name] for name in self.axes_identifiers if name != 'c']
+        return self._read_file(self._file_index(**ind))
+
+    def _read_ahead(self, indices):
+        # frame indices do not map one-to-one to files: files of a frame
+        # are read at once in _get_frame_files instead
+        pass
+
+    def _get_frame_files(self, file_axes, **ind):
+        """Read the images along file_axes at once, through the pool of
+        workers if available. Returns an array with axes file_axes followed
+        by the image axes."""
+        key = tuple(slice(None) if name in file_axes else ind[name]
+                    for name in self._toc_axes)
+        indices = self._lookup[key]
+        if np.any(indices < 0):
+            raise IndexError("Not all files were found for coordinates "
+                             "{0}".format({name: int(ind[name]) for name
+                                           in self._toc_axes
+                                           if name not in file_axes}))
+        filepaths = self._filepaths[indices.ravel()]
+        if self._pool is not None:
+            images = self._pool.map(partial(self.imread, **self.kwargs),
+                                    filepaths)
         else:
-            row = [ind[name] for name in self.axes_identifiers]
-        i = np.argwhere(np.all(self._toc == row, 1))[0, 0]
-        return self.imread(self._filepaths[i], **self.kwargs)
+            images = [self.imread(fn, **self.kwargs) for fn in filepaths]
+        result = np.array(images).reshape(indices.shape +
+                                          self._first_frame_shape)
+        # transpose from the order of _toc_axes to the order of file_axes
+        toc_order = [name for name in self._toc_axes if name in file_axes]
+        n_image_axes = len(self._first_frame_shape)
+        order = [toc_order.index(name) for name in file_axes]
+        order += list(range(len(file_axes), len(file_axes) + n_image_axes))
+        return result.transpose(order)
+
+    @FramesSequenceND.bundle_axes.setter
+    def bundle_axes(self, value):
+        value = list(value)
+        file_axes = [name for name in value if name in self._toc_axes]
+        if len(file_axes) > 0:
+            # register a reader that reads the bundled files at once
+            self._register_get_frame(partial(self._get_frame_files,
+                                             file_axes),
+                                     file_axes + self._image_axes)
+        FramesSequenceND.bundle_axes.fset(self, value)
 
     def __repr__(self):
         try:
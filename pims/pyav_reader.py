@@ -3,6 +3,8 @@ from __future__ import (absolute_import, division, print_function,
 
 import six
 import re
+import itertools
+import multiprocessing
 
 import numpy as np
 
@@ -18,6 +20,10 @@ except ImportError:
     av = None
 
 
+# size of the segments that are decoded in parallel
+SEGMENT_BYTES = 2**26
+
+
 def available():
     return av is not None
 
@@ -67,6 +73,63 @@ def _gen_frames(demuxer, time_base, frame_rate=1., first_pts=0):
                                 metadata=dict(timestamp=timestamp, t=float(t)))
 
 
+def _keyframe_numbers(filename, stream_index, first_pts, frame_rate):
+    """Demux (without decoding) a video stream and list the frame numbers of
+    its keyframes, as they would be computed by PyAVReaderTimed."""
+    container = av.open(filename)
+    try:
+        stream = container.streams.video[stream_index]
+        time_base = stream.time_base
+        result = set([0])
+        for packet in container.demux(stream):
+            if packet.pts is None or not packet.is_keyframe:
+                continue
+            i = int((packet.pts - first_pts) * time_base * frame_rate)
+            result.add(max(i, 0))
+    finally:
+        container.close()
+    return np.array(sorted(result), dtype=np.int64)
+
+
+def _decode_segment(filename, stream_index, start, stop, out_spec=None):
+    """Decode the frames with frame numbers in [start, stop) in a separate
+    container. Used by `PyAVReaderTimed.iter_parallel` as process pool task.
+
+    If `out_spec` is given as (filename, dtype, shape, offset), the frames are
+    written into that memory-mapped file and only their metadata is returned.
+    """
+    reader = PyAVReaderTimed(filename, cache_size=1, stream_index=stream_index)
+    try:
+        if out_spec is not None:
+            out = np.memmap(out_spec[0], dtype=out_spec[1], mode='r+',
+                            shape=out_spec[2], offset=out_spec[3])
+        # also at 0: the reader has already decoded the first frame
+        first = reader.seek(start)
+        # after seeking, which may have reset the demuxer and the generator
+        frames = reader._frame_generator
+        if first is not None:
+            frames = itertools.chain([first], frames)
+
+        result = []
+        for frame in frames:
+            if stop is not None and frame.frame_no >= stop:
+                break
+            elif frame.frame_no < start:
+                continue
+            arr = _to_nd_array(frame.frame)
+            if out_spec is None:
+                result.append((frame.frame_no, arr.copy(), frame.metadata))
+            elif frame.frame_no < len(out):
+                out[frame.frame_no] = arr
+                result.append((frame.frame_no, None, frame.metadata))
+        if out_spec is not None:
+            out.flush()
+            del out
+    finally:
+        reader.close()
+    return result
+
+
 class PyAVReaderTimed(FramesSequence):
     """Read images from a video file via a direct FFmpeg/AVbin interface.
 
@@ -119,6 +182,7 @@ class PyAVReaderTimed(FramesSequence):
             raise IOError("No valid video stream found in {}".format(filename))
 
         self._stream = self._container.streams.video[stream_index]
+        self._stream_index = stream_index
 
         try:
             self._duration = self._stream.duration * self._stream.time_base
@@ -132,7 +196,7 @@ class PyAVReaderTimed(FramesSequence):
         self._cache = [None] * cache_size
         self._fast_forward_thresh = fast_forward_thresh
 
-        demuxer = self._container.demux(streams=self._stream)
+        demuxer = self._container.demux(self._stream)
 
         # obtain first frame to get first time point
         # also tests for the presence of timestamps
@@ -150,7 +214,7 @@ class PyAVReaderTimed(FramesSequence):
         return int(self._duration * self._frame_rate)
 
     def _reset_demuxer(self):
-        demuxer = self._container.demux(streams=self._stream)
+        demuxer = self._container.demux(self._stream)
         self._frame_generator = _gen_frames(demuxer, self._stream.time_base,
                                             self._frame_rate, self._first_pts)
 
@@ -229,7 +293,11 @@ class PyAVReaderTimed(FramesSequence):
         # the ffmpeg decode cache is flushed automatically
 
         timestamp = int(i / (self._frame_rate * self._stream.time_base))
-        self._stream.seek(timestamp + self._first_pts)
+        if hasattr(self._stream, 'seek'):
+            self._stream.seek(timestamp + self._first_pts)
+        else:  # PyAV >= 0.5 seeks through the container
+            self._container.seek(timestamp + self._first_pts,
+                                 stream=self._stream)
 
         # check the first frame
         try:
@@ -253,10 +321,108 @@ class PyAVReaderTimed(FramesSequence):
         self._last_frame = frame.frame_no
         return frame
 
+    def _segments(self, segment_length):
+        """Split the video in keyframe-aligned (start, stop) frame number
+        ranges that start at the first keyframe at least `segment_length`
+        frames after the previous start. The last stop is None."""
+        keyframes = _keyframe_numbers(self.filename, self._stream_index,
+                                      self._first_pts, self._frame_rate)
+        bounds = [0]
+        for keyframe in keyframes.tolist():
+            if keyframe - bounds[-1] >= segment_length:
+                bounds.append(keyframe)
+        return list(zip(bounds, bounds[1:] + [None]))
+
+    def _iter_segments(self, processes=None, out_spec=None):
+        """Decode the video in keyframe-aligned segments in parallel worker
+        processes and yield the segment results in order. Segments hold
+        about SEGMENT_BYTES of frames (and at least a keyframe interval), and
+        at most two segments per process are kept in flight, so that memory
+        usage does not grow with the length of the video."""
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        frame_bytes = int(np.prod(self.frame_shape))
+        # split short videos as well, in 4 segments per process
+        segment_length = min(max(SEGMENT_BYTES // frame_bytes, 1),
+                             -(-len(self) // (4 * processes)))
+        segments = self._segments(segment_length)
+        pool = multiprocessing.Pool(processes)
+        try:
+            pending = []
+            for start, stop in segments:
+                pending.append(pool.apply_async(
+                    _decode_segment, (self.filename, self._stream_index,
+                                      start, stop, out_spec)))
+                if len(pending) >= 2 * processes:
+                    yield pending.pop(0).get()
+            for task in pending:
+                yield task.get()
+        finally:
+            pool.terminate()
+
+    def iter_parallel(self, processes=None):
+        """Iterate over all frames in the video, decoding keyframe-aligned
+        segments of the video concurrently in separate processes.
+
+        Frames are yielded in order. In contrast to normal iteration, missing
+        frames are not filled in.
+
+        Parameters
+        ----------
+        processes : integer, optional
+            Number of worker processes. Defaults to the number of CPUs.
+        """
+        length = len(self)
+        for segment in self._iter_segments(processes):
+            for frame_no, arr, metadata in segment:
+                if frame_no < length:
+                    yield Frame(arr, frame_no=frame_no, metadata=metadata)
+
+    def read_parallel(self, out=None, processes=None):
+        """Read all frames of the video into one array, decoding
+        keyframe-aligned segments of the video concurrently in separate
+        processes.
+
+        Parameters
+        ----------
+        out : ndarray, optional
+            Array of shape (len(self),) + frame_shape and dtype uint8. When
+            this is a numpy.memmap, the worker processes write directly into
+            the memory-mapped file. Missing frames are left untouched.
+        processes : integer, optional
+            Number of worker processes. Defaults to the number of CPUs.
+
+        Returns
+        -------
+        out : ndarray
+        """
+        shape = (len(self),) + self.frame_shape
+        if out is None:
+            out = np.zeros(shape, dtype=self.pixel_type)
+        elif out.shape != shape:
+            raise ValueError("out should have shape {}".format(shape))
+
+        if isinstance(out, np.memmap) and out.filename is not None:
+            out.flush()
+            out_spec = (out.filename, out.dtype.str, out.shape, out.offset)
+            for _ in self._iter_segments(processes, out_spec):
+                pass
+        else:
+            for segment in self._iter_segments(processes):
+                for frame_no, arr, metadata in segment:
+                    if frame_no < len(out):
+                        out[frame_no] = arr
+        return out
+
     @property
     def pixel_type(self):
         return np.uint8
 
+    def close(self):
+        self._frame_generator = None
+        self._container.close()
+        super(PyAVReaderTimed, self).close()
+
     def __repr__(self):
         # May be overwritten by subclasses
         return """<Frames>
@@ -7,8 +7,11 @@ from __future__ import (absolute_import, division, print_function,
 import six
 
 import os
+import shutil
+import tempfile
 import unittest
 import nose
+from multiprocessing.pool import ThreadPool
 import numpy as np
 from numpy.testing import (assert_equal, assert_almost_equal, assert_allclose)
 
@@ -64,6 +67,18 @@ class _image_single(object):
         # simple smoke test, values not checked
         repr(self.v)
 
+    def test_region(self):
+        self.check_skip()
+        full = self.v[0]
+        self.v.region = (2, 3, 10, 5)
+        assert_equal(self.v.sizes['x'], 10)
+        assert_equal(self.v.sizes['y'], 5)
+        index = tuple({'y': slice(3, 8), 'x': slice(2, 12)}.get(ax, slice(None))
+                      for ax in self.v.bundle_axes)
+        assert_image_equal(self.v[0], full[index])
+        self.v.region = None
+        assert_equal(self.v.frame_shape, full.shape)
+
 
 class _image_series(_image_single):
     def test_iterator(self):
@@ -102,6 +117,20 @@ class _image_series(_image_single):
         self.v[-1]
         list(self.v[[0, -1]])
 
+    def test_reader_pool(self):
+        self.check_skip()
+        self.v.close()
+        self.v = self.klass(self.filename, reader_pool_size=2, **self.kwargs)
+        indices = list(range(min(len(self.v), 4))) * 2
+        expected = [self.v[i] for i in indices]
+        pool = ThreadPool(4)
+        try:
+            actual = pool.map(self.v.get_frame, indices)
+        finally:
+            pool.terminate()
+        for frame_actual, frame_expected in zip(actual, expected):
+            assert_image_equal(frame_actual, frame_expected)
+
 
 class _image_stack(object):
     def check_skip(self):
@@ -115,6 +144,15 @@ class _image_stack(object):
         self.check_skip()
         assert_equal(self.v.sizes['z'], self.expected_Z)
 
+    def test_stack_matches_planes(self):
+        self.check_skip()
+        self.v.bundle_axes = 'zyx'
+        stack = self.v[0]
+        self.v.bundle_axes = 'yx'
+        self.v.iter_axes = 'z'
+        for z in [0, self.expected_Z - 1]:
+            assert_image_equal(stack[z], self.v[z])
+
 
 class _image_multichannel(object):
     def check_skip(self):
@@ -159,6 +197,48 @@ class TestBioformatsTiff(_image_series, unittest.TestCase):
         self.v.close()
 
 
+class TestBioformatsMemo(unittest.TestCase):
+    def setUp(self):
+        _skip_if_no_bioformats()
+        self.filename = os.path.join(path, 'stuck.tif')
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def _memo_files(self):
+        result = []
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            result.extend(os.path.join(dirpath, fn) for fn in filenames
+                          if fn.endswith('.bfmemo'))
+        return result
+
+    def test_memo_in_cache_dir(self):
+        v = pims.Bioformats(self.filename, meta=False,
+                            cache_dir=self.cache_dir)
+        frame = v[1]
+        v.close()
+        memo_dir = pims.bioformats._memo_directory(self.cache_dir,
+                                                   self.filename)
+        # one directory per file, named after the file
+        file_dir = os.path.dirname(memo_dir)
+        assert_equal(os.listdir(self.cache_dir), [os.path.basename(file_dir)])
+        self.assertTrue(file_dir.endswith('_stuck.tif'))
+        memo_files = self._memo_files()
+        assert_equal(len(memo_files), 1)
+        self.assertTrue(memo_files[0].startswith(memo_dir + os.sep))
+
+        # the second opening is restored from the memo file
+        mtime = os.path.getmtime(memo_files[0])
+        v = pims.Bioformats(self.filename, meta=False,
+                            cache_dir=self.cache_dir)
+        self.assertTrue(v.rdr.isLoadedFromMemo())
+        assert_image_equal(v[1], frame)
+        v.close()
+        assert_equal(self._memo_files(), memo_files)
+        assert_equal(os.path.getmtime(memo_files[0]), mtime)
+
+
 class TestBioformatsND2(_image_series, _image_multichannel, unittest.TestCase):
     # Nikon NIS-Elements ND2
     # 38 x 31 pixels, 16 bits, 2 channels, 3 time points, 10 focal planes
@@ -525,6 +605,10 @@ class TestBioformatsMetadataND2(unittest.TestCase):
         # test metadata in Frame objects
         assert_almost_equal(self.v[0].metadata['t_s'], 0.445083498)
         assert_equal(self.v[0].metadata['t'], 0)
+        # test per plane metadata arrays
+        t_s = self.v.plane_metadata['t_s']
+        assert_equal(len(t_s), self.v.rdr.getImageCount())
+        assert_almost_equal(t_s[self.v[0].metadata['frame']], 0.445083498)
         # test changing frame_metadata
         del self.v.frame_metadata['t_s']
         assert 't_s' not in self.v[0].metadata
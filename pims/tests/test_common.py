@@ -6,6 +6,8 @@ import six
 import os
 import sys
 import random
+import shutil
+import tempfile
 import types
 import unittest
 import pickle
@@ -418,6 +420,29 @@ class TestVideo_PyAV_timed(_image_series, unittest.TestCase):
         self.expected_shape = (424, 640, 3)
         self.expected_len = 480
 
+    def test_iter_parallel(self):
+        frames = self.v.iter_parallel(processes=2)
+        frame0 = next(frames)
+        assert_equal(frame0.frame_no, 0)
+        assert_image_equal(frame0, self.frame0)
+        assert_image_equal(next(frames), self.frame1)
+        frames.close()
+
+    def test_read_parallel(self):
+        result = self.v.read_parallel(processes=2)
+        assert_equal(result.shape, (self.expected_len,) + self.expected_shape)
+        assert_image_equal(result[0], self.frame0)
+        assert_image_equal(result[1], self.frame1)
+        assert_image_equal(result[-1], self.v[self.expected_len - 1])
+
+    def test_parallel_segments(self):
+        segments = self.v._segments(100)
+        assert_equal(segments[0][0], 0)
+        assert_equal(segments[-1][1], None)
+        for (start, stop), (next_start, _) in zip(segments, segments[1:]):
+            assert_equal(stop, next_start)
+            assert_true(stop - start >= 100)
+
 
 class TestVideo_PyAV_indexed(_image_series, unittest.TestCase):
     def check_skip(self):
@@ -516,6 +541,36 @@ class TestTiffStack_pil(_tiff_image_series, unittest.TestCase):
         self.expected_shape = (512, 512)
         self.expected_len = 5
 
+    def test_random_access_matches_pil(self):
+        for j in [4, 1, 3, 0, 2]:
+            self.v.im.seek(j)
+            expected = np.asarray(self.v.im).reshape(self.expected_shape)
+            assert_image_equal(self.v[j], expected)
+
+    def test_edit_frame(self):
+        assert_true(self.v._read_direct(1) is not None)  # memory-mapped
+        frame = self.v[1]
+        frame[0, 0] += 1
+        frame -= 1
+        assert_image_equal(self.v[1], self.frame1)
+
+    def test_miniswhite(self):
+        _skip_if_no_tifffile()
+        import tempfile
+        from pims.tiff_stack import tifffile
+        from PIL import Image
+        data = np.random.randint(0, 255, (2, 8, 10)).astype(np.uint8)
+        filename = os.path.join(tempfile.mkdtemp(), 'miniswhite.tif')
+        save = getattr(tifffile, 'imwrite', None) or tifffile.imsave
+        save(filename, data, photometric='miniswhite')
+        v = self.klass(filename)
+        for j in range(2):
+            v.im.seek(j)
+            assert_image_equal(v[j], np.asarray(v.im))
+        v.close()
+        os.remove(filename)
+        os.rmdir(os.path.dirname(filename))
+
 
 class TestTiffStack_tifffile(_tiff_image_series, unittest.TestCase):
     def check_skip(self):
@@ -532,6 +587,150 @@ class TestTiffStack_tifffile(_tiff_image_series, unittest.TestCase):
         self.expected_shape = (512, 512)
         self.expected_len = 5
 
+    def _write_stack(self, n_frames=4, **kwargs):
+        import tempfile
+        from pims.tiff_stack import tifffile
+        data = np.random.randint(0, 2**16, (n_frames, 6, 7)).astype(np.uint16)
+        tempdir = tempfile.mkdtemp()
+        self.addCleanup(lambda: os.rmdir(tempdir))
+        filename = os.path.join(tempdir, 'stack.tif')
+        self.addCleanup(lambda: os.remove(filename))
+        save = getattr(tifffile, 'imwrite', None) or tifffile.imsave
+        save(filename, data, photometric='minisblack', **kwargs)
+        with tifffile.TiffFile(filename) as tif:
+            series = tif.series[0]
+            offset = getattr(series, 'dataoffset', None)
+            expected = [page.asarray() for page in series.pages]
+        v = self.klass(filename)
+        self.addCleanup(v.close)
+        return v, offset, expected
+
+    def test_memmap(self):
+        # big-endian frames are also converted to native order
+        for byteorder in ['<', '>']:
+            v, offset, expected = self._write_stack(byteorder=byteorder)
+            assert_true(v._stack is not None)
+            if offset is not None:
+                # the stack starts at the data offset of the series
+                assert_equal(v._stack.ctypes.data - v._buf.ctypes.data,
+                             offset)
+            for j in [3, 0, 2, 1]:
+                frame = v[j]
+                assert_true(frame.dtype.isnative)
+                assert_equal(frame, expected[j])
+            # editing a frame does not change later reads
+            frame[0, 0] += 1
+            frame -= 1
+            assert_equal(v[1], expected[1])
+
+    def test_memmap_single_page(self):
+        v, _, expected = self._write_stack(n_frames=1)
+        assert_true(v._stack is not None)
+        assert_equal(v[0], expected[0])
+
+    def test_compressed_fallback(self):
+        v, _, expected = self._write_stack(compression='zlib')
+        assert_true(v._stack is None and v._offsets is None)
+        for j in range(4):
+            assert_equal(v[j], expected[j])
+
+    def test_metadata_cache(self):
+        v, _, _ = self._write_stack(description='pims test',
+                                    metadata=None)
+        metadata = v[0].metadata
+        assert_equal(metadata['ImageDescription'], 'pims test')
+        assert_true(0 in v._metadata)
+        metadata['ImageDescription'] = 'changed'
+        assert_equal(v[0].metadata['ImageDescription'], 'pims test')
+
+
+class TestTiffStackND(unittest.TestCase):
+    def setUp(self):
+        _skip_if_no_tifffile()
+        from pims.tiff_stack import tifffile
+        self.tempdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tempdir, 'hyperstack.tif')
+        # axes TZCYX
+        self.data = np.arange(3 * 4 * 2 * 5 * 6,
+                              dtype=np.uint16).reshape((3, 4, 2, 5, 6))
+        save = getattr(tifffile, 'imwrite', None) or tifffile.imsave
+        save(self.filename, self.data, imagej=True)
+        self.v = pims.TiffStackND(self.filename)
+
+    def tearDown(self):
+        self.v.close()
+        shutil.rmtree(self.tempdir)
+
+    def test_sizes(self):
+        assert_equal(self.v.sizes, dict(t=3, z=4, c=2, y=5, x=6))
+        assert_equal(self.v.bundle_axes, ['y', 'x'])
+        assert_equal(self.v.iter_axes, ['t'])
+
+    def test_planes(self):
+        self.v.iter_axes = 'tzc'
+        assert_equal(self.v[5], self.data[0, 2, 1])
+        assert_equal(self.v[23], self.data[2, 3, 1])
+
+    def test_volumes(self):
+        self.v.default_coords['c'] = 1
+        self.v.bundle_axes = 'zyx'
+        assert_equal(self.v[2], self.data[2, :, 1])
+        self.v.bundle_axes = 'czyx'
+        assert_equal(self.v[1], self.data[1].transpose(1, 0, 2, 3))
+        self.v.bundle_axes = 'tyx'
+        self.v.iter_axes = 'z'
+        assert_equal(self.v[3], self.data[:, 3, 1])
+
+    def test_edit_frame(self):
+        # editing a frame does not change later reads
+        for bundle_axes in ['yx', 'zyx', 'czyx']:
+            self.v.bundle_axes = bundle_axes
+            frame = self.v[1]
+            frame[(0,) * frame.ndim] += 1
+            frame -= 1
+        self.v.bundle_axes = 'yx'
+        assert_equal(self.v[1], self.data[1, 0, 0])
+        self.v.bundle_axes = 'zyx'
+        assert_equal(self.v[1], self.data[1, :, 0])
+        self.v.bundle_axes = 'czyx'
+        assert_equal(self.v[1], self.data[1].transpose(1, 0, 2, 3))
+
+
+class TestMM_TiffStack(unittest.TestCase):
+    def setUp(self):
+        _skip_if_no_PIL()
+        _skip_if_no_tifffile()
+        from pims.tiff_stack import tifffile
+        self.tempdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tempdir, 'mm_stack.tif')
+        xml = ('<MetaData>'
+               '<prop id="stage-position-x" type="float" value="{0}"/>'
+               '<prop id="zoom-percent" type="int" value="100"/>'
+               '<prop id="acquisition-time-local" type="time" '
+               'value="20150118 15:33:49.{1}"/>'
+               '</MetaData>')
+        save = getattr(tifffile, 'imwrite', None) or tifffile.imsave
+        for j in range(3):
+            # the first page overwrites, the next ones are appended
+            save(self.filename, np.full((8, 9), j, dtype=np.uint16),
+                 description=xml.format(1.5 * j, 10 * j + 5), append=j > 0,
+                 metadata=None)
+        self.v = pims.tiff_stack.MM_TiffStack(self.filename)
+
+    def tearDown(self):
+        self.v.close()
+        shutil.rmtree(self.tempdir)
+
+    def test_get_meta(self):
+        meta = self.v.get_meta(2)
+        assert_equal(meta['stage-position-x'], 3.)
+        assert_equal(meta['zoom-percent'], 100)
+        assert_equal(meta['acquisition-time-local'].microsecond, 25000)
+
+    def test_get_meta_column(self):
+        assert_equal(self.v.get_meta_column('stage-position-x'),
+                     [0., 1.5, 3.])
+
 
 class TestSpeStack(_image_series, unittest.TestCase):
     def check_skip(self):
@@ -0,0 +1,155 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import nose
+import numpy as np
+from numpy.testing import assert_equal
+
+import pims
+from pims.convert import (convert, verify_conversion, read_metadata,
+                          ConvertedFrames)
+from pims.tests.test_common import save_dummy_png
+
+
+def _skip_if_no_tifffile():
+    if not pims.tiff_stack.tifffile_available():
+        raise nose.SkipTest('tifffile not installed. Skipping.')
+
+
+class _OtherReader(pims.TiffStackND):
+    pass
+
+
+class TestConvertND(unittest.TestCase):
+    def setUp(self):
+        _skip_if_no_tifffile()
+        from pims.tiff_stack import tifffile
+        self.tempdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tempdir, 'hyperstack.tif')
+        self.path = os.path.join(self.tempdir, 'converted')
+        # axes TZCYX
+        self.data = np.arange(3 * 4 * 2 * 5 * 6,
+                              dtype=np.uint16).reshape((3, 4, 2, 5, 6))
+        save = getattr(tifffile, 'imwrite', None) or tifffile.imsave
+        save(self.filename, self.data, imagej=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_axes(self):
+        v = convert(self.filename, self.path, reader=pims.TiffStackND,
+                    bundle_axes='zyx', iter_axes='tc', chunk_size=4)
+        assert_equal(v.sizes, dict(t=3, c=2, z=4, y=5, x=6))
+        assert_equal(v.bundle_axes, ['z', 'y', 'x'])
+        assert_equal(v.iter_axes, ['t', 'c'])
+        assert_equal(v.pixel_type, np.uint16)
+        assert_equal(v[3], self.data[1, :, 1])
+        v.bundle_axes = 'yx'
+        v.iter_axes = 'tzc'
+        assert_equal(v[5], self.data[0, 2, 1])
+
+    def test_processes(self):
+        v = convert(self.filename, self.path, workers=2, chunk_size=5,
+                    reader=pims.TiffStackND, iter_axes='tzc')
+        assert_equal(len(v), 24)
+        assert_equal(np.array(list(v)), self.data.reshape((24, 5, 6)))
+        assert_equal(verify_conversion(self.path), [])
+
+    def _counting_reader(self):
+        """Returns a TiffStackND reader and the list of frames it reads."""
+        reader = pims.TiffStackND(self.filename)
+        reader.iter_axes = 'tzc'
+        read = []
+        get_frame = reader.get_frame
+
+        def counting_get_frame(i):
+            read.append(i)
+            return get_frame(i)
+        reader.get_frame = counting_get_frame
+        return reader, read
+
+    def test_resume(self):
+        reader, _ = self._counting_reader()
+        convert(reader, self.path, chunk_size=5)
+        # interrupt the conversion after the first chunk
+        metadata = read_metadata(self.path)
+        metadata['checksums'][1:] = [None] * 4
+        with open(os.path.join(self.path, 'metadata.json'), 'w') as f:
+            json.dump(metadata, f)
+        self.assertRaises(IOError, ConvertedFrames, self.path)
+
+        reader, read = self._counting_reader()
+        v = convert(reader, self.path, chunk_size=5)
+        # the first frame is read to check the layout
+        assert_equal(sorted(read), [0] + list(range(5, 24)))
+        assert_equal(v[23], self.data[2, 3, 1])
+
+        # a different conversion is not continued
+        self.assertRaises(ValueError, convert, self.filename, self.path,
+                          reader=pims.TiffStackND, chunk_size=5)
+
+    def test_resume_other_source(self):
+        convert(self.filename, self.path, reader=pims.TiffStackND,
+                iter_axes='tzc', chunk_size=5)
+        assert_equal(ConvertedFrames(self.path).source,
+                     os.path.abspath(self.filename))
+        other = os.path.join(self.tempdir, 'other.tif')
+        shutil.copy(self.filename, other)
+        # same layout, but another file or reader
+        self.assertRaises(ValueError, convert, other, self.path,
+                          reader=pims.TiffStackND, iter_axes='tzc',
+                          chunk_size=5)
+        self.assertRaises(ValueError, convert, self.filename, self.path,
+                          reader=_OtherReader, iter_axes='tzc', chunk_size=5)
+        reader, _ = self._counting_reader()
+        self.assertRaises(ValueError, convert, reader, self.path,
+                          chunk_size=5)
+
+    def test_resume_without_frames(self):
+        convert(self.filename, self.path, reader=pims.TiffStackND,
+                iter_axes='tzc', chunk_size=5)
+        os.remove(os.path.join(self.path, 'frames.npy'))
+        v = convert(self.filename, self.path, reader=pims.TiffStackND,
+                    iter_axes='tzc', chunk_size=5)
+        assert_equal(v[23], self.data[2, 3, 1])
+
+    def test_edit_frame(self):
+        v = convert(self.filename, self.path, reader=pims.TiffStackND,
+                    iter_axes='tzc', chunk_size=5)
+        frame = v[5]
+        frame -= 1
+        assert_equal(v[5], self.data[0, 2, 1])
+
+    def test_verify(self):
+        convert(self.filename, self.path, reader=pims.TiffStackND,
+                iter_axes='tzc', chunk_size=5)
+        data = np.load(os.path.join(self.path, 'frames.npy'), mmap_mode='r+')
+        data[1, 1, 1, 0, 0] += 1  # frame 11, in chunk 2
+        data.flush()
+        del data
+        assert_equal(verify_conversion(self.path), [2])
+        self.assertRaises(IOError, ConvertedFrames, self.path, verify=True)
+
+
+class TestConvertImages(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.filenames = ['img-{0}.png'.format(i) for i in range(5)]
+        self.frames = save_dummy_png(self.tempdir, self.filenames, (10, 12))
+        self.path = os.path.join(self.tempdir, 'converted')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_threads(self):
+        images = pims.ImageSequence(os.path.join(self.tempdir, '*.png'))
+        v = convert(images, self.path, workers=3, chunk_size=2)
+        assert_equal(v.sizes, dict(t=5, y=10, x=12))
+        assert_equal(v[4], self.frames[4])
+        assert_equal(v[1:3][0], self.frames[1])
+        assert_equal(verify_conversion(self.path), [])
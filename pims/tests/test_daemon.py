@@ -0,0 +1,129 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import sys
+import stat
+import time
+import socket
+import shutil
+import tempfile
+import subprocess
+import unittest
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+import nose
+import numpy as np
+from numpy.testing import assert_equal
+
+import pims
+import pims.daemon
+
+path, _ = os.path.split(os.path.abspath(__file__))
+path = os.path.join(path, 'data')
+
+
+def _skip_if_no_daemon():
+    if not pims.daemon.available():
+        raise nose.SkipTest('UNIX sockets are not available. Skipping.')
+    if not pims.tiff_stack.tifffile_available():
+        raise nose.SkipTest('tifffile not installed. Skipping.')
+
+
+class TestDaemonReader(unittest.TestCase):
+    def setUp(self):
+        _skip_if_no_daemon()
+        from pims.tiff_stack import tifffile
+        self.tempdir = tempfile.mkdtemp()
+        # the key is stored in a private directory, here in self.tempdir
+        runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+        if runtime_dir is None:
+            self.addCleanup(os.environ.pop, 'XDG_RUNTIME_DIR')
+        else:
+            self.addCleanup(os.environ.__setitem__, 'XDG_RUNTIME_DIR',
+                            runtime_dir)
+        os.environ['XDG_RUNTIME_DIR'] = self.tempdir
+        self.filename = os.path.join(self.tempdir, 'hyperstack.tif')
+        # axes TZCYX
+        self.data = np.arange(3 * 4 * 2 * 5 * 6,
+                              dtype=np.uint16).reshape((3, 4, 2, 5, 6))
+        save = getattr(tifffile, 'imwrite', None) or tifffile.imsave
+        save(self.filename, self.data, imagej=True)
+
+        # a local daemon process that serves the TiffStackND reader
+        self.address = os.path.join(self.tempdir, 'daemon.sock')
+        self.daemon = subprocess.Popen([sys.executable, '-m', 'pims.daemon',
+                                        self.address])
+        for _ in range(600):  # wait for the daemon to listen
+            try:
+                self.v = pims.daemon.DaemonReader(
+                    self.filename, reader='TiffStackND',
+                    address=self.address, start=False)
+            except socket.error:
+                time.sleep(0.05)
+            else:
+                break
+
+    def tearDown(self):
+        if getattr(self, 'v', None) is not None:
+            self.v.close()
+        if getattr(self, 'daemon', None) is not None:
+            self.daemon.terminate()
+            self.daemon.wait()
+        shutil.rmtree(self.tempdir)
+
+    def test_private(self):
+        directory = os.path.join(self.tempdir, 'pims')
+        assert_equal(os.path.dirname(pims.daemon.default_address()),
+                     directory)
+        assert_equal(stat.S_IMODE(os.stat(directory).st_mode), 0o700)
+        key_file = os.path.join(directory, 'daemon.key')
+        assert_equal(stat.S_IMODE(os.stat(key_file).st_mode), 0o600)
+        assert_equal(stat.S_IMODE(os.stat(self.address).st_mode), 0o600)
+
+        os.chmod(directory, 0o755)
+        self.assertRaises(IOError, pims.daemon.default_address)
+        os.chmod(directory, 0o700)
+
+    def test_authentication(self):
+        self.assertRaises(AuthenticationError, Client, self.address,
+                          family='AF_UNIX', authkey=b'wrong key')
+        # the daemon keeps serving authenticated clients
+        other = pims.daemon.DaemonReader(self.filename, reader='TiffStackND',
+                                         address=self.address, start=False)
+        assert_equal(other[1], self.data[1, 0, 0])
+        other.close()
+
+    def test_sizes(self):
+        assert_equal(self.v.sizes, dict(t=3, z=4, c=2, y=5, x=6))
+        assert_equal(self.v.bundle_axes, ['y', 'x'])
+        assert_equal(self.v.iter_axes, ['t'])
+        assert_equal(self.v.pixel_type, np.uint16)
+
+    def test_planes(self):
+        self.v.iter_axes = 'tzc'
+        assert_equal(self.v[5], self.data[0, 2, 1])
+        assert_equal(self.v[23], self.data[2, 3, 1])
+
+    def test_volumes(self):
+        self.v.default_coords['c'] = 1
+        self.v.bundle_axes = 'zyx'
+        assert_equal(self.v[2], self.data[2, :, 1])
+        self.v.bundle_axes = 'czyx'
+        assert_equal(self.v[1], self.data[1].transpose(1, 0, 2, 3))
+
+    def test_shared_reader(self):
+        other = pims.daemon.DaemonReader(self.filename, reader='TiffStackND',
+                                         address=self.address)
+        other.bundle_axes = 'zyx'
+        assert_equal(self.v[1], self.data[1, 0, 0])
+        assert_equal(other[1], self.data[1, :, 0])
+        other.close()
+        assert_equal(self.v[2], self.data[2, 0, 0])
+
+    def test_errors(self):
+        self.assertRaises(IOError, pims.daemon.DaemonReader,
+                          os.path.join(self.tempdir, 'missing.tif'),
+                          reader='TiffStackND', address=self.address)
+        self.assertRaises(ValueError, pims.daemon.DaemonReader,
+                          self.filename, reader='Frame', address=self.address)
@@ -9,7 +9,10 @@ import numpy as np
 import pims
 from numpy.testing import assert_array_equal
 from pims import plot_to_frame, plots_to_frame
-from pims.display import export_moviepy, export_pyav
+from pims.display import (export_moviepy, export_pyav, normalize, to_rgb,
+                           intensity_range, _to_uint8, _Uint8Converter,
+                           _downsample, _thumbnails, _composite,
+                           _scaling_lut)
 from nose.tools import assert_true, assert_equal, assert_less
 from .test_common import _skip_if_no_MoviePy, _skip_if_no_PyAV, path
 
@@ -25,6 +28,13 @@ def _skip_if_no_mpl():
     if plt is None:
         raise nose.SkipTest('Matplotlib not installed. Skipping.')
 
+def _sine_figure(t):
+    x = np.linspace(0, 2*np.pi, 100)
+    fig = plt.figure(figsize=(8, 6), tight_layout=False)
+    fig.gca().plot(x, np.sin(x - t))
+    return fig
+
+
 class TestPlotToFrame(unittest.TestCase):
     def setUp(self):
         _skip_if_no_mpl()
@@ -105,6 +115,20 @@ class TestPlotToFrame(unittest.TestCase):
         frame = plots_to_frame(iter(self.figures))
         assert_equal(frame.shape, (10, 384, 512, 4))
 
+    def test_plots_processes(self):
+        expected = plots_to_frame(self.figures)
+        actual = plots_to_frame(iter(self.figures), processes=2)
+        assert_array_equal(actual, expected)
+
+    def test_plots_from_callables(self):
+        expected = plots_to_frame(self.figures[:3])
+        callables = [functools.partial(_sine_figure, t)
+                     for t in np.linspace(0, 2*np.pi, 10)[:3]]
+        n_open = len(plt.get_fignums())
+        assert_array_equal(plots_to_frame(callables), expected)
+        assert_array_equal(plots_to_frame(callables, processes=2), expected)
+        assert_equal(len(plt.get_fignums()), n_open)
+
 
 class ExportCommon(object):
     def setUp(self):
@@ -178,3 +202,235 @@ class TestExportPyAV(unittest.TestCase, ExportCommon):
         _skip_if_no_PyAV()
         self.export_func = export_pyav
         ExportCommon.setUp(self)
+
+    def test_gray_export(self):
+        """Greyscale frames are exported in order, repeated to reach the
+        minimum frame rate"""
+        import av
+        sequence = self.sequence[..., 0]
+        export_pyav(sequence, self.tempfile, codec='rawvideo',
+                    pixel_format='gray', rate=8, workers=3)
+        container = av.open(str(self.tempfile))
+        try:
+            frames = [frame.to_ndarray(format=str('gray'))
+                      for frame in container.decode(video=0)]
+        finally:
+            container.close()
+        assert_equal(len(frames), 2 * self.expected_len)
+        for i, frame in enumerate(frames):
+            assert_array_equal(frame, sequence[i // 2])
+
+
+class TestUint8Conversion(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.uint16 = np.random.randint(10, 4000, size=(300, 300),
+                                        dtype=np.uint16)
+        self.int16 = np.random.randint(-30000, 30000, size=(300, 300),
+                                       dtype=np.int16)
+
+    def test_autoscale(self):
+        for image in [self.uint16, self.int16, self.uint16[:, ::2]]:
+            low, high = float(image.min()), float(image.max())
+            expected = ((image - low) / (high - low) * 255).astype(np.uint8)
+            assert_array_equal(_to_uint8(image, autoscale=True), expected)
+            assert_array_equal(normalize(image),
+                               (image - low) / (high - low))
+
+    def test_12bit(self):
+        expected = (self.uint16 / 4095 * 255).astype(np.uint8)
+        assert_array_equal(_to_uint8(self.uint16, autoscale=False), expected)
+
+    def test_scaling_fixed_per_sequence(self):
+        # the 12-bit scaling is determined from the first image
+        converter = _Uint8Converter(autoscale=False)
+        converter(self.uint16)
+        bright = np.full((300, 300), 4095, dtype=np.uint16)
+        bright[0, 0] = 5000
+        assert_equal(converter(bright)[1, 1], 255)
+        assert_equal(converter(bright)[0, 0], 255)  # clipped
+        assert_equal(_to_uint8(bright, autoscale=False)[1, 1], 15)
+
+    def test_autoscale_fixed_per_sequence(self):
+        # the range is determined from the first image
+        converter = _Uint8Converter(autoscale=True)
+        first = converter(self.uint16)
+        assert_array_equal(first, _to_uint8(self.uint16, autoscale=True))
+        darker = self.uint16 // 2
+        expected = ((darker.astype(float).clip(self.uint16.min()) -
+                     self.uint16.min()) / float(np.ptp(self.uint16)) *
+                    255).astype(np.uint8)
+        assert_array_equal(converter(darker), expected)
+        floats = self.uint16 / 4000.
+        converter = _Uint8Converter(autoscale=True)
+        converter(floats)
+        assert_equal(converter(floats * 2).max(), 255)  # clipped
+
+    def test_lut_cache_lru(self):
+        lut = _scaling_lut(np.uint16, 0, 1)
+        for high in range(2, 80):
+            _scaling_lut(np.uint16, 0, high)
+            # the recently used table is kept
+            self.assertTrue(_scaling_lut(np.uint16, 0, 1) is lut)
+        self.assertTrue(len(pims.display._lut_cache) <= 64)
+
+
+class TestIntensityRange(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.percentiles = (0, 0.5, 50, 99.5, 100)
+
+    def test_integer_percentiles(self):
+        for dtype in [np.uint8, np.uint16, np.int16]:
+            info = np.iinfo(dtype)
+            stack = np.random.randint(info.min, info.max, size=(10, 40, 50))
+            stack = stack.astype(dtype)
+            # a generator, so that frames are read one at a time
+            actual = intensity_range((frame for frame in stack),
+                                     self.percentiles)
+            assert_array_equal(actual, np.percentile(stack, self.percentiles))
+
+    def test_mixed_integer_types(self):
+        frames = [np.random.randint(0, 255, size=(40, 50)).astype(np.uint8),
+                  np.random.randint(0, 4000, size=(40, 50)).astype(np.uint16),
+                  np.random.randint(-300, 300, size=(40, 50)).astype(np.int16)]
+        expected = np.percentile(np.concatenate([f.astype(np.int64).ravel()
+                                                 for f in frames]),
+                                 self.percentiles)
+        assert_array_equal(intensity_range(frames, self.percentiles),
+                           expected)
+        frames.append(np.random.normal(size=(40, 50)))
+        # the extremes are those of the integer frames
+        assert_equal(intensity_range(frames), (expected[0], expected[-1]))
+
+    def test_float_min_max(self):
+        stack = np.random.normal(size=(10, 40, 50))
+        actual = intensity_range(stack, self.percentiles)
+        assert_equal(actual[0], stack.min())
+        assert_equal(actual[-1], stack.max())
+        np.testing.assert_allclose(actual[2], np.median(stack), atol=0.05)
+
+    def test_max_frames(self):
+        stack = np.arange(100, dtype=np.uint16)[:, np.newaxis, np.newaxis]
+        assert_equal(intensity_range(stack, max_frames=5), (0, 99))
+        stack = np.repeat(stack, 300, axis=1)
+        # frames 0, 50 and 99
+        assert_equal(intensity_range(stack, (50,), max_frames=3), (50,))
+
+    def test_display_range(self):
+        image = np.array([[0, 5, 10, 20]], dtype=np.uint16)
+        assert_array_equal(normalize(image, (5, 15)), [[0, 0, 0.5, 1]])
+        assert_array_equal(normalize(image.astype(float), (5, 15)),
+                           [[0, 0, 0.5, 1]])
+        stack = np.random.randint(0, 4000, size=(2, 300, 300))
+        stack = stack.astype(np.uint16)
+        rgb = to_rgb(stack, display_range=[(0, 4000), (0, 2000)])
+        assert_equal(rgb.dtype, np.uint8)
+        expected = (stack[1].clip(0, 2000) / 2000 * 255).astype(np.uint8)
+        assert_array_equal(rgb[..., 0], expected)  # magenta channel
+
+
+class TestToRGB(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.stack = np.random.randint(0, 4000, size=(3, 4, 30, 40))
+        self.stack = self.stack.astype(np.uint16)
+
+    def test_channel_axis(self):
+        display_range = (0, 4000)
+        actual = to_rgb(self.stack, display_range=display_range,
+                        channel_axis=1)
+        assert_equal(actual.shape, (3, 30, 40, 3))
+        for t in range(3):
+            assert_array_equal(actual[t], to_rgb(self.stack[t],
+                                                 display_range=display_range))
+
+    def test_composite_blocks(self):
+        images = list(self.stack[0].astype(float))
+        rgbs = [[0, 255, 255], [0, 255, 0], [255, 0, 255], [255, 0, 0]]
+        expected = sum(normalize(image)[..., np.newaxis] * rgb
+                       for image, rgb in zip(images, rgbs)).clip(0, 255)
+        for chunk_size in (7, 40, 2**18):
+            actual = _composite(images, rgbs, [None] * 4,
+                                np.empty((30, 40, 3), np.float32),
+                                chunk_size=chunk_size)
+            np.testing.assert_allclose(actual, expected, rtol=1e-5)
+
+
+class _CountingReader(pims.FramesSequence):
+    def __init__(self, stack):
+        self._stack = stack
+        self.reads = 0
+
+    def get_frame(self, i):
+        self.reads += 1
+        return pims.Frame(self._stack[i], frame_no=i)
+
+    def __len__(self):
+        return len(self._stack)
+
+    @property
+    def frame_shape(self):
+        return self._stack.shape[1:]
+
+    @property
+    def pixel_type(self):
+        return self._stack.dtype
+
+
+class TestThumbnails(unittest.TestCase):
+    def test_downsample(self):
+        image = np.arange(16, dtype=np.uint16).reshape(4, 4)
+        actual = _downsample(image, 2)
+        assert_equal(actual.dtype, np.uint16)
+        assert_array_equal(actual, [[2, 4], [10, 12]])
+        # a remainder is cropped, and channels are averaged separately
+        rgb = np.ones((9, 9, 3), dtype=np.uint8) * [1, 2, 3]
+        assert_array_equal(_downsample(rgb, 4), np.ones((4, 4, 3)) * [1, 2, 3])
+        # images that are narrow enough are not changed
+        assert_true(_downsample(image, 3) is image)
+
+    def test_reader_cache(self):
+        reader = _CountingReader(np.random.randint(0, 255, size=(3, 40, 40)))
+        first = _thumbnails(reader, 20)
+        assert_equal(reader.reads, 3)
+        second = _thumbnails(reader, 20)
+        assert_equal(reader.reads, 3)
+        for a, b in zip(first, second):
+            assert_true(a is b)
+        _thumbnails(reader, 10)
+        assert_equal(reader.reads, 6)
+
+    def test_reader_cache_state(self):
+        reader = _CountingReader(np.random.randint(0, 255, size=(3, 40, 40)))
+        reader.series = 0
+        _thumbnails(reader, 20)
+        reader.series = 1
+        _thumbnails(reader, 20)
+        assert_equal(reader.reads, 6)
+        reader.series = 0
+        _thumbnails(reader, 20)
+        assert_equal(reader.reads, 6)
+
+    def test_reader_cache_not_downsampled(self):
+        reader = _CountingReader(np.random.randint(0, 255, size=(3, 40, 40)))
+        _thumbnails(reader, 40)
+        _thumbnails(reader, 40)
+        assert_equal(reader.reads, 6)
+
+    def test_cache_bound(self):
+        cache = pims.display._ThumbnailCache(max_bytes=250)
+        reader = _CountingReader(np.zeros((3, 1, 1)))
+        for i in range(3):
+            cache.put(reader, (i,), np.zeros(100, dtype=np.uint8))
+        # the least recently used thumbnail is evicted
+        assert_true(cache.get(reader, (0,)) is None)
+        assert_true(cache.get(reader, (2,)) is not None)
+        cache.put(reader, (3,), np.zeros(100, dtype=np.uint8))
+        assert_true(cache.get(reader, (1,)) is None)
+        assert_true(cache.get(reader, (2,)) is not None)
+        # thumbnails of readers that are collected are dropped
+        del reader
+        cache.get(_CountingReader(np.zeros((3, 1, 1))), (0,))
+        assert_equal(len(cache._entries), 0)
+        assert_equal(cache._nbytes, 0)
@@ -0,0 +1,169 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import shutil
+import tempfile
+import subprocess
+import unittest
+import nose
+import numpy as np
+from numpy.testing import assert_equal
+from nose.tools import assert_true, assert_false
+
+from pims import ffmpeg_reader
+from pims.ffmpeg_reader import FFmpegVideoReader, _limit_cache_size
+
+path, _ = os.path.split(os.path.abspath(__file__))
+path = os.path.join(path, 'data')
+
+
+def _skip_if_no_ffmpeg():
+    if not ffmpeg_reader.available():
+        raise nose.SkipTest('ffmpeg not found. Skipping.')
+
+
+class TestBackgroundDecoding(unittest.TestCase):
+    def setUp(self):
+        _skip_if_no_ffmpeg()
+        self.tempdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tempdir, 'bulk-water.mov')
+        shutil.copy(os.path.join(path, 'bulk-water.mov'), self.filename)
+        self.prefix = self.filename
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_complete_buffer_is_reused(self):
+        v = FFmpegVideoReader(self.filename)
+        length = len(v)
+        frame = np.array(v[length - 1])
+        v.close()
+        assert_true(os.path.isfile(self.prefix + '.pims_meta'))
+
+        v = FFmpegVideoReader(self.filename)
+        assert_true(v._complete)
+        assert_equal(len(v), length)
+        assert_equal(v[length - 1], frame)
+        v.close()
+
+    def test_close_while_decoding(self):
+        v = FFmpegVideoReader(self.filename)
+        v[0]
+        v.close()
+        if os.path.isfile(self.prefix + '.pims_meta'):
+            raise nose.SkipTest('Decoding finished before closing.')
+        # the partial buffer is removed, instead of marked complete
+        assert_false(os.path.isfile(self.prefix + '.pims_buffer'))
+
+        # so that the next opening decodes the whole video
+        v = FFmpegVideoReader(self.filename)
+        assert_false(v._complete)
+        length = len(v)
+        v.close()
+        v = FFmpegVideoReader(self.filename)
+        assert_true(v._complete)
+        assert_equal(len(v), length)
+        v.close()
+
+
+class TestCacheSizeLimit(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.tempdir)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tempdir)
+
+    def _buffer(self, prefix, size, atime):
+        for ext, nbytes in (('.pims_buffer', size), ('.pims_meta', 10)):
+            with open(prefix + ext, 'wb') as f:
+                f.write(b'\0' * nbytes)
+            os.utime(prefix + ext, (atime, atime))
+
+    def test_least_recently_used(self):
+        self._buffer('old', 1000, 1000)
+        self._buffer('older', 1000, 500)
+        self._buffer('new', 1000, 2000)
+        _limit_cache_size('.', 2500, 'new')
+        assert_equal(sorted(os.listdir('.')),
+                     ['new.pims_buffer', 'new.pims_meta',
+                      'old.pims_buffer', 'old.pims_meta'])
+
+    def test_keep_relative(self):
+        # the buffer in use is kept, also when given as a relative path
+        self._buffer('in_use', 1000, 500)
+        self._buffer('other', 1000, 1000)
+        _limit_cache_size('.', 0, 'in_use')
+        assert_equal(sorted(os.listdir('.')),
+                     ['in_use.pims_buffer', 'in_use.pims_meta'])
+
+    def test_requires_cache_dir(self):
+        _skip_if_no_ffmpeg()
+        shutil.copy(os.path.join(path, 'bulk-water.mov'), self.tempdir)
+        self.assertRaises(ValueError, FFmpegVideoReader, 'bulk-water.mov',
+                          cache_size_limit=0)
+
+
+class TestCacheFormats(unittest.TestCase):
+    def setUp(self):
+        _skip_if_no_ffmpeg()
+        self.tempdir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tempdir, 'cache')
+        self.filename = os.path.join(self.tempdir, 'bulk-water.mov')
+        shutil.copy(os.path.join(path, 'bulk-water.mov'), self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_compressed(self):
+        raw = FFmpegVideoReader(self.filename, cache_dir=self.cache_dir)
+        expected = [np.array(raw[i]) for i in (0, 1, len(raw) - 1)]
+        raw.close()
+        for cache_format in ('zlib', 'lz4'):
+            if cache_format == 'lz4' and ffmpeg_reader.lz4_frame is None:
+                continue
+            for reopen in range(2):
+                v = FFmpegVideoReader(self.filename, cache_format=cache_format,
+                                      cache_dir=self.cache_dir)
+                assert_equal(v._complete, reopen == 1)
+                for i, frame in zip((0, 1, len(v) - 1), expected):
+                    assert_equal(v[i], frame)
+                v.close()
+
+    def test_cache_size_limit(self):
+        v = FFmpegVideoReader(self.filename, cache_dir=self.cache_dir)
+        len(v)
+        v.close()
+        other = os.path.join(self.tempdir, 'other.mov')
+        shutil.copy(self.filename, other)
+        # the buffer of the other video does not fit next to the first one
+        v = FFmpegVideoReader(other, cache_dir=self.cache_dir,
+                              cache_size_limit=1)
+        len(v)
+        v.close()
+        names = os.listdir(self.cache_dir)
+        assert_equal(len(names), 2)  # buffer and meta file
+        assert_true(all('other.mov' in name for name in names))
+
+    def test_greyscale(self):
+        filename = os.path.join(self.tempdir, 'grey.avi')
+        subprocess.check_call([ffmpeg_reader.FFMPEG_BINARY, '-loglevel',
+                               'error', '-f', 'lavfi', '-i',
+                               'testsrc=size=64x48:rate=10', '-t', '1',
+                               '-pix_fmt', 'gray', '-c:v', 'ffv1', filename])
+        grey = FFmpegVideoReader(filename, pix_fmt='gray',
+                                 cache_dir=self.cache_dir)
+        expected = np.array(grey[3])
+        grey.close()
+        v = FFmpegVideoReader(filename, cache_dir=self.cache_dir)
+        assert_equal(v._stored_pix_fmt, 'gray')  # stored as single channel
+        assert_equal(v.frame_shape, (48, 64, 3))
+        frame = v[3]
+        assert_equal(frame.shape, (48, 64, 3))
+        for channel in range(3):
+            assert_equal(frame[..., channel], expected)
+        frame[0, 0] = 0  # frames are writable
+        v.close()
@@ -4,6 +4,8 @@ from __future__ import (absolute_import, division, print_function,
 import six
 
 import os
+import glob
+import warnings
 import tempfile
 import zipfile
 import unittest
@@ -53,6 +55,38 @@ class TestImageSequenceWithPIL(_image_series, unittest.TestCase):
     def test_zipfile(self):
         pims.ImageSequence(self.tempfile)[0]
 
+    def test_zipfile_compressed(self):
+        filename = os.path.join(self.tempdir, 'compressed.zip')
+        with zipfile.ZipFile(filename, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for fn in self.filenames:
+                archive.write(os.path.join(self.filepath, fn), fn)
+        v = pims.ImageSequence(filename, workers=2)
+        assert_equal(v[1], self.frame1)
+        assert_equal(v[0], self.frame0)
+        v.close()
+        os.remove(filename)
+
+    def test_zipfile_npy(self):
+        filename = os.path.join(self.tempdir, 'arrays.zip')
+        frames = [self.frame0, self.frame1.astype(np.uint16)]
+        with zipfile.ZipFile(filename, 'w') as archive:
+            for i, frame in enumerate(frames):
+                buf = six.BytesIO()
+                np.save(buf, frame)
+                archive.writestr('frame{0}.npy'.format(i), buf.getvalue())
+        v = pims.ImageSequence(filename)
+        assert_equal(v[0], frames[0])
+        assert_equal(v[1], frames[1])
+        # stored members are read from the memory-mapped archive
+        self.assertTrue(v._zip_member_location('frame1.npy') is not None)
+        # as copies: editing a frame does not change later reads
+        frame = v[1]
+        self.assertFalse(np.shares_memory(frame, v._zip_buffer))
+        frame += 1
+        assert_equal(v[1], frames[1])
+        v.close()
+        os.remove(filename)
+
     def tearDown(self):
         clean_dummy_png(self.filepath, self.filenames)
         os.remove(self.tempfile)
@@ -81,6 +115,99 @@ class TestImageSequenceWithMPL(_image_series, unittest.TestCase):
         clean_dummy_png(self.filepath, self.filenames)
 
 
+class TestImageSequenceWorkers(_image_series, unittest.TestCase):
+    def setUp(self):
+        _skip_if_no_imread()
+        self.filepath = os.path.join(path, 'image_sequence')
+        self.filenames = ['T76S3F00001.png', 'T76S3F00002.png',
+                          'T76S3F00003.png', 'T76S3F00004.png',
+                          'T76S3F00005.png']
+        shape = (10, 11)
+        frames = save_dummy_png(self.filepath, self.filenames, shape)
+        self.filename = os.path.join(self.filepath, '*.png')
+        self.frame0 = frames[0]
+        self.frame1 = frames[1]
+        self.frames = frames
+        self.kwargs = dict(workers=2)
+        self.klass = pims.ImageSequence
+        self.v = self.klass(self.filename, **self.kwargs)
+        self.expected_shape = shape
+        self.expected_len = 5
+
+    def test_prefetch_order(self):
+        for i in [0, 1, 2, 4, 3, 0]:
+            assert_equal(self.v[i], self.frames[i])
+        for frame, expected in zip(self.v, self.frames):
+            assert_equal(frame, expected)
+
+    def test_batch_read_ahead(self):
+        read = []
+        imread = self.v.imread
+
+        def counting_imread(filename, **kwargs):
+            read.append(self.v._filepaths.index(filename))
+            return imread(filename, **kwargs)
+        self.v.imread = counting_imread
+
+        batch = self.v[[4, 1, 3]]
+        # the whole batch is submitted to the workers up front
+        assert_equal(sorted(self.v._prefetched), [1, 3, 4])
+        for frame, i in zip(batch, [4, 1, 3]):
+            assert_equal(frame, self.frames[i])
+        assert_equal(sorted(read), [1, 3, 4])
+        assert_equal(self.v._prefetched, dict())
+
+        for frame, i in zip(self.v[::2], [0, 2, 4]):
+            assert_equal(frame, self.frames[i])
+        assert_equal(sorted(read[3:]), [0, 2, 4])
+
+    def tearDown(self):
+        self.v.close()
+        clean_dummy_png(self.filepath, self.filenames)
+
+
+class TestImageSequenceManifest(unittest.TestCase):
+    def setUp(self):
+        _skip_if_no_skimage()
+        self.filepath = os.path.join(path, 'image_sequence')
+        self.filenames = ['T76S3F00001.png', 'T76S3F00002.png',
+                          'T76S3F00003.png', 'T76S3F00004.png',
+                          'T76S3F00005.png']
+        save_dummy_png(self.filepath, self.filenames, (10, 11))
+        self.filename = os.path.join(self.filepath, '*.png')
+        self.tempdir = tempfile.mkdtemp()
+        self.manifest = os.path.join(self.tempdir, 'manifest.json')
+
+    def test_listing_matches_glob(self):
+        v = pims.ImageSequence(self.filename)
+        assert_equal(v._filepaths, sorted(glob.glob(self.filename)))
+
+    def test_manifest(self):
+        v = pims.ImageSequence(self.filename, manifest=self.manifest)
+        self.assertTrue(os.path.exists(self.manifest))
+        v2 = pims.ImageSequence(self.filename, manifest=self.manifest)
+        assert_equal(v2._filepaths, v._filepaths)
+        assert_equal(v2.frame_shape, v.frame_shape)
+        assert_equal(v2.pixel_type, v.pixel_type)
+        assert_equal(v2[1], v[1])
+
+    def test_manifest_invalidated(self):
+        pims.ImageSequence(self.filename, manifest=self.manifest)
+        self.filenames.append('T76S3F00006.png')
+        save_dummy_png(self.filepath, self.filenames[-1:], (10, 11))
+        # make sure that the directory mtime changes on coarse filesystems
+        mtime = os.stat(self.filepath).st_mtime
+        os.utime(self.filepath, (mtime + 10, mtime + 10))
+        v = pims.ImageSequence(self.filename, manifest=self.manifest)
+        assert_equal(len(v), 6)
+
+    def tearDown(self):
+        clean_dummy_png(self.filepath, self.filenames)
+        if os.path.exists(self.manifest):
+            os.remove(self.manifest)
+        os.rmdir(self.tempdir)
+
+
 class TestImageSequenceAcceptsList(_image_series, unittest.TestCase):
     def setUp(self):
         _skip_if_no_imread()
@@ -170,6 +297,7 @@ class ImageSequenceND(_image_series, unittest.TestCase):
         self.filename = os.path.join(self.filepath, '*.png')
         self.frame0 = np.array([frames[0], frames[2]])
         self.frame1 = np.array([frames[4], frames[6]])
+        self.frames = frames
         self.klass = pims.ImageSequenceND
         self.kwargs = dict(axes_identifiers='tzc')
         self.v = self.klass(self.filename, **self.kwargs)
@@ -209,6 +337,26 @@ class ImageSequenceND(_image_series, unittest.TestCase):
         self.check_skip()
         assert_equal(self.v.sizes['c'], self.expected_C)
 
+    def test_bundle_czyx(self):
+        for workers in [None, 2]:
+            v = self.klass(self.filename, workers=workers, **self.kwargs)
+            v.bundle_axes = 'czyx'
+            expected = np.array([[self.frames[4], self.frames[6]],
+                                 [self.frames[5], self.frames[7]]])
+            assert_equal(v[1], expected)
+            v.close()
+
+    def test_missing_file(self):
+        os.remove(os.path.join(self.filepath, self.filenames[1]))
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            v = self.klass(self.filename, **self.kwargs)
+            self.assertTrue(any('combinations' in str(m.message) for m in w))
+        v.default_coords['c'] = 1
+        self.assertRaises(IndexError, lambda: v[0])
+        assert_equal(v[1], np.array([self.frames[5], self.frames[7]]))
+        save_dummy_png(self.filepath, self.filenames[1:2], (10, 11))
+
 
 class ImageSequenceND_RGB(_image_series, unittest.TestCase):
     def setUp(self):
@@ -261,6 +409,7 @@ class ReaderSequence(_image_series, unittest.TestCase):
         self.filename = os.path.join(self.filepath, '*.png')
         self.frame0 = frames[0]
         self.frame1 = frames[1]
+        self.frames = frames
         self.klass = pims.ReaderSequence
         self.kwargs = dict(reader_cls=pims.ImageReaderND, axis_name='t')
         self.v = self.klass(self.filename, **self.kwargs)
@@ -274,5 +423,17 @@ class ReaderSequence(_image_series, unittest.TestCase):
         self.check_skip()
         assert_equal(self.v.sizes['c'], self.expected_C)
 
+    def test_reader_pool(self):
+        v = self.klass(self.filename, reader_pool_size=2, **self.kwargs)
+        v.bundle_axes = 'yxc'
+        v.iter_axes = 't'
+        for i in [0, 1, 0, 2, 3, 1]:
+            assert_equal(v[i], self.frames[i])
+            self.assertLessEqual(len(v._reader_pool), 2)
+        assert_equal(list(v._reader_pool), [3, 1])
+        v.close()
+        assert_equal(len(v._reader_pool), 0)
+
     def tearDown(self):
+        self.v.close()
         clean_dummy_png(self.filepath, self.filenames)
@@ -4,8 +4,10 @@ from __future__ import (absolute_import, division, print_function,
 import six
 
 import os
+import struct
 from datetime import datetime
-import itertools
+from functools import partial
+from xml.etree import ElementTree
 import numpy as np
 from pims.frame import Frame
 
@@ -40,7 +42,7 @@ def tifffile_available():
     return tifffile is not None
 
 
-from pims.base_frames import FramesSequence
+from pims.base_frames import FramesSequence, FramesSequenceND
 
 _dtype_map = {4: np.uint8,
               8: np.uint8,
@@ -53,6 +55,231 @@ def _tiff_datetime(dt_str):
                     minute=int(dt_str[14:16]), second=int(dt_str[17:19]))
 
 
+# TIFF field types (numpy type codes) that are parsed by _read_tiff_ifds
+_tiff_field_types = {1: 'u1', 2: 'u1', 3: 'u2', 4: 'u4', 6: 'i1', 7: 'u1',
+                     8: 'i2', 9: 'i4', 11: 'f4', 12: 'f8', 16: 'u8',
+                     17: 'i8', 18: 'u8'}
+
+# numeric tags that are needed to locate and interpret the pixel data
+_tiff_data_tags = {256,  # ImageWidth
+                   257,  # ImageLength
+                   258,  # BitsPerSample
+                   259,  # Compression
+                   262,  # PhotometricInterpretation
+                   266,  # FillOrder
+                   273,  # StripOffsets
+                   277,  # SamplesPerPixel
+                   279,  # StripByteCounts
+                   284,  # PlanarConfiguration
+                   322,  # TileWidth
+                   339}  # SampleFormat
+
+# ASCII tags that are returned as metadata
+_tiff_metadata_tags = [(270, 'ImageDescription'), (306, 'DateTime'),
+                       (305, 'Software'), (269, 'DocumentName')]
+
+
+def _read_tiff_ifds(fh):
+    """Walk the chain of image file directories (IFDs) of a TIFF file once.
+
+    Parameters
+    ----------
+    fh : file object, opened in binary mode
+
+    Returns
+    -------
+    byteorder : {'<', '>'}
+    pages : list of dict
+        For each page, the values of the tags in `_tiff_data_tags` as tuples.
+        The values of ASCII tags are not read: these are given as
+        (file offset, length) tuples, see `_read_tiff_string`.
+    """
+    fh.seek(0)
+    header = fh.read(16)
+    try:
+        byteorder = {b'II': '<', b'MM': '>'}[header[:2]]
+    except KeyError:
+        raise IOError("Not a TIFF file")
+    version = struct.unpack(byteorder + 'H', header[2:4])[0]
+    if version == 42:
+        offset_fmt, count_fmt, entry_size = 'I', 'H', 12
+        next_ifd = struct.unpack(byteorder + 'I', header[4:8])[0]
+    elif version == 43:  # BigTIFF
+        offset_fmt, count_fmt, entry_size = 'Q', 'Q', 20
+        next_ifd = struct.unpack(byteorder + 'Q', header[8:16])[0]
+    else:
+        raise IOError("Not a TIFF file")
+    offset_size = struct.calcsize(offset_fmt)
+    count_size = struct.calcsize(count_fmt)
+    entry_fmt = byteorder + 'HH' + offset_fmt
+
+    pages = []
+    visited = set()
+    while next_ifd != 0 and next_ifd not in visited:
+        visited.add(next_ifd)
+        fh.seek(next_ifd)
+        n_entries = struct.unpack(byteorder + count_fmt,
+                                  fh.read(count_size))[0]
+        data = fh.read(n_entries * entry_size + offset_size)
+        tags = dict()
+        for i in range(n_entries):
+            entry = data[i * entry_size:(i + 1) * entry_size]
+            tag, field_type, count = struct.unpack(entry_fmt,
+                                                   entry[:4 + offset_size])
+            if field_type not in _tiff_field_types:
+                continue
+            dtype = np.dtype(byteorder + _tiff_field_types[field_type])
+            n_bytes = count * dtype.itemsize
+            value = entry[4 + offset_size:]
+            if n_bytes > offset_size:
+                pos = struct.unpack(byteorder + offset_fmt, value)[0]
+            else:
+                pos = next_ifd + count_size + (i + 1) * entry_size - offset_size
+            if field_type == 2:
+                tags[tag] = (pos, count)
+            elif tag in _tiff_data_tags:
+                if n_bytes > offset_size:
+                    fh.seek(pos)
+                    value = fh.read(n_bytes)
+                tags[tag] = tuple(np.frombuffer(value[:n_bytes],
+                                                dtype=dtype).tolist())
+        pages.append(tags)
+        next_ifd = struct.unpack(byteorder + offset_fmt,
+                                 data[n_entries * entry_size:])[0]
+    return byteorder, pages
+
+
+def _read_tiff_string(buf, location):
+    """Read an ASCII tag value located by `_read_tiff_ifds` from a buffer
+    that contains the file."""
+    pos, count = location
+    value = bytes(buf[pos:pos + count]).split(b'\x00')[0]
+    return value.decode('utf-8', 'replace')
+
+
+def _tiff_page_dtype(page, byteorder):
+    """Return the dtype and shape of a TIFF page, or None if its pixel data
+    cannot be read directly from the file as contiguous uncompressed
+    strips."""
+    if (page.get(259, (1,))[0] != 1 or page.get(266, (1,))[0] != 1 or
+            322 in page or 273 not in page or 279 not in page):
+        return None
+    if page.get(262, (1,))[0] == 0:  # MinIsWhite: PIL inverts the values
+        return None
+    bits = set(page.get(258, (1,)))
+    samples = page.get(277, (1,))[0]
+    if len(bits) != 1 or (samples > 1 and page.get(284, (1,))[0] != 1):
+        return None
+    bits = bits.pop()
+    kind = {1: 'u', 2: 'i', 3: 'f'}.get(page.get(339, (1,))[0])
+    if bits not in (8, 16, 32, 64) or kind is None:
+        return None
+    dtype = np.dtype(byteorder + kind + str(bits // 8))
+    if samples == 1:
+        shape = (page[257][0], page[256][0])
+    else:
+        shape = (page[257][0], page[256][0], samples)
+    return dtype, shape
+
+
+def _tifffile_page_offset(page):
+    """Return the file offset of the pixel data of a tifffile page, or None
+    if it is not stored uncompressed and contiguously."""
+    contiguous = getattr(page, 'is_contiguous', None)
+    if not contiguous:
+        return None
+    if isinstance(contiguous, tuple):  # older tifffile versions
+        return contiguous[0]
+    keyframe = getattr(page, 'keyframe', page)  # tifffile.TiffFrame
+    if keyframe.bitspersample != np.dtype(page.dtype).itemsize * 8:
+        return None
+    return page.dataoffsets[0]
+
+
+def _tifffile_memmap(filename, byteorder, record, pages, page_shape,
+                     dtype):
+    """Memory-map the pixel data of a tifffile series when all pages are
+    stored uncompressed and contiguously.
+
+    Returns
+    -------
+    buf : np.memmap of the whole file, or None
+    stack : (N,) + page_shape array if the pages are evenly spaced, or None
+    offsets : array of file offsets per page if they are not, or None
+    """
+    dtype = np.dtype(dtype).newbyteorder(byteorder)
+    n_bytes = int(np.prod(page_shape)) * dtype.itemsize
+    offset = getattr(record, 'dataoffset', getattr(record, 'offset', None))
+    if offset is not None:
+        n_pages = int(np.prod(record.shape)) * dtype.itemsize // n_bytes
+        offsets = offset + n_bytes * np.arange(n_pages)
+    else:
+        offsets = []
+        for page in pages:
+            offset = _tifffile_page_offset(page)
+            if offset is None or page.shape != tuple(page_shape):
+                return None, None, None
+            offsets.append(offset)
+        offsets = np.array(offsets, dtype=np.int64)
+    # read-only: readers return copies, so that edits of frames stay local
+    buf = np.memmap(filename, dtype=np.uint8, mode='r')
+    if len(offsets) > 1:
+        strides = np.diff(offsets)
+    else:
+        strides = np.array([n_bytes])
+    if np.all(strides == strides[0]) and strides[0] >= n_bytes:
+        page_strides = np.empty(page_shape, dtype=dtype).strides
+        stack = np.ndarray((len(offsets),) + tuple(page_shape), dtype=dtype,
+                           buffer=buf, offset=int(offsets[0]),
+                           strides=(int(strides[0]),) + page_strides)
+        return buf, stack, None
+    return buf, None, offsets
+
+
+def _mapped_page(buf, offset, shape, dtype):
+    """Return a view of a page in a memory-mapped file."""
+    n_bytes = int(np.prod(shape)) * dtype.itemsize
+    return buf[offset:offset + n_bytes].view(dtype).reshape(shape)
+
+
+# pims axis names of the axes in tifffile series
+_tifffile_axes = {'T': 't', 'Z': 'z', 'C': 'c', 'S': 'c', 'Y': 'y', 'X': 'x',
+                  'I': 't', 'Q': 't'}
+
+
+def _tifffile_axis_names(axes):
+    """Convert the axes string of a tifffile series to a list of axis names.
+    Axes that have no pims equivalent keep their (lowercase) tifffile name."""
+    names = []
+    for ax in axes:
+        name = _tifffile_axes.get(ax, ax.lower())
+        if name in names:
+            name = ax.lower()
+        if name in names:
+            raise ValueError("Cannot interpret TIFF axes '{}'".format(axes))
+        names.append(name)
+    return names
+
+
+# names of metadata tags in recent and in older tifffile versions
+_tifffile_metadata_tags = [('ImageDescription', 'image_description'),
+                           ('DateTime', 'datetime'),
+                           ('Software', 'software'),
+                           ('DocumentName', 'document_name')]
+
+
+def _tiff_page_offset(page, n_bytes):
+    """Return the file offset of the pixel data of a TIFF page, or None if
+    its strips are not stored contiguously."""
+    offsets = np.asarray(page[273], dtype=np.int64)
+    counts = np.asarray(page[279], dtype=np.int64)
+    if np.any(offsets[1:] != offsets[:-1] + counts[:-1]):
+        return None
+    if counts.sum() < n_bytes:
+        return None
+    return int(offsets[0])
+
+
 class TiffStack_tifffile(FramesSequence):
     """Read TIFF stacks (single files containing many images) into an
     iterable object that returns images as numpy arrays.
@@ -105,7 +332,8 @@ class TiffStack_tifffile(FramesSequence):
 
     def __init__(self, filename):
         self._filename = filename
-        record = tifffile.TiffFile(filename).series[0]
+        self._tiff_file = tifffile.TiffFile(filename)
+        record = self._tiff_file.series[0]
         if hasattr(record, 'pages'):
             self._tiff = record.pages
         else:
@@ -114,34 +342,61 @@ class TiffStack_tifffile(FramesSequence):
         tmp = self._tiff[0]
         self._dtype = tmp.dtype
         self._im_sz = tmp.shape
+        self._metadata = dict()
+        self._buf, self._stack, self._offsets = _tifffile_memmap(
+            filename, self._tiff_file.byteorder, record, self._tiff,
+            self._im_sz, self._dtype)
+        self._stack_dtype = np.dtype(self._dtype).newbyteorder(
+                                                self._tiff_file.byteorder)
 
     def get_frame(self, j):
-        t = self._tiff[j]
-        data = t.asarray()
-        return Frame(data, frame_no=j, metadata=self._read_metadata(t))
-
-    def _read_metadata(self, tiff):
-        """Read metadata for current frame and return as dict"""
-        md = {}
-        try:
-            md["ImageDescription"] = (
-                tiff.tags["image_description"].value.decode())
-        except:
-            pass
-        try:
-            dt = tiff.tags["datetime"].value.decode()
-            md["DateTime"] = _tiff_datetime(dt)
-        except:
-            pass
-        try:
-            md["Software"] = tiff.tags["software"].value.decode()
-        except:
-            pass
+        if self._stack is not None:
+            data = self._stack[j]
+        elif self._offsets is not None:
+            data = _mapped_page(self._buf, self._offsets[j], self._im_sz,
+                                self._stack_dtype)
+        else:
+            data = self._tiff[j].asarray()
+        if self._buf is not None or not data.dtype.isnative:
+            # copy memory-mapped data, so that editing the frame does not
+            # change later reads
+            data = data.astype(self._dtype)
+        return Frame(data, frame_no=j, metadata=self._read_metadata(j))
+
+    def _read_metadata(self, j):
+        """Read metadata for frame j and return as dict. The result is
+        cached."""
         try:
-            md["DocumentName"] = tiff.tags["document_name"].value.decode()
-        except:
+            return self._metadata[j].copy()
+        except KeyError:
             pass
-        return md
+        page = self._tiff[j]
+        if not hasattr(page, 'tags'):  # tifffile.TiffFrame
+            page = page.aspage()
+        tags = page.tags
+        md = {}
+        for key, old_key in _tifffile_metadata_tags:
+            if key in tags:
+                value = tags[key].value
+            elif old_key in tags:
+                value = tags[old_key].value
+            else:
+                continue
+            try:
+                if isinstance(value, bytes):
+                    value = value.decode()
+                if key == "DateTime":
+                    value = _tiff_datetime(value)
+            except (UnicodeDecodeError, ValueError):
+                continue
+            md[key] = value
+        self._metadata[j] = md
+        return md.copy()
+
+    def close(self):
+        self._stack = None
+        self._buf = None
+        self._tiff_file.close()
 
     @property
     def pixel_type(self):
@@ -166,6 +421,146 @@ Pixel Datatype: {dtype}""".format(frame_shape=self.frame_shape,
                                   dtype=self.pixel_type)
 
 
+class TiffStackND(FramesSequenceND):
+    """Read multidimensional TIFF files, such as ImageJ hyperstacks and
+    OME-TIFF files, into a dimension-aware reader.
+
+    The axes of the file are taken from the ImageJ or OME-XML metadata, as
+    interpreted by tifffile. They are named 't', 'z', 'c', 'y', and 'x'.
+
+    Pages that are stored uncompressed and contiguously are read from a
+    memory map of the file. Besides planes ('yx'), the reader reads 'zyx'
+    and 'czyx' volumes at once, so that bundling these axes does not require
+    reading all planes separately.
+
+    Parameters
+    ----------
+    filename : string
+    series : int, optional
+        Index of the image series in the file. Default 0.
+
+    Attributes
+    ----------
+    metadata : dict
+        ImageJ metadata and/or OME-XML (under the key 'OME-XML')
+
+    Examples
+    --------
+    >>> frames = TiffStackND('hyperstack.tif')
+    >>> frames.bundle_axes = 'zyx'
+    >>> frames.iter_axes = 't'
+    >>> frames[0]  # the first volume, read at once
+
+    See Also
+    --------
+    TiffStack_tifffile
+    """
+    @classmethod
+    def class_exts(cls):
+        return {'tif', 'tiff'} | super(TiffStackND, cls).class_exts()
+
+    # lower than the TiffStack readers, so that pims.open does not change
+    class_priority = 5
+
+    def __init__(self, filename, series=0):
+        super(TiffStackND, self).__init__()
+        self._filename = filename
+        self._series = series
+        self._tiff_file = tifffile.TiffFile(filename)
+        record = self._tiff_file.series[series]
+        self._dtype = record.dtype
+        self._axes = _tifffile_axis_names(record.axes)
+        shape = tuple(record.shape)
+        if 'y' not in self._axes or 'x' not in self._axes:
+            raise IOError("The TIFF series does not have Y and X axes")
+
+        pages = record.pages
+        page_ndim = len(pages[0].shape)
+        self._page_shape = shape[-page_ndim:]
+        # page table: the index in the series of the page at each coordinate
+        self._page_table = np.arange(int(np.prod(shape[:-page_ndim])),
+                                     dtype=np.intp)
+        self._page_table = self._page_table.reshape(shape[:-page_ndim])
+
+        buf, stack, offsets = _tifffile_memmap(
+            filename, self._tiff_file.byteorder, record, pages,
+            self._page_shape, self._dtype)
+        if stack is not None:
+            self._data = stack.reshape(shape)
+        else:
+            self._data = None
+        self._buf = buf
+        self._offsets = offsets
+        self._map_dtype = np.dtype(self._dtype).newbyteorder(
+                                                self._tiff_file.byteorder)
+
+        for name, size in zip(self._axes, shape):
+            self._init_axis(name, size)
+
+        page_axes = self._axes[-page_ndim:]
+        self._register_get_frame(partial(self._read, page_axes), page_axes)
+        for bulk_axes in (['z'], ['c', 'z']):
+            if all(ax in self._axes[:-page_ndim] for ax in bulk_axes):
+                axes = bulk_axes + page_axes
+                self._register_get_frame(partial(self._read, axes), axes)
+
+        self.metadata = dict(getattr(self._tiff_file, 'imagej_metadata',
+                                     None) or {})
+        ome = getattr(self._tiff_file, 'ome_metadata', None)
+        if ome:
+            self.metadata['OME-XML'] = ome
+
+        self.bundle_axes = page_axes
+        if 't' in self._axes:
+            self.iter_axes = 't'
+
+    def _read(self, axes, **ind):
+        """Read the data along `axes` at coordinates `ind`, in the order
+        of `axes`."""
+        page_ndim = len(self._page_shape)
+        if self._data is not None:
+            key = tuple([slice(None) if ax in axes else ind[ax]
+                         for ax in self._axes])
+            result = self._data[key]
+        else:
+            key = tuple([slice(None) if ax in axes else ind[ax]
+                         for ax in self._axes[:-page_ndim]])
+            pages = self._page_table[key]
+            if self._offsets is not None:
+                planes = [_mapped_page(self._buf, self._offsets[i],
+                                       self._page_shape, self._map_dtype)
+                          for i in pages.ravel()]
+                result = np.array(planes)
+            else:
+                result = self._tiff_file.asarray(key=pages.ravel().tolist(),
+                                                 series=self._series)
+            result = result.reshape(pages.shape + self._page_shape)
+
+        result_axes = [ax for ax in self._axes if ax in axes]
+        result = result.transpose([result_axes.index(ax) for ax in axes])
+        if self._data is not None or not result.dtype.isnative:
+            # copy memory-mapped data, so that editing the frame does not
+            # change later reads
+            result = result.astype(self._dtype)
+        return result
+
+    @property
+    def pixel_type(self):
+        return self._dtype
+
+    def close(self):
+        self._data = None
+        self._buf = None
+        self._tiff_file.close()
+
+    def __repr__(self):
+        s = "<TiffStackND>\nSource: {0}\n".format(self._filename)
+        for ax in self._axes:
+            s += "Axis '{0}' size: {1}\n".format(ax, self.sizes[ax])
+        s += "Pixel Datatype: {0}".format(self.pixel_type)
+        return s
+
+
 class TiffStack_libtiff(FramesSequence):
     """Read TIFF stacks (single files containing many images) into an
     iterable object that returns images as numpy arrays.
@@ -339,57 +734,58 @@ class TiffStack_pil(FramesSequence):
             self._im_sz = (w, h, samples_per_px)
         else:
             self._im_sz = (w, h)
-        # walk through stack to get length, there has to
-        # be a better way to do this
-        for j in itertools.count():
-            try:
-                self.im.seek(j)
-            except EOFError:
-                break
 
-        self._count = j
+        # parse the IFD chain once to get the length and the location of
+        # the pixel data and the tags of each page
+        with open(fname, 'rb') as fh:
+            self._byteorder, self._pages = _read_tiff_ifds(fh)
+        self._count = len(self._pages)
+        self._mmap = np.memmap(fname, dtype=np.uint8, mode='r')
         self.cur = self.im.tell()
 
     def get_frame(self, j):
         '''Extracts the jth frame from the image sequence.
         if the frame does not exist return None'''
-        # PIL does not support random access. If we need to rewind, re-open
-        # the file.
-        if j < self.cur:
-            self.im = Image.open(self._filename)
-            self.im.seek(j)
-        elif j > self.cur:
-            self.im.seek(j)
-        elif j > len(self):
+        if j >= len(self):
             raise IndexError("out of bounds; length is {0}".format(len(self)))
-        # If j == self.cur, do nothing.
-        self.cur = self.im.tell()
-        res = np.reshape(self.im.getdata(), self._im_sz)
-        return Frame(res, frame_no=j, metadata=self._read_metadata())
-
-    def _read_metadata(self):
-        """Read metadata for current frame and return as dict"""
-        try:
-            tags = self.im.tag_v2  # for Pillow >= v3.0.0
-        except AttributeError:
-            tags = self.im.tag  # for Pillow < v3.0.0
+        res = self._read_direct(j)
+        if res is None:
+            # compressed or fragmented: decode using PIL
+            self.im.seek(j)
+            self.cur = self.im.tell()
+            res = np.asarray(self.im).reshape(self._im_sz)
+        return Frame(res, frame_no=j, metadata=self._read_metadata(j))
+
+    def _read_direct(self, j):
+        """Read uncompressed, contiguously stored pixel data from the
+        memory-mapped file. Returns None if that is not possible."""
+        page = self._pages[j]
+        dtype_shape = _tiff_page_dtype(page, self._byteorder)
+        if dtype_shape is None or dtype_shape[1] != self._im_sz:
+            return None
+        dtype, shape = dtype_shape
+        n_bytes = int(np.prod(shape)) * dtype.itemsize
+        offset = _tiff_page_offset(page, n_bytes)
+        if offset is None:
+            return None
+        res = self._mmap[offset:offset + n_bytes].view(dtype).reshape(shape)
+        # a copy, so that editing the frame does not change later reads
+        return res.astype(dtype.newbyteorder('='))
+
+    def _read_metadata(self, j):
+        """Read metadata for frame j and return as dict"""
+        page = self._pages[j]
         md = {}
-        try:
-            md["ImageDescription"] = tags[270]
-        except KeyError:
-            pass
-        try:
-            md["DateTime"] = _tiff_datetime(tags[306])
-        except KeyError:
-            pass
-        try:
-            md["Software"] = tags[305]
-        except KeyError:
-            pass
-        try:
-            md["DocumentName"] = tags[269]
-        except KeyError:
-            pass
+        for tag, key in _tiff_metadata_tags:
+            if tag not in page:
+                continue
+            value = _read_tiff_string(self._mmap, page[tag])
+            if key == "DateTime":
+                try:
+                    value = _tiff_datetime(value)
+                except ValueError:
+                    continue
+            md[key] = value
         return md
 
     @property
@@ -404,7 +800,8 @@ class TiffStack_pil(FramesSequence):
         return self._count
 
     def close(self):
-        self._tiff.close()
+        self.im.close()
+        self._mmap = None
 
     def __repr__(self):
         # May be overwritten by subclasses
@@ -424,17 +821,40 @@ class MM_TiffStack(TiffStack_pil):
     Specialized class for dealing with meta-morph tiffs.
 
     A function `get_meta` is added which extracts and parses
-    the xml meta-data field.
+    the xml meta-data field. The meta-data of all pages is parsed once, on
+    first access, and stored per field; `get_meta_column` returns one field
+    for all pages.
     """
+    def __init__(self, fname):
+        super(MM_TiffStack, self).__init__(fname)
+        self._meta_columns = None
+
+    def _parse_meta(self):
+        """Parse the xml meta-data of all pages into one list per field."""
+        columns = dict()
+        for j, page in enumerate(self._pages):
+            if 270 not in page:
+                continue
+            xml_str = _read_tiff_string(self._mmap, page[270])
+            for name, value in six.iteritems(_parse_mm_xml_string(xml_str)):
+                if name not in columns:
+                    columns[name] = [None] * len(self)
+                columns[name][j] = value
+        self._meta_columns = columns
+
     def get_meta(self, j):
-        cur = self.im.tell()
-        if cur != j:
-            self.im.seek(j)
-            xml_str = im_wrap.im.tag[270]
-            self.im.seek(cur)
-        else:
-            xml_str = im_wrap.im.tag[270]
-        return _parse_mm_xml_string(xml_str)
+        if self._meta_columns is None:
+            self._parse_meta()
+        return {name: column[j] for name, column
+                in six.iteritems(self._meta_columns)
+                if column[j] is not None}
+
+    def get_meta_column(self, name):
+        """Returns the value of meta-data field `name` for all pages as an
+        array. Pages that lack the field have value None."""
+        if self._meta_columns is None:
+            self._parse_meta()
+        return np.array(self._meta_columns[name])
 
 
 class TiffSeries(FramesSequence):
@@ -533,27 +953,28 @@ def _parse_mm_xml_string(xml_str):
     def _write(md_dict, name, val):
         if (name == "acquisition-time-local"
              or name == "modification-time-local"):
+            if isinstance(val, bytes):
+                val = val.decode('ascii')
             tmp = int(val[18:])
             val = val[:18] + "%(#)03d" % {"#": tmp}
-            val = datetime.datetime.strptime(val,
-                                             '%Y%m%d %H:%M:%S.%f')
+            val = datetime.strptime(val, '%Y%m%d %H:%M:%S.%f')
         md_dict[name] = val
 
     def _parse_attr(file_obj, dom_obj):
-        if dom_obj.getAttribute("id") == "Description":
+        if dom_obj.get("id") == "Description":
             _parse_des(file_obj, dom_obj)
-        elif dom_obj.getAttribute("type") == "int":
-            _write(file_obj, dom_obj.getAttribute("id"),
-                   int(dom_obj.getAttribute("value")))
-        elif dom_obj.getAttribute("type") == "float":
-            _write(file_obj, dom_obj.getAttribute("id"),
-                   float(dom_obj.getAttribute("value")))
+        elif dom_obj.get("type") == "int":
+            _write(file_obj, dom_obj.get("id"),
+                   int(dom_obj.get("value")))
+        elif dom_obj.get("type") == "float":
+            _write(file_obj, dom_obj.get("id"),
+                   float(dom_obj.get("value")))
         else:
-            _write(file_obj, dom_obj.getAttribute("id"),
-                   dom_obj.getAttribute("value").encode('ascii'))
+            _write(file_obj, dom_obj.get("id"),
+                   dom_obj.get("value", "").encode('ascii'))
 
     def _parse_des(file_obj, des_obj):
-        des_string = des_obj.getAttribute("value")
+        des_string = des_obj.get("value", "")
         des_split = des_string.split("&#13;&#10;")
 
         for x in des_split:
@@ -562,11 +983,12 @@ def _parse_mm_xml_string(xml_str):
                 _write(file_obj, tmp_split[0],
                        tmp_split[1].encode('ascii'))
 
-    dom = xml.dom.minidom.parseString(xml_str)
+    if isinstance(xml_str, six.text_type):
+        xml_str = xml_str.encode('utf-8')
+    root = ElementTree.fromstring(xml_str)
 
-    props = dom.getElementsByTagName("prop")
     f = dict()
-    for p in props:
+    for p in root.iter("prop"):
         _parse_attr(f, p)
 
     return f
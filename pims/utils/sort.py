@@ -8,6 +8,9 @@ import re
 __all__ = ["natural_keys"]
 
 
+_digits = re.compile(r'(\d+)')
+
+
 def _atoi(text):
     return int(text) if text.isdigit() else text
 
@@ -23,4 +26,4 @@ def natural_keys(text):
     >>> print(alist)
     ['something1', 'something2', 'something12', 'something17']
     """
-    return [_atoi(c) for c in re.split('(\d+)', text)]
+    return [_atoi(c) for c in _digits.split(text)]